@@ -30,6 +30,20 @@ CREATE TABLE IF NOT EXISTS 'appointments' (
     'master_id' INTEGER NOT NULL,
     'status' TEXT DEFAULT 'ожидает',
     'comment' TEXT,
+    -- Телефон без разделителей '+', '(', ')', '-', ' ', '.' и в формате 7XXXXXXXXXX для российских номеров
+    -- (8XXXXXXXXXX и XXXXXXXXXX приводятся к нему). Вычисляемые колонки не хранятся в таблице,
+    -- значение сохраняется только в индексе idx_appointments_phone_normalized.
+    -- Выражения совпадают с PHONE_DIGITS_SQL и PHONE_NORMALIZED_SQL в bbshop.py
+    'phone_digits' TEXT GENERATED ALWAYS AS (
+        REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(phone, '+', ''), '(', ''), ')', ''), '-', ''), ' ', ''), '.', '')
+    ) VIRTUAL,
+    'phone_normalized' TEXT GENERATED ALWAYS AS (
+        CASE
+            WHEN length(phone_digits) = 11 AND substr(phone_digits, 1, 1) = '8' THEN '7' || substr(phone_digits, 2)
+            WHEN length(phone_digits) = 10 THEN '7' || phone_digits
+            ELSE phone_digits
+        END
+    ) VIRTUAL,
     FOREIGN KEY ('master_id') REFERENCES 'masters'('id') ON DELETE CASCADE ON UPDATE CASCADE
 );
 
@@ -51,6 +65,53 @@ CREATE TABLE IF NOT EXISTS 'appointments_services' (
     FOREIGN KEY ('service_id') REFERENCES 'services'('id') ON DELETE CASCADE ON UPDATE CASCADE
 );
 
+-- Версия справочников мастеров и услуг
+-- Триггеры увеличивают version при любом изменении masters, services и masters_services.
+-- bbshop.NameCache держит имена и id мастеров и услуг в памяти и перечитывает их,
+-- только если версия изменилась; token отличает одну базу от другой
+CREATE TABLE IF NOT EXISTS 'catalog_version' (
+    'id' INTEGER NOT NULL PRIMARY KEY CHECK (id = 1),
+    'token' TEXT NOT NULL,
+    'version' INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO 'catalog_version' ('id', 'token', 'version') VALUES (1, lower(hex(randomblob(16))), 0);
+
+CREATE TRIGGER IF NOT EXISTS masters_catalog_insert AFTER INSERT ON masters BEGIN
+    UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS masters_catalog_update AFTER UPDATE ON masters BEGIN
+    UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS masters_catalog_delete AFTER DELETE ON masters BEGIN
+    UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS services_catalog_insert AFTER INSERT ON services BEGIN
+    UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS services_catalog_update AFTER UPDATE ON services BEGIN
+    UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS services_catalog_delete AFTER DELETE ON services BEGIN
+    UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS masters_services_catalog_insert AFTER INSERT ON masters_services BEGIN
+    UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS masters_services_catalog_update AFTER UPDATE ON masters_services BEGIN
+    UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS masters_services_catalog_delete AFTER DELETE ON masters_services BEGIN
+    UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+END;
+
 -- Добавление мастеров
 INSERT INTO 'masters' ('first_name', 'middle_name', 'last_name', 'phone')
 VALUES 
@@ -117,8 +178,204 @@ CREATE INDEX idx_masters_name ON masters(last_name, first_name);
 -- Критически важно для планирования расписания и проверки доступности мастеров
 CREATE INDEX idx_appointments_date_master ON appointments(date, master_id);
 
+-- Индекс для поиска записей по телефону в любом формате записи
+-- Поиск по нормализованному номеру - один поиск по индексу вместо перебора таблицы
+CREATE INDEX idx_appointments_phone_normalized ON appointments(phone_normalized);
+
 COMMIT;
 
 -- Включение проверки внешних ключей
 PRAGMA foreign_keys = ON;
 
+
+
+-- Денормализованное представление записей
+-- appointment_view хранит для каждой записи имя мастера, список услуг и их общую стоимость,
+-- поэтому поиск записей читает одну таблицу по индексу вместо соединения четырёх таблиц
+-- с GROUP_CONCAT. Записи без услуг в ней тоже есть (services = NULL, total_price = 0).
+-- Услуги перечислены в порядке добавления, после пересборки строки - в порядке id услуги.
+-- Строки поддерживают триггеры; раздел можно выполнить и для существующей базы
+-- (bbshop.create_appointment_view), таблица при этом заполняется заново
+CREATE TABLE IF NOT EXISTS appointment_view (
+    id INTEGER NOT NULL PRIMARY KEY,
+    client_name TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    phone_normalized TEXT,
+    date DATETIME,
+    master_id INTEGER,
+    master_name TEXT,
+    services TEXT,
+    total_price INTEGER NOT NULL DEFAULT 0,
+    status TEXT,
+    comment TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_appointment_view_phone_normalized ON appointment_view(phone_normalized);
+CREATE INDEX IF NOT EXISTS idx_appointment_view_master ON appointment_view(master_id);
+
+-- Строка записи пересобирается при изменении самой записи, удалении и изменении её услуг
+CREATE TRIGGER IF NOT EXISTS appointment_view_insert AFTER INSERT ON appointments BEGIN
+    DELETE FROM appointment_view WHERE id = new.id;
+    INSERT INTO appointment_view (id, client_name, phone, phone_normalized, date, master_id, master_name, services, total_price, status, comment)
+    SELECT
+        a.id, a.name, a.phone, a.phone_normalized, a.date, a.master_id,
+        m.first_name || ' ' || m.last_name,
+        GROUP_CONCAT(s.title, ', '),
+        COALESCE(SUM(s.price), 0),
+        a.status, a.comment
+    FROM appointments a
+    LEFT JOIN masters m ON m.id = a.master_id
+    LEFT JOIN appointments_services aps ON aps.appointment_id = a.id
+    LEFT JOIN services s ON s.id = aps.service_id
+    WHERE a.id = new.id
+    GROUP BY a.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS appointment_view_update AFTER UPDATE ON appointments BEGIN
+    DELETE FROM appointment_view WHERE id = old.id;
+    DELETE FROM appointment_view WHERE id = new.id;
+    INSERT INTO appointment_view (id, client_name, phone, phone_normalized, date, master_id, master_name, services, total_price, status, comment)
+    SELECT
+        a.id, a.name, a.phone, a.phone_normalized, a.date, a.master_id,
+        m.first_name || ' ' || m.last_name,
+        GROUP_CONCAT(s.title, ', '),
+        COALESCE(SUM(s.price), 0),
+        a.status, a.comment
+    FROM appointments a
+    LEFT JOIN masters m ON m.id = a.master_id
+    LEFT JOIN appointments_services aps ON aps.appointment_id = a.id
+    LEFT JOIN services s ON s.id = aps.service_id
+    WHERE a.id = new.id
+    GROUP BY a.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS appointment_view_delete AFTER DELETE ON appointments BEGIN
+    DELETE FROM appointment_view WHERE id = old.id;
+END;
+
+-- Добавленная услуга дописывается к строке записи без пересборки
+CREATE TRIGGER IF NOT EXISTS appointment_view_service_insert AFTER INSERT ON appointments_services BEGIN
+    UPDATE appointment_view SET
+        services = COALESCE(services || ', ', '') || (SELECT title FROM services WHERE id = new.service_id),
+        total_price = total_price + COALESCE((SELECT price FROM services WHERE id = new.service_id), 0)
+    WHERE id = new.appointment_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS appointment_view_service_delete AFTER DELETE ON appointments_services BEGIN
+    DELETE FROM appointment_view WHERE id = old.appointment_id;
+    INSERT INTO appointment_view (id, client_name, phone, phone_normalized, date, master_id, master_name, services, total_price, status, comment)
+    SELECT
+        a.id, a.name, a.phone, a.phone_normalized, a.date, a.master_id,
+        m.first_name || ' ' || m.last_name,
+        GROUP_CONCAT(s.title, ', '),
+        COALESCE(SUM(s.price), 0),
+        a.status, a.comment
+    FROM appointments a
+    LEFT JOIN masters m ON m.id = a.master_id
+    LEFT JOIN appointments_services aps ON aps.appointment_id = a.id
+    LEFT JOIN services s ON s.id = aps.service_id
+    WHERE a.id = old.appointment_id
+    GROUP BY a.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS appointment_view_service_update AFTER UPDATE ON appointments_services BEGIN
+    DELETE FROM appointment_view WHERE id = old.appointment_id;
+    INSERT INTO appointment_view (id, client_name, phone, phone_normalized, date, master_id, master_name, services, total_price, status, comment)
+    SELECT
+        a.id, a.name, a.phone, a.phone_normalized, a.date, a.master_id,
+        m.first_name || ' ' || m.last_name,
+        GROUP_CONCAT(s.title, ', '),
+        COALESCE(SUM(s.price), 0),
+        a.status, a.comment
+    FROM appointments a
+    LEFT JOIN masters m ON m.id = a.master_id
+    LEFT JOIN appointments_services aps ON aps.appointment_id = a.id
+    LEFT JOIN services s ON s.id = aps.service_id
+    WHERE a.id = old.appointment_id
+    GROUP BY a.id;
+    DELETE FROM appointment_view WHERE id = new.appointment_id;
+    INSERT INTO appointment_view (id, client_name, phone, phone_normalized, date, master_id, master_name, services, total_price, status, comment)
+    SELECT
+        a.id, a.name, a.phone, a.phone_normalized, a.date, a.master_id,
+        m.first_name || ' ' || m.last_name,
+        GROUP_CONCAT(s.title, ', '),
+        COALESCE(SUM(s.price), 0),
+        a.status, a.comment
+    FROM appointments a
+    LEFT JOIN masters m ON m.id = a.master_id
+    LEFT JOIN appointments_services aps ON aps.appointment_id = a.id
+    LEFT JOIN services s ON s.id = aps.service_id
+    WHERE a.id = new.appointment_id
+    GROUP BY a.id;
+END;
+
+-- Переименование мастера и изменение названия или цены услуги меняют строки их записей
+CREATE TRIGGER IF NOT EXISTS appointment_view_master_update AFTER UPDATE OF first_name, last_name ON masters BEGIN
+    UPDATE appointment_view SET master_name = new.first_name || ' ' || new.last_name WHERE master_id = new.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS appointment_view_service_change AFTER UPDATE OF title, price ON services BEGIN
+    DELETE FROM appointment_view WHERE id IN (SELECT appointment_id FROM appointments_services WHERE service_id = new.id);
+    INSERT INTO appointment_view (id, client_name, phone, phone_normalized, date, master_id, master_name, services, total_price, status, comment)
+    SELECT
+        a.id, a.name, a.phone, a.phone_normalized, a.date, a.master_id,
+        m.first_name || ' ' || m.last_name,
+        GROUP_CONCAT(s.title, ', '),
+        COALESCE(SUM(s.price), 0),
+        a.status, a.comment
+    FROM appointments a
+    LEFT JOIN masters m ON m.id = a.master_id
+    LEFT JOIN appointments_services aps ON aps.appointment_id = a.id
+    LEFT JOIN services s ON s.id = aps.service_id
+    WHERE a.id IN (SELECT appointment_id FROM appointments_services WHERE service_id = new.id)
+    GROUP BY a.id;
+END;
+
+-- Заполнение таблицы записями, добавленными до её создания
+BEGIN TRANSACTION;
+DELETE FROM appointment_view;
+INSERT INTO appointment_view (id, client_name, phone, phone_normalized, date, master_id, master_name, services, total_price, status, comment)
+SELECT
+    a.id, a.name, a.phone, a.phone_normalized, a.date, a.master_id,
+    m.first_name || ' ' || m.last_name,
+    GROUP_CONCAT(s.title, ', '),
+    COALESCE(SUM(s.price), 0),
+    a.status, a.comment
+FROM appointments a
+LEFT JOIN masters m ON m.id = a.master_id
+LEFT JOIN appointments_services aps ON aps.appointment_id = a.id
+LEFT JOIN services s ON s.id = aps.service_id
+GROUP BY a.id;
+COMMIT;
+
+
+
+-- Полнотекстовый поиск по записям (FTS5)
+-- Индекс по имени клиента и комментарию хранит только слова, а сами тексты берёт из appointments
+-- (external content), поэтому данные не дублируются. Поиск по слову или его началу
+-- выполняется по индексу, а не перебором всей таблицы, как LIKE '%...%'.
+-- Если SQLite собран без FTS5, bbshop.create_schema пропускает этот раздел, а поиск работает через LIKE
+CREATE VIRTUAL TABLE IF NOT EXISTS appointments_fts USING fts5(
+    name,
+    comment,
+    content='appointments',
+    content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+
+-- Триггеры поддерживают индекс при изменении записей
+CREATE TRIGGER IF NOT EXISTS appointments_fts_insert AFTER INSERT ON appointments BEGIN
+    INSERT INTO appointments_fts (rowid, name, comment) VALUES (new.id, new.name, new.comment);
+END;
+
+CREATE TRIGGER IF NOT EXISTS appointments_fts_delete AFTER DELETE ON appointments BEGIN
+    INSERT INTO appointments_fts (appointments_fts, rowid, name, comment) VALUES ('delete', old.id, old.name, old.comment);
+END;
+
+CREATE TRIGGER IF NOT EXISTS appointments_fts_update AFTER UPDATE OF name, comment ON appointments BEGIN
+    INSERT INTO appointments_fts (appointments_fts, rowid, name, comment) VALUES ('delete', old.id, old.name, old.comment);
+    INSERT INTO appointments_fts (rowid, name, comment) VALUES (new.id, new.name, new.comment);
+END;
+
+-- Заполнение индекса записями, добавленными до его создания
+INSERT INTO appointments_fts (appointments_fts) VALUES ('rebuild');
@@ -1,10 +1,103 @@
-
+import re
 import sqlite3
+import string
 from typing import List, Tuple, Optional
 
 DB_PATH = 'hw16/bbshop.db'
 SQL_SCHEMA_PATH = 'hw16/barbershop.sql'
 
+# Начало раздела barbershop.sql с таблицей appointment_view и её триггерами
+VIEW_SECTION_MARKER = '-- Денормализованное представление записей'
+# Начало раздела barbershop.sql, которому нужен модуль FTS5
+FTS_SECTION_MARKER = '-- Полнотекстовый поиск'
+
+# Нормализация телефона: те же правила, что у вычисляемых колонок phone_digits и phone_normalized
+PHONE_SEPARATORS = '+()- .'
+PHONE_DIGITS_SQL = (
+    "REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(phone, '+', ''), '(', ''), ')', ''), '-', ''), ' ', ''), '.', '')"
+)
+PHONE_NORMALIZED_SQL = """CASE
+    WHEN length(phone_digits) = 11 AND substr(phone_digits, 1, 1) = '8' THEN '7' || substr(phone_digits, 2)
+    WHEN length(phone_digits) = 10 THEN '7' || phone_digits
+    ELSE phone_digits
+END"""
+
+# Таблицы справочников: любое их изменение увеличивает catalog_version.version (триггеры в barbershop.sql)
+CATALOG_TABLES = ('masters', 'services', 'masters_services')
+
+# LIKE в SQLite не различает регистр только латинских букв
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+class Catalog:
+    """
+    Справочники одной версии в памяти: id мастеров по имени и фамилии, id услуг по названию
+    и множество id услуг каждого мастера.
+    """
+    def __init__(self, version: Optional[int], masters: List[Tuple], services: List[Tuple], master_services: List[Tuple]):
+        self.version = version
+        self.master_names = [(master_id, f'{first_name} {last_name}') for master_id, first_name, last_name in masters]
+        self.masters = {}
+        for master_id, first_name, last_name in masters:
+            self.masters.setdefault((first_name, last_name), master_id)
+        self.services = dict(services)
+        self.master_services = {}
+        for master_id, service_id in master_services:
+            self.master_services.setdefault(master_id, set()).add(service_id)
+
+    def find_master(self, master_name: str) -> Optional[int]:
+        """
+        Ищет мастера так же, как запросы create_appointment до кеша: по точному совпадению имени
+        и фамилии, если передано два слова, иначе по вхождению строки в «Имя Фамилия»
+        (как LIKE '%...%'). Возвращает id мастера или None.
+        """
+        master_name_parts = master_name.split()
+        if len(master_name_parts) == 2:
+            return self.masters.get(tuple(master_name_parts))
+        pattern = master_name.translate(ASCII_LOWER)
+        for master_id, full_name in self.master_names:
+            if pattern in full_name.translate(ASCII_LOWER):
+                return master_id
+        return None
+
+def load_catalog(cursor, version: Optional[int]) -> Catalog:
+    """
+    Читает справочники мастеров и услуг из базы.
+    """
+    return Catalog(
+        version,
+        cursor.execute("SELECT id, first_name, last_name FROM masters ORDER BY id").fetchall(),
+        cursor.execute("SELECT title, id FROM services").fetchall(),
+        cursor.execute("SELECT master_id, service_id FROM masters_services").fetchall(),
+    )
+
+class NameCache:
+    """
+    Кеш справочников мастеров и услуг для create_appointment. Перед использованием проверяет
+    версию справочников одним запросом к catalog_version и перечитывает их, только если версия
+    изменилась, - в том числе после изменений из других соединений и процессов.
+    Справочники разных баз хранятся отдельно (по token из catalog_version).
+    """
+    def __init__(self):
+        self.catalogs = {}
+
+    def get(self, cursor) -> Catalog:
+        """
+        Возвращает актуальные справочники базы, с которой связан курсор.
+        Вызывается внутри транзакции, чтобы версия и данные соответствовали друг другу.
+        """
+        try:
+            token, version = cursor.execute("SELECT token, version FROM catalog_version WHERE id = 1").fetchone()
+        except sqlite3.OperationalError:
+            # в базе нет таблицы версий (не выполнен add_catalog_version) - справочники читаются каждый раз
+            return load_catalog(cursor, None)
+        catalog = self.catalogs.get(token)
+        if catalog is None or catalog.version != version:
+            catalog = load_catalog(cursor, version)
+            self.catalogs[token] = catalog
+        return catalog
+
+NAME_CACHE = NameCache()
+
 def read_sql_file(filepath: str) -> str:
     """
     Читает текст SQL-скрипта из файла и возвращает его содержимое.
@@ -20,139 +113,254 @@ def execute_script(conn, script: str) -> None:
     cursor.executescript(script)
     conn.commit()
 
+def fts5_available(conn) -> bool:
+    """
+    Проверяет, собран ли SQLite с модулем полнотекстового поиска FTS5.
+    """
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(text)")
+        conn.execute("DROP TABLE temp.fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+def create_fts_index(conn, script: str) -> bool:
+    """
+    Выполняет раздел полнотекстового поиска из скрипта схемы (подходит и для существующей базы:
+    таблица и триггеры создаются, если их нет, индекс перестраивается).
+    Возвращает False, если FTS5 недоступен и раздел пропущен.
+    """
+    marker, fts_section = script.partition(FTS_SECTION_MARKER)[1:]
+    if not marker or not fts5_available(conn):
+        return False
+    execute_script(conn, marker + fts_section)
+    return True
+
+def create_appointment_view(conn, script: str) -> None:
+    """
+    Выполняет раздел appointment_view из скрипта схемы: создаёт таблицу и триггеры, если их нет,
+    и заполняет таблицу заново по текущим записям. Подходит и для существующей базы
+    (колонка phone_normalized должна уже быть, см. add_phone_index).
+    """
+    marker, view_section = script.partition(VIEW_SECTION_MARKER)[1:]
+    if marker:
+        execute_script(conn, marker + view_section.partition(FTS_SECTION_MARKER)[0])
+
+def create_schema(conn, script: str) -> None:
+    """
+    Создаёт таблицы и тестовые данные из скрипта схемы, таблицу appointment_view,
+    а индекс полнотекстового поиска - если доступен FTS5.
+    """
+    execute_script(conn, script.partition(VIEW_SECTION_MARKER)[0].partition(FTS_SECTION_MARKER)[0])
+    create_appointment_view(conn, script)
+    create_fts_index(conn, script)
+
+def normalize_phone(phone: str) -> str:
+    """
+    Приводит телефон к виду колонки phone_normalized: убирает разделители,
+    российские номера 8XXXXXXXXXX и XXXXXXXXXX записывает как 7XXXXXXXXXX.
+    """
+    digits = phone.translate(str.maketrans('', '', PHONE_SEPARATORS))
+    if len(digits) == 11 and digits.startswith('8'):
+        return '7' + digits[1:]
+    if len(digits) == 10:
+        return '7' + digits
+    return digits
+
+def add_phone_index(conn) -> None:
+    """
+    Добавляет в существующую базу колонки нормализованного телефона и индекс по ним.
+    Значения вычисляются для всех записей при создании индекса, отдельное заполнение не нужно.
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_xinfo(appointments)")}
+    with conn:
+        if 'phone_digits' not in columns:
+            conn.execute(f"ALTER TABLE appointments ADD COLUMN phone_digits TEXT GENERATED ALWAYS AS ({PHONE_DIGITS_SQL}) VIRTUAL")
+        if 'phone_normalized' not in columns:
+            conn.execute(f"ALTER TABLE appointments ADD COLUMN phone_normalized TEXT GENERATED ALWAYS AS ({PHONE_NORMALIZED_SQL}) VIRTUAL")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_appointments_phone_normalized ON appointments(phone_normalized)")
+
+def add_catalog_version(conn) -> None:
+    """
+    Добавляет в существующую базу таблицу версии справочников и триггеры, которые её увеличивают.
+    """
+    with conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS catalog_version (
+                id INTEGER NOT NULL PRIMARY KEY CHECK (id = 1),
+                token TEXT NOT NULL,
+                version INTEGER NOT NULL
+            )
+        """)
+        conn.execute("INSERT OR IGNORE INTO catalog_version (id, token, version) VALUES (1, lower(hex(randomblob(16))), 0)")
+        for table in CATALOG_TABLES:
+            for event in ('INSERT', 'UPDATE', 'DELETE'):
+                conn.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS {table}_catalog_{event.lower()} AFTER {event} ON {table} BEGIN
+                        UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+                    END
+                """)
+
 def find_appointment_by_phone(conn, phone: str) -> List[Tuple]:
     """
     Принимает соединение и номер телефона, выполняет параметризованный SELECT-запрос 
-    на точное совпадение номера телефона, возвращает список найденных записей.
+    на совпадение нормализованного номера телефона (по индексу, в любом формате записи),
+    возвращает список найденных записей, в том числе записей без услуг.
+    Имя мастера и услуги берутся из appointment_view, без соединения таблиц.
     """
     cursor = conn.cursor()
     query = """
     SELECT 
-        a.id, 
-        a.name AS client_name, 
-        a.phone, 
-        a.date, 
-        m.first_name || ' ' || m.last_name AS master_name,
-        GROUP_CONCAT(s.title, ', ') AS services,
-        a.status
+        id, 
+        client_name, 
+        phone, 
+        date, 
+        master_name,
+        services,
+        status
     FROM 
-        appointments a
-    JOIN 
-        masters m ON a.master_id = m.id
-    JOIN 
-        appointments_services aps ON a.id = aps.appointment_id
-    JOIN 
-        services s ON aps.service_id = s.id
+        appointment_view
     WHERE 
-        a.phone = ?
-    GROUP BY 
-        a.id
+        phone_normalized = ?
     """
-    cursor.execute(query, (phone,))
+    cursor.execute(query, (normalize_phone(phone),))
     return cursor.fetchall()
 
+def fts_query(text: str) -> str:
+    """
+    Строит запрос FTS5 из пользовательской строки: каждое слово ищется как начало слова
+    (префиксный поиск), все слова должны встретиться. Слова берутся в кавычки, поэтому
+    операторы FTS5 во вводе не интерпретируются. Возвращает пустую строку, если слов нет.
+    """
+    return ' '.join('"{}"*'.format(word.replace('"', '""')) for word in re.findall(r'\w+', text))
+
 def find_appointment_by_comment(conn, comment_part: str) -> List[Tuple]:
     """
-    Принимает соединение и часть комментария, ищет записи, где комментарий содержит 
-    переданную строку, используя оператор LIKE, возвращает список найденных записей.
+    Принимает соединение и часть комментария, ищет записи, где комментарий или имя клиента
+    содержат слова, начинающиеся с переданных, через индекс FTS5. Результаты упорядочены
+    по релевантности (bm25). Если FTS5 недоступен, ищет оператором LIKE записи, где каждое слово
+    строки (или вся строка, если слов в ней нет) содержится в комментарии или имени клиента;
+    регистр при этом не учитывается только для латинских букв. Возвращает список найденных
+    записей, в том числе записей без услуг; имя мастера и услуги берутся из appointment_view.
     """
     cursor = conn.cursor()
-    query = """
+    match = fts_query(comment_part)
+    if match:
+        query = """
+        SELECT 
+            v.id, 
+            v.client_name, 
+            v.phone, 
+            v.date, 
+            v.master_name,
+            v.services,
+            v.status,
+            v.comment
+        FROM 
+            appointments_fts f
+        JOIN 
+            appointment_view v ON v.id = f.rowid
+        WHERE 
+            appointments_fts MATCH ?
+        ORDER BY 
+            f.rank
+        """
+        try:
+            cursor.execute(query, (match,))
+            return cursor.fetchall()
+        except sqlite3.OperationalError:
+            # нет таблицы appointments_fts или модуля FTS5 - ищем через LIKE
+            pass
+    
+    words = re.findall(r'\w+', comment_part) or [comment_part]
+    conditions = ' AND '.join(['(comment LIKE ? OR client_name LIKE ?)'] * len(words))
+    query = f"""
     SELECT 
-        a.id, 
-        a.name AS client_name, 
-        a.phone, 
-        a.date, 
-        m.first_name || ' ' || m.last_name AS master_name,
-        GROUP_CONCAT(s.title, ', ') AS services,
-        a.status,
-        a.comment
+        id, 
+        client_name, 
+        phone, 
+        date, 
+        master_name,
+        services,
+        status,
+        comment
     FROM 
-        appointments a
-    JOIN 
-        masters m ON a.master_id = m.id
-    JOIN 
-        appointments_services aps ON a.id = aps.appointment_id
-    JOIN 
-        services s ON aps.service_id = s.id
+        appointment_view
     WHERE 
-        a.comment LIKE ?
-    GROUP BY 
-        a.id
+        {conditions}
     """
-    cursor.execute(query, (f'%{comment_part}%',))
+    cursor.execute(query, [f'%{word}%' for word in words for _ in range(2)])
     return cursor.fetchall()
 
 def create_appointment(conn, client_name: str, client_phone: str, master_name: str, 
-    services_list: List[str], comment: Optional[str] = None) -> int:
+    services_list: List[str], comment: Optional[str] = None, cache: Optional[NameCache] = None) -> int:
     """
     Создаёт новую запись в таблице клиентов, принимает имя клиента, телефон, 
     имя мастера и список услуг. Ищет мастера и услуги по именам, вставляет запись в базу, 
     связывает её с услугами. Возвращает ID созданной записи.
+    Мастера и услуги ищутся в справочниках кеша cache (по умолчанию NAME_CACHE), которые
+    перечитываются только после их изменения, поэтому запросов на поиск нет: в транзакции
+    выполняются проверка версии справочников, вставка записи и executemany для связей.
+    Если транзакция уже открыта вызывающим кодом, запись выполняется в ней без commit.
     """
     cursor = conn.cursor()
+    # повторы услуги в списке не нужны: связь записи с услугой уникальна
+    services_list = list(dict.fromkeys(services_list))
+    own_transaction = not conn.in_transaction
+    if own_transaction:
+        cursor.execute("BEGIN IMMEDIATE")
     
-    master_name_parts = master_name.split()
-    if len(master_name_parts) == 2:
-        first_name, last_name = master_name_parts
-        cursor.execute(
-            "SELECT id FROM masters WHERE first_name = ? AND last_name = ?", 
-            (first_name, last_name)
-        )
-    else:
-        cursor.execute(
-            "SELECT id FROM masters WHERE first_name || ' ' || last_name LIKE ?", 
-            (f'%{master_name}%',)
-        )
-    
-    master_result = cursor.fetchone()
-    if not master_result:
-        raise ValueError(f"Мастер с именем '{master_name}' не найден")
-    
-    master_id = master_result[0]
-    
-    if comment:
-        cursor.execute(
-            "INSERT INTO appointments (name, phone, master_id, comment) VALUES (?, ?, ?, ?)",
-            (client_name, client_phone, master_id, comment)
-        )
-    else:
-        cursor.execute(
-            "INSERT INTO appointments (name, phone, master_id) VALUES (?, ?, ?)",
-            (client_name, client_phone, master_id)
-        )
-    
-    appointment_id = cursor.lastrowid
-    
-    for service_name in services_list:
-        cursor.execute("SELECT id FROM services WHERE title = ?", (service_name,))
-        service_result = cursor.fetchone()
+    try:
+        catalog = (cache or NAME_CACHE).get(cursor)
+        master_id = catalog.find_master(master_name)
+        if master_id is None:
+            raise ValueError(f"Мастер с именем '{master_name}' не найден")
         
-        if not service_result:
-            raise ValueError(f"Услуга с названием '{service_name}' не найдена")
+        service_ids = []
+        provided = catalog.master_services.get(master_id, set())
+        for service_name in services_list:
+            service_id = catalog.services.get(service_name)
+            if service_id is None:
+                raise ValueError(f"Услуга с названием '{service_name}' не найдена")
+            service_ids.append(service_id)
         
-        service_id = service_result[0]
+        for service_name, service_id in zip(services_list, service_ids):
+            if service_id not in provided:
+                raise ValueError(f"Мастер '{master_name}' не предоставляет услугу '{service_name}'")
         
-        cursor.execute(
-            "SELECT 1 FROM masters_services WHERE master_id = ? AND service_id = ?",
-            (master_id, service_id)
-        )
+        if comment:
+            cursor.execute(
+                "INSERT INTO appointments (name, phone, master_id, comment) VALUES (?, ?, ?, ?)",
+                (client_name, client_phone, master_id, comment)
+            )
+        else:
+            cursor.execute(
+                "INSERT INTO appointments (name, phone, master_id) VALUES (?, ?, ?)",
+                (client_name, client_phone, master_id)
+            )
         
-        if not cursor.fetchone():
-            cursor.execute("SELECT title FROM services WHERE id = ?", (service_id,))
-            service_title = cursor.fetchone()[0]
-            raise ValueError(f"Мастер '{master_name}' не предоставляет услугу '{service_title}'")
+        appointment_id = cursor.lastrowid
         
-        cursor.execute(
+        cursor.executemany(
             "INSERT INTO appointments_services (appointment_id, service_id) VALUES (?, ?)",
-            (appointment_id, service_id)
+            [(appointment_id, service_id) for service_id in service_ids]
         )
+    except BaseException:
+        if own_transaction:
+            conn.rollback()
+        raise
     
-    conn.commit()
+    if own_transaction:
+        conn.commit()
     return appointment_id
 
 if __name__ == "__main__":
     conn = sqlite3.connect(DB_PATH)
+    add_phone_index(conn)
+    add_catalog_version(conn)
+    script = read_sql_file(SQL_SCHEMA_PATH)
+    create_appointment_view(conn, script)
+    create_fts_index(conn, script)
     
     # Тест создания записи
     try:
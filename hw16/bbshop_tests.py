@@ -0,0 +1,245 @@
+"""
+Тесты функций bbshop. Запускаются на временных базах данных, созданных из barbershop.sql:
+python hw16/bbshop_tests.py  или  pytest hw16/bbshop_tests.py
+"""
+
+import os
+import sqlite3
+import tempfile
+
+import bbshop
+from bbshop import (create_appointment, create_appointment_view, create_schema, execute_script,
+                    find_appointment_by_comment, find_appointment_by_phone, fts5_available,
+                    normalize_phone, read_sql_file)
+
+
+SQL_SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'barbershop.sql')
+TEMP_DIR = None
+
+
+def create_database(db_path: str, fts: bool = True) -> sqlite3.Connection:
+    """
+    Создаёт базу из barbershop.sql с записями для поиска и возвращает соединение с ней.
+    :param db_path: Путь к файлу базы.
+    :param fts: Создавать ли индекс полнотекстового поиска (False - база как на SQLite без FTS5).
+    """
+    conn = sqlite3.connect(db_path)
+    script = read_sql_file(SQL_SCHEMA_PATH)
+    if fts:
+        create_schema(conn, script)
+    else:
+        execute_script(conn, script.partition(bbshop.VIEW_SECTION_MARKER)[0])
+        create_appointment_view(conn, script)
+    cache = bbshop.NameCache()
+    create_appointment(conn, 'Оззи Осборн', '+79001112233', 'Джеймс Хетфилд', ['Мужская стрижка'],
+                       'Покороче, без чёлки', cache)
+    create_appointment(conn, 'Ронни Дио', '+79004445566', 'Билли Армстронг', ['Укладка'],
+                       'Покороче и укладка', cache)
+    create_appointment(conn, 'Брюс Дикинсон', '+79007778899', 'Джеймс Хетфилд', ['Бритьё лица'],
+                       'Постоянный клиент! Зовут Оззи', cache)
+    return conn
+
+
+def setup_module(module=None):
+    """
+    Создаёт временный каталог для баз тестов модуля. Тесты никогда не работают с bbshop.db из репозитория.
+    """
+    global TEMP_DIR
+    TEMP_DIR = tempfile.TemporaryDirectory()
+
+
+def teardown_module(module=None):
+    """
+    Удаляет временный каталог с базами.
+    """
+    global TEMP_DIR
+    TEMP_DIR.cleanup()
+    TEMP_DIR = None
+
+
+def found_names(rows) -> set:
+    """
+    Возвращает множество имён клиентов из найденных записей.
+    """
+    return {row[1] for row in rows}
+
+
+def query_plan(conn, query: str, params=()) -> str:
+    """
+    Возвращает план выполнения запроса (колонки detail из EXPLAIN QUERY PLAN) одной строкой.
+    """
+    return '\n'.join(row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {query}', params))
+
+
+def test_fts5_available():
+    conn = sqlite3.connect(':memory:')
+    try:
+        options = {row[0] for row in conn.execute("PRAGMA compile_options")}
+        assert fts5_available(conn) is ('ENABLE_FTS5' in options)
+        # пробная таблица удаляется
+        assert conn.execute("SELECT count(*) FROM temp.sqlite_master").fetchone()[0] == 0
+    finally:
+        conn.close()
+
+
+def test_comment_search_fts():
+    conn = create_database(os.path.join(TEMP_DIR.name, 'fts.db'))
+    try:
+        if not fts5_available(conn):
+            return
+        assert conn.execute("SELECT count(*) FROM sqlite_master WHERE name = 'appointments_fts'").fetchone()[0] == 1
+        # начало слова в комментарии
+        assert found_names(find_appointment_by_comment(conn, 'Покор')) == {'Оззи Осборн', 'Ронни Дио'}
+        # слово из имени клиента и из комментария
+        assert found_names(find_appointment_by_comment(conn, 'Оззи')) == {'Оззи Осборн', 'Брюс Дикинсон'}
+        # все слова должны встретиться
+        assert found_names(find_appointment_by_comment(conn, 'Ронни укладка')) == {'Ронни Дио'}
+        assert find_appointment_by_comment(conn, 'Ронни Хетфилд') == []
+        rows = find_appointment_by_comment(conn, 'Ронни')
+        assert rows[0][4:8] == ('Билли Армстронг', 'Укладка', 'ожидает', 'Покороче и укладка')
+    finally:
+        conn.close()
+
+
+def test_comment_search_like():
+    conn = create_database(os.path.join(TEMP_DIR.name, 'like.db'), fts=False)
+    try:
+        assert conn.execute("SELECT count(*) FROM sqlite_master WHERE name = 'appointments_fts'").fetchone()[0] == 0
+        # без FTS5 найдены те же записи, что и через индекс
+        assert found_names(find_appointment_by_comment(conn, 'Покор')) == {'Оззи Осборн', 'Ронни Дио'}
+        assert found_names(find_appointment_by_comment(conn, 'Оззи')) == {'Оззи Осборн', 'Брюс Дикинсон'}
+        assert found_names(find_appointment_by_comment(conn, 'Ронни укладка')) == {'Ронни Дио'}
+        assert find_appointment_by_comment(conn, 'Ронни Хетфилд') == []
+        # строка без слов ищется целиком
+        assert found_names(find_appointment_by_comment(conn, '!')) == {'Брюс Дикинсон'}
+        rows = find_appointment_by_comment(conn, 'Ронни')
+        assert rows[0][4:8] == ('Билли Армстронг', 'Укладка', 'ожидает', 'Покороче и укладка')
+    finally:
+        conn.close()
+
+
+def test_phone_search_formats():
+    conn = create_database(os.path.join(TEMP_DIR.name, 'phone.db'))
+    try:
+        phones = ['8(900)123-45-67', '+7 (900) 123-45-67', '9001234567', '7.900.123.45.67']
+        ids = {create_appointment(conn, f'Клиент {i}', phone, 'Джеймс Хетфилд', ['Мужская стрижка'])
+               for i, phone in enumerate(phones)}
+        for phone in phones + ['+79001234567']:
+            assert normalize_phone(phone) == '79001234567'
+            assert {row[0] for row in find_appointment_by_phone(conn, phone)} == ids
+        # вычисляемая колонка нормализует телефоны так же, как normalize_phone
+        for phone, normalized in conn.execute("SELECT phone, phone_normalized FROM appointments"):
+            assert normalize_phone(phone) == normalized
+        # телефоны из barbershop.sql записаны через 8
+        assert [row[1] for row in find_appointment_by_phone(conn, '+7 999 999-09-11')] == ['Клаус Майне']
+        assert find_appointment_by_phone(conn, '+7 999 999-09-12') == []
+        # поиск идёт по индексу, а не перебором таблицы
+        plan = query_plan(conn, "SELECT * FROM appointment_view WHERE phone_normalized = ?", ('79001234567',))
+        assert plan.startswith('SEARCH appointment_view') and 'idx_appointment_view_phone_normalized' in plan
+        plan = query_plan(conn, "SELECT * FROM appointments WHERE phone_normalized = ?", ('79001234567',))
+        assert plan.startswith('SEARCH appointments') and 'idx_appointments_phone_normalized' in plan
+    finally:
+        conn.close()
+
+
+def test_name_cache_invalidation():
+    db_path = os.path.join(TEMP_DIR.name, 'cache.db')
+    conn = create_database(db_path)
+    other = sqlite3.connect(db_path)
+    try:
+        cache = bbshop.NameCache()
+        create_appointment(conn, 'Клиент', '+79001234567', 'Джеймс Хетфилд', ['Мужская стрижка'], cache=cache)
+        catalog = cache.get(conn.cursor())
+        # без изменений справочники не перечитываются
+        create_appointment(conn, 'Клиент', '+79001234567', 'Хетфилд', ['Бритьё лица'], cache=cache)
+        assert cache.get(conn.cursor()) is catalog
+
+        # мастер и услуга переименованы через SQL другим соединением
+        with other:
+            other.execute("UPDATE masters SET last_name = 'Хэтфилд' WHERE last_name = 'Хетфилд'")
+            other.execute("UPDATE services SET title = 'Стрижка' WHERE title = 'Мужская стрижка'")
+            other.execute("DELETE FROM masters_services WHERE master_id = 1 AND service_id = 5")
+        appointment_id = create_appointment(conn, 'Клиент', '+79001234567', 'Джеймс Хэтфилд', ['Стрижка'], cache=cache)
+        assert cache.get(conn.cursor()) is not catalog
+        assert conn.execute("SELECT master_name, services FROM appointment_view WHERE id = ?",
+                            (appointment_id,)).fetchone() == ('Джеймс Хэтфилд', 'Стрижка')
+        for master_name, services in [('Джеймс Хетфилд', ['Стрижка']), ('Джеймс Хэтфилд', ['Мужская стрижка']),
+                                      ('Джеймс Хэтфилд', ['Бритьё лица'])]:
+            try:
+                create_appointment(conn, 'Клиент', '+79001234567', master_name, services, cache=cache)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(f'{master_name}, {services}: запись создана по устаревшему справочнику')
+    finally:
+        other.close()
+        conn.close()
+
+
+def view_rows(conn, query: str) -> list:
+    """
+    Возвращает строки записей, отсортированные по id; услуги сравниваются без учёта порядка.
+    """
+    return sorted(row[:7] + (sorted(row[7].split(', ')) if row[7] else None,) + row[8:]
+                  for row in conn.execute(query))
+
+
+VIEW_COLUMNS = 'id, client_name, phone, phone_normalized, date, master_id, master_name, services, total_price, status, comment'
+
+# Те же данные, что в appointment_view, из соединения таблиц с GROUP_CONCAT
+JOINED_APPOINTMENTS_QUERY = """
+SELECT
+    a.id, a.name, a.phone, a.phone_normalized, a.date, a.master_id,
+    m.first_name || ' ' || m.last_name,
+    GROUP_CONCAT(s.title, ', '),
+    COALESCE(SUM(s.price), 0),
+    a.status, a.comment
+FROM appointments a
+LEFT JOIN masters m ON m.id = a.master_id
+LEFT JOIN appointments_services aps ON aps.appointment_id = a.id
+LEFT JOIN services s ON s.id = aps.service_id
+GROUP BY a.id
+"""
+
+
+def test_appointment_view_sync():
+    conn = create_database(os.path.join(TEMP_DIR.name, 'view.db'))
+    changes = [
+        "UPDATE appointments SET name = 'Клаус', phone = '+7 999 000-00-01', status = 'отменена', comment = 'перенос' WHERE id = 1",
+        "UPDATE appointments SET master_id = 2 WHERE id = 3",
+        "UPDATE appointments_services SET service_id = 4 WHERE appointment_id = 5 AND service_id = 1",
+        "DELETE FROM appointments_services WHERE appointment_id = 2 AND service_id = 3",
+        "DELETE FROM appointments WHERE id = 4",
+        # запись без услуг: строку удаляет триггер на appointments, а не каскад по услугам
+        "INSERT INTO appointments (name, phone, master_id) VALUES ('Без услуг', '89000000000', 1)",
+        "DELETE FROM appointments WHERE name = 'Без услуг'",
+        "UPDATE masters SET first_name = 'Джеймс Алан', last_name = 'Хэтфилд' WHERE id = 1",
+        "UPDATE services SET title = 'Укладка феном', price = 900 WHERE title = 'Укладка'",
+        "UPDATE services SET price = 1200 WHERE title = 'Мужская стрижка'",
+        # каскадное удаление по внешним ключам
+        "DELETE FROM services WHERE title = 'Бритьё лица'",
+        "DELETE FROM masters WHERE id = 2",
+    ]
+    try:
+        assert view_rows(conn, f'SELECT {VIEW_COLUMNS} FROM appointment_view') == view_rows(conn, JOINED_APPOINTMENTS_QUERY)
+        for change in changes:
+            with conn:
+                conn.execute(change)
+            assert view_rows(conn, f'SELECT {VIEW_COLUMNS} FROM appointment_view') == view_rows(conn, JOINED_APPOINTMENTS_QUERY), change
+        # записи мастера 2 удалены каскадно, у записи 5 осталась только «Укладка феном»
+        assert conn.execute("SELECT count(*) FROM appointment_view WHERE master_id = 2").fetchone()[0] == 0
+        assert conn.execute("SELECT services, total_price FROM appointment_view WHERE id = 5").fetchone() == ('Укладка феном', 900)
+        assert conn.execute("SELECT count(*) FROM appointment_view").fetchone()[0] == conn.execute("SELECT count(*) FROM appointments").fetchone()[0]
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    setup_module()
+    try:
+        for name, test in list(globals().items()):
+            if name.startswith('test_') and callable(test):
+                test()
+                print(f'{name}: OK')
+    finally:
+        teardown_module()
@@ -0,0 +1,99 @@
+"""
+Микро-бенчмарк create_appointment: записи с 1-20 услугами на временной базе из barbershop.sql.
+Запуск: python hw16/create_appointment_benchmark.py [количество записей на каждое число услуг]
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from bbshop import read_sql_file, create_schema, create_appointment
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MAX_SERVICES = 20
+MASTER_NAME = 'Джеймс Хетфилд'
+
+
+class CountingCursor(sqlite3.Cursor):
+    """
+    Курсор, который считает выполненные через него SQL-запросы (executemany - по строке параметров).
+    Запросы, которые выполняют триггеры, не учитываются.
+    """
+    def execute(self, sql, parameters=()):
+        self.connection.statements += 1
+        return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        seq_of_parameters = list(seq_of_parameters)
+        self.connection.statements += len(seq_of_parameters)
+        return super().executemany(sql, seq_of_parameters)
+
+
+class CountingConnection(sqlite3.Connection):
+    """
+    Соединение, курсоры которого считают запросы; COMMIT тоже считается.
+    """
+    statements = 0
+
+    def cursor(self, factory=CountingCursor):
+        return super().cursor(factory)
+
+    def commit(self):
+        self.statements += 1
+        return super().commit()
+
+
+def prepare_database(db_path: str) -> list:
+    """
+    Создаёт базу по barbershop.sql и добавляет мастеру MASTER_NAME услуги, чтобы их было не меньше MAX_SERVICES.
+    :return: Названия услуг мастера.
+    """
+    conn = sqlite3.connect(db_path)
+    create_schema(conn, read_sql_file(os.path.join(HERE, 'barbershop.sql')))
+    cursor = conn.cursor()
+    cursor.executemany(
+        "INSERT INTO services (title, description, price) VALUES (?, NULL, ?)",
+        [(f'Услуга {i}', 100 * i) for i in range(1, MAX_SERVICES + 1)]
+    )
+    cursor.execute(
+        "INSERT OR IGNORE INTO masters_services (master_id, service_id) SELECT 1, id FROM services"
+    )
+    conn.commit()
+    titles = [title for (title,) in cursor.execute(
+        "SELECT s.title FROM services s JOIN masters_services ms ON ms.service_id = s.id WHERE ms.master_id = 1 ORDER BY s.id"
+    )]
+    conn.close()
+    return titles
+
+
+def run_benchmark(count: int, synchronous: str = 'FULL') -> list:
+    """
+    Для каждого числа услуг от 1 до MAX_SERVICES создаёт count записей.
+    С synchronous='OFF' commit не ждёт записи на диск, и замер показывает стоимость самих запросов.
+    :return: Список (число услуг, микросекунд на запись, SQL-запросов на запись).
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_path = os.path.join(temp_dir, 'bbshop.db')
+        titles = prepare_database(db_path)
+        conn = sqlite3.connect(db_path, factory=CountingConnection)
+        conn.execute(f'PRAGMA synchronous = {synchronous}')
+        results = []
+        for services in range(1, MAX_SERVICES + 1):
+            conn.statements = 0
+            start = time.perf_counter()
+            for i in range(count):
+                create_appointment(conn, f'Клиент {i}', f'+7900{i:07d}', MASTER_NAME, titles[:services])
+            elapsed = time.perf_counter() - start
+            results.append((services, round(elapsed / count * 1_000_000), conn.statements // count))
+        conn.close()
+        return results
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    for synchronous in ('FULL', 'OFF'):
+        print(f'PRAGMA synchronous = {synchronous}')
+        for services, micros, queries in run_benchmark(count, synchronous):
+            print(f'{services:2d} услуг: {micros} мкс и {queries} SQL-запросов на запись')
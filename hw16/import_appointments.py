@@ -0,0 +1,257 @@
+"""
+Массовая загрузка исторических записей из CSV в таблицы appointments и appointments_services.
+Колонки файла (первая строка - заголовок): name, phone, date, master, services, status, comment;
+master - «Имя Фамилия» мастера, services - названия услуг через ';'. Пустые date и status
+заменяются значениями по умолчанию из схемы.
+
+Запуск: python hw16/import_appointments.py файл.csv [--db hw16/bbshop.db] [--batch 100000]
+Тестовый файл: python hw16/import_appointments.py файл.csv --generate 1000000
+"""
+
+import argparse
+import csv
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+
+from bbshop import DB_PATH, read_sql_file, create_schema, create_appointment_view, load_catalog
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CSV_COLUMNS = ('name', 'phone', 'date', 'master', 'services', 'status', 'comment')
+SERVICES_SEPARATOR = ';'
+# Строк в одной транзакции
+BATCH_SIZE = 100_000
+# Таблицы, индексы и триггеры которых удаляются на время загрузки
+LOADED_TABLES = ('appointments', 'appointments_services')
+
+INSERT_APPOINTMENT = """
+    INSERT INTO appointments (id, name, phone, date, master_id, status, comment)
+    VALUES (?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?, COALESCE(?, 'ожидает'), ?)
+"""
+INSERT_APPOINTMENT_SERVICE = "INSERT INTO appointments_services (appointment_id, service_id) VALUES (?, ?)"
+MALFORMED_ROW = f'Число колонок в строке не равно {len(CSV_COLUMNS)}'
+
+
+def drop_secondary_objects(conn) -> List[str]:
+    """
+    Удаляет индексы (кроме первичных ключей) и триггеры загружаемых таблиц: каждую строку
+    дешевле записать без их обновления, а индексы построить один раз после загрузки.
+    :return: SQL для их повторного создания.
+    """
+    placeholders = ', '.join('?' * len(LOADED_TABLES))
+    objects = conn.execute(
+        f"SELECT type, name, sql FROM sqlite_master "
+        f"WHERE type IN ('index', 'trigger') AND tbl_name IN ({placeholders}) AND sql IS NOT NULL",
+        LOADED_TABLES
+    ).fetchall()
+    with conn:
+        for object_type, name, _ in objects:
+            conn.execute(f'DROP {object_type.upper()} "{name}"')
+    return [sql for _, _, sql in objects]
+
+
+def restore_secondary_objects(conn, statements: List[str]) -> None:
+    """
+    Создаёт удалённые индексы и триггеры заново и перестраивает appointment_view и индекс
+    полнотекстового поиска, которые во время загрузки не обновлялись триггерами.
+    """
+    with conn:
+        for sql in statements:
+            conn.execute(sql)
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'appointments_fts'").fetchone():
+            conn.execute("INSERT INTO appointments_fts (appointments_fts) VALUES ('rebuild')")
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'appointment_view'").fetchone():
+        create_appointment_view(conn, read_sql_file(os.path.join(HERE, 'barbershop.sql')))
+
+
+def last_appointment_id(conn) -> int:
+    """
+    Наибольший выданный id записи. Таблица appointments объявлена с AUTOINCREMENT, поэтому
+    учитывается и sqlite_sequence: id удалённых записей с наибольшими номерами не выдаются повторно.
+    """
+    max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM appointments").fetchone()[0]
+    sequence = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'appointments'").fetchone()
+    return max(max_id, sequence[0] if sequence else 0)
+
+
+def import_rows(conn, rows: Iterable[List[str]], batch_size: int = BATCH_SIZE, progress=None) -> dict:
+    """
+    Загружает записи. Мастера и услуги ищутся в справочниках, прочитанных один раз в начале;
+    результат поиска запоминается для каждого сочетания мастера и списка услуг. Строки
+    вставляются через executemany, по batch_size строк в транзакции, с заранее выданными id,
+    поэтому lastrowid не нужен. Строки с неизвестным мастером или услугой и строки
+    с другим числом колонок пропускаются.
+    :param rows: Строки CSV без заголовка, колонки в порядке CSV_COLUMNS.
+    :param progress: Функция, которая после каждой транзакции получает число обработанных строк.
+    :return: Количество обработанных, загруженных и пропущенных (по причинам) строк.
+    """
+    catalog = load_catalog(conn.cursor(), None)
+    next_id = last_appointment_id(conn) + 1
+    resolved = {}
+    rejected = Counter()
+    total = imported = 0
+    appointments = []
+    links = []
+
+    def flush():
+        with conn:
+            conn.executemany(INSERT_APPOINTMENT, appointments)
+            conn.executemany(INSERT_APPOINTMENT_SERVICE, links)
+            conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'appointments' AND seq < ?",
+                         (next_id - 1, next_id - 1))
+        appointments.clear()
+        links.clear()
+        if progress:
+            progress(total)
+
+    for row in rows:
+        total += 1
+        if len(row) != len(CSV_COLUMNS):
+            rejected[MALFORMED_ROW] += 1
+            continue
+        name, phone, date, master, services, status, comment = row
+        key = (master, services)
+        resolution = resolved.get(key)
+        if resolution is None:
+            resolution = resolve(catalog, master, services)
+            resolved[key] = resolution
+        if isinstance(resolution, str):
+            rejected[resolution] += 1
+            continue
+        master_id, service_ids = resolution
+        appointments.append((next_id, name, phone, date or None, master_id, status or None, comment or None))
+        links.extend((next_id, service_id) for service_id in service_ids)
+        next_id += 1
+        imported += 1
+        if len(appointments) >= batch_size:
+            flush()
+    if appointments:
+        flush()
+    return {'rows': total, 'imported': imported, 'rejected': dict(rejected)}
+
+
+def resolve(catalog, master: str, services: str):
+    """
+    Находит id мастера и его услуг по строке CSV.
+    :return: (id мастера, кортеж id услуг) или причина, по которой строка пропускается.
+    """
+    master_id = catalog.find_master(master)
+    if master_id is None:
+        return f"Мастер с именем '{master}' не найден"
+    titles = list(dict.fromkeys(title.strip() for title in services.split(SERVICES_SEPARATOR) if title.strip()))
+    provided = catalog.master_services.get(master_id, set())
+    service_ids = []
+    for title in titles:
+        service_id = catalog.services.get(title)
+        if service_id is None:
+            return f"Услуга с названием '{title}' не найдена"
+        if service_id not in provided:
+            return f"Мастер '{master}' не предоставляет услугу '{title}'"
+        service_ids.append(service_id)
+    return master_id, tuple(service_ids)
+
+
+def import_csv(conn, path: str, batch_size: int = BATCH_SIZE, progress=None) -> dict:
+    """
+    Читает CSV построчно и загружает его в базу. На время загрузки удаляет индексы и триггеры
+    таблиц записей и отключает ожидание записи на диск при commit; прежние настройки
+    соединения восстанавливаются после загрузки.
+    :return: Результат import_rows, время загрузки и количество строк в секунду.
+    """
+    start = time.perf_counter()
+    synchronous = conn.execute("PRAGMA synchronous").fetchone()[0]
+    cache_size = conn.execute("PRAGMA cache_size").fetchone()[0]
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -262144")
+    statements = drop_secondary_objects(conn)
+    try:
+        with open(path, newline='', encoding='utf-8') as file:
+            reader = csv.reader(file)
+            header = next(reader, None)
+            if header is None:
+                rows = iter(())
+            else:
+                positions = [header.index(column) for column in CSV_COLUMNS]
+                if header == list(CSV_COLUMNS):
+                    rows = reader
+                else:
+                    # строка с другим числом колонок, чем в заголовке, передаётся пустой и пропускается
+                    rows = ([row[position] for position in positions] if len(row) == len(header) else []
+                            for row in reader)
+            result = import_rows(conn, rows, batch_size, progress)
+        load_seconds = time.perf_counter() - start
+    finally:
+        restore_secondary_objects(conn, statements)
+        conn.execute(f"PRAGMA synchronous = {int(synchronous)}")
+        conn.execute(f"PRAGMA cache_size = {int(cache_size)}")
+    seconds = time.perf_counter() - start
+    result['load_seconds'] = round(load_seconds, 2)
+    result['seconds'] = round(seconds, 2)
+    result['rows_per_second'] = round(result['rows'] / seconds) if seconds else 0
+    return result
+
+
+def generate_csv(path: str, count: int, conn) -> None:
+    """
+    Записывает в path count записей к мастерам и услугам базы conn (для замера скорости загрузки).
+    """
+    catalog = load_catalog(conn.cursor(), None)
+    titles = {service_id: title for title, service_id in catalog.services.items()}
+    choices = [
+        (full_name, SERVICES_SEPARATOR.join(titles[service_id] for service_id in sorted(catalog.master_services.get(master_id, ()))[:size]))
+        for master_id, full_name in catalog.master_names
+        for size in (1, 2)
+    ]
+    start = datetime(2015, 1, 1, 9)
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(CSV_COLUMNS)
+        for i in range(count):
+            master, services = choices[i % len(choices)]
+            writer.writerow((
+                f'Клиент {i}', f'+7900{i:07d}', (start + timedelta(minutes=20 * i)).strftime('%Y-%m-%d %H:%M:%S'),
+                master, services, 'завершена', 'стрижка покороче' if i % 10 == 0 else '',
+            ))
+
+
+def print_progress(rows: int) -> None:
+    """
+    Печатает количество обработанных строк после каждой транзакции.
+    """
+    print(f'Обработано {rows} строк', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Загрузка записей барбершопа из CSV')
+    parser.add_argument('path', help='CSV-файл с записями')
+    parser.add_argument('--db', default=DB_PATH, help='файл базы данных')
+    parser.add_argument('--batch', type=int, default=BATCH_SIZE, help='строк в одной транзакции')
+    parser.add_argument('--generate', type=int, metavar='N',
+                        help='создать CSV из N записей и загрузить его во временную базу из barbershop.sql')
+    args = parser.parse_args()
+
+    db_path: Optional[str] = args.db
+    temp_dir = tempfile.TemporaryDirectory() if args.generate else None
+    if temp_dir is not None:
+        db_path = os.path.join(temp_dir.name, 'bbshop.db')
+        conn = sqlite3.connect(db_path)
+        create_schema(conn, read_sql_file(os.path.join(HERE, 'barbershop.sql')))
+        generate_csv(args.path, args.generate, conn)
+    else:
+        conn = sqlite3.connect(db_path)
+    try:
+        result = import_csv(conn, args.path, args.batch, print_progress)
+        print(f"Обработано строк: {result['rows']}, загружено: {result['imported']}, "
+              f"за {result['seconds']} с ({result['rows_per_second']} строк/с, "
+              f"из них загрузка {result['load_seconds']} с)")
+        for reason, count in result['rejected'].items():
+            print(f'Пропущено {count}: {reason}')
+    finally:
+        conn.close()
+        if temp_dir is not None:
+            temp_dir.cleanup()
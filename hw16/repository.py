@@ -0,0 +1,218 @@
+"""
+Потокобезопасный доступ к базе барбершопа для многопоточных обработчиков: пул соединений
+и репозиторий с функциями bbshop.py.
+Пример нагрузки из нескольких потоков: python hw16/repository.py [потоков] [записей на поток]
+"""
+
+import os
+import queue
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Tuple, Optional
+
+from bbshop import (DB_PATH, NameCache, read_sql_file, create_schema, create_appointment,
+                    find_appointment_by_phone, find_appointment_by_comment)
+
+
+class ConnectionPool:
+    """
+    Пул не более чем из max_connections соединений с одной базой. Поток берёт соединение
+    на время операции или транзакции и возвращает его в пул, поэтому одновременно соединение
+    использует только один поток; вложенные операции в том же потоке получают то же соединение.
+    Соединения открываются с check_same_thread=False, так как между операциями могут
+    переходить к другому потоку, и кешируют до cached_statements подготовленных запросов.
+    Каждое соединение работает в режиме WAL (читатели не ждут писателя) и ждёт блокировку
+    базы до busy_timeout миллисекунд, а не сразу завершается ошибкой database is locked.
+    """
+    def __init__(self, db_path: str, max_connections: int = 8, busy_timeout: int = 5000,
+                 cached_statements: int = 256, timeout: Optional[float] = None):
+        self.db_path = db_path
+        self.max_connections = max_connections
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self.timeout = timeout
+        self.idle = queue.LifoQueue()
+        self.connections = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        Открывает новое соединение и настраивает его.
+        """
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout / 1000,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+        conn.execute("PRAGMA journal_mode = WAL")
+        # в режиме WAL commit с synchronous = NORMAL не теряет целостность базы при сбое
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """
+        Возвращает свободное соединение; открывает новое, если их меньше max_connections,
+        иначе ждёт, пока другой поток вернёт соединение (не дольше timeout секунд).
+        """
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if len(self.connections) < self.max_connections:
+                conn = self.connect()
+                self.connections.append(conn)
+                return conn
+        try:
+            return self.idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"Нет свободного соединения с базой за {self.timeout} с") from None
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        """
+        Возвращает соединение в пул, откатив незавершённую транзакцию.
+        """
+        if conn.in_transaction:
+            conn.rollback()
+        self.idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """
+        Контекст, в котором текущий поток владеет соединением.
+        """
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+        conn = self.acquire()
+        self.local.conn = conn
+        try:
+            yield conn
+        finally:
+            self.local.conn = None
+            self.release(conn)
+
+    def close(self) -> None:
+        """
+        Закрывает все соединения пула. Вызывается, когда потоки закончили работу с базой.
+        """
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections = []
+            self.idle = queue.LifoQueue()
+
+
+class BarbershopRepository:
+    """
+    Функции bbshop.py поверх пула соединений. Каждый метод выполняется на соединении
+    текущего потока; внутри transaction() все операции потока попадают в одну транзакцию
+    и один commit. Справочники мастеров и услуг общие для всех потоков репозитория.
+    """
+    def __init__(self, db_path: str = DB_PATH, **pool_options):
+        self.pool = ConnectionPool(db_path, **pool_options)
+        self.cache = NameCache()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Открывает транзакцию (BEGIN IMMEDIATE: блокировка на запись берётся сразу, поэтому
+        транзакция не завершится ошибкой при попытке записи) и фиксирует её при выходе
+        из блока или откатывает при исключении. Вложенный вызов продолжает внешнюю транзакцию.
+        """
+        with self.pool.connection() as conn:
+            if conn.in_transaction:
+                yield conn
+                return
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def create_appointment(self, client_name: str, client_phone: str, master_name: str,
+                           services_list: List[str], comment: Optional[str] = None) -> int:
+        """
+        Создаёт запись, см. bbshop.create_appointment.
+        """
+        with self.pool.connection() as conn:
+            return create_appointment(conn, client_name, client_phone, master_name, services_list, comment, self.cache)
+
+    def find_appointment_by_phone(self, phone: str) -> List[Tuple]:
+        """
+        Ищет записи по телефону, см. bbshop.find_appointment_by_phone.
+        """
+        with self.pool.connection() as conn:
+            return find_appointment_by_phone(conn, phone)
+
+    def find_appointment_by_comment(self, comment_part: str) -> List[Tuple]:
+        """
+        Ищет записи по комментарию, см. bbshop.find_appointment_by_comment.
+        """
+        with self.pool.connection() as conn:
+            return find_appointment_by_comment(conn, comment_part)
+
+    def close(self) -> None:
+        """
+        Закрывает соединения пула.
+        """
+        self.pool.close()
+
+
+def run_workers(repository: BarbershopRepository, threads: int, count: int) -> float:
+    """
+    Запускает threads потоков, каждый создаёт count записей пачками по 10 в одной транзакции
+    и ищет созданные записи по телефону.
+    :return: Количество созданных записей в секунду.
+    """
+    errors = []
+
+    def worker(number: int):
+        try:
+            for start in range(0, count, 10):
+                with repository.transaction():
+                    for i in range(start, min(start + 10, count)):
+                        repository.create_appointment(
+                            f'Клиент {number}-{i}', f'+7900{number:03d}{i:04d}',
+                            'Джеймс Хетфилд', ['Мужская стрижка', 'Бритьё лица'])
+                assert repository.find_appointment_by_phone(f'8900{number:03d}{start:04d}')
+        except BaseException as error:
+            errors.append(error)
+
+    workers = [threading.Thread(target=worker, args=(number,)) for number in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if errors:
+        raise errors[0]
+    return threads * count / elapsed
+
+
+if __name__ == '__main__':
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_path = os.path.join(temp_dir, 'bbshop.db')
+        conn = sqlite3.connect(db_path)
+        create_schema(conn, read_sql_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'barbershop.sql')))
+        conn.close()
+        repository = BarbershopRepository(db_path, max_connections=4)
+        try:
+            rate = run_workers(repository, threads, count)
+            print(f'{threads} потоков, {len(repository.pool.connections)} соединений: {rate:.0f} записей/с')
+        finally:
+            repository.close()
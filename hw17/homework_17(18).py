@@ -9,7 +9,7 @@ class BaseModel(Model):
 
 class Master(BaseModel):
     first_name = CharField(max_length=50, null=False)
-    last_name = CharField(max_length=50, null=False)
+    last_name = CharField(max_length=50, null=False, index=True)
     middle_name = CharField(max_length=50, null=True)
     phone = CharField(max_length=20, unique=True)
 
@@ -19,11 +19,18 @@ class Service(BaseModel):
     price = DecimalField(max_digits=7, decimal_places=2)
 
 class Appointment(BaseModel):
-    client_name = CharField(max_length=100, null=False)
-    client_phone = CharField(max_length=20, null=False)
-    date = DateTimeField(default=datetime.now)
-    master = ForeignKeyField(Master, backref='appointments')
-    status = CharField(max_length=20, default='pending')
+    client_name = CharField(max_length=100, null=False, index=True)
+    client_phone = CharField(max_length=20, null=False, index=True)
+    date = DateTimeField(default=datetime.now, index=True)
+    master = ForeignKeyField(Master, backref='appointments', index=False)
+    status = CharField(max_length=20, default='pending', index=True)
+
+    class Meta:
+        # (master, date) заменяет отдельный индекс по master: расписание мастера
+        # читается одним диапазоном индекса, уже упорядоченным по дате
+        indexes = (
+            (('master', 'date'), False),
+        )
 
 class MasterService(BaseModel):
     master = ForeignKeyField(Master)
@@ -36,6 +43,8 @@ class AppointmentService(BaseModel):
 def initialize_db():
     DB.connect()
     DB.create_tables([Master, Service, Appointment, MasterService, AppointmentService])
+    # индекс по master из старых баз заменён составным индексом (master, date)
+    DB.execute_sql('DROP INDEX IF EXISTS appointment_master_id')
 
 def create_test_data():
     masters = [
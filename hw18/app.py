@@ -1,11 +1,151 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g, has_request_context
 from peewee import *
-from datetime import datetime
+from playhouse.migrate import SqliteMigrator, migrate
+from playhouse.pool import PooledSqliteDatabase
+from datetime import datetime, timedelta
+from decimal import Decimal
+from contextlib import contextmanager
+from functools import wraps
+import base64
+import bisect
+import csv
+import gzip
+import hashlib
+import io
 import json
+import sqlite3
+import threading
+import time
+import zlib
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 app = Flask(__name__)
 
-DB = SqliteDatabase('barbershop.db')
+# Настройки приложения. Любую из них можно переопределить переменной окружения
+# с префиксом BARBERSHOP_, например BARBERSHOP_DATABASE_POOL=false.
+# Пул включён по умолчанию: в режиме WAL закрытие последнего соединения
+# запускает checkpoint, и открывать соединение на каждый запрос заметно дороже
+app.config.from_mapping(
+    DATABASE_PATH='barbershop.db',
+    DATABASE_POOL=True,
+    DATABASE_MAX_CONNECTIONS=16,
+    DATABASE_STALE_TIMEOUT=300,
+    DATABASE_JOURNAL_MODE='wal',
+    DATABASE_SYNCHRONOUS='normal',
+    DATABASE_CACHE_SIZE=-64000,
+    DATABASE_MMAP_SIZE=256 * 1024 * 1024,
+    DATABASE_BUSY_TIMEOUT=5000,
+    ASGI_THREADS=16,
+    ASGI_KEEP_ALIVE_TIMEOUT=75,
+    JSON_ENCODER='auto',
+    GZIP_MIN_SIZE=1024,
+    GZIP_LEVEL=6,
+    APPOINTMENT_DEFAULT_DURATION=60,
+    METRICS_ENABLED=True,
+    IDEMPOTENCY_TTL=24 * 60 * 60,
+    IDEMPOTENCY_PENDING_TIMEOUT=60,
+    IDEMPOTENCY_SWEEP_INTERVAL=60,
+    RESPONSE_CACHE_TTL=60,
+)
+app.config.from_prefixed_env('BARBERSHOP')
+
+DB = DatabaseProxy()
+
+def database_pragmas(config):
+    """
+    Собирает PRAGMA-настройки SQLite из конфигурации приложения.
+    cache_size задаётся в страницах или, если значение отрицательное, в КиБ;
+    mmap_size - в байтах; busy_timeout - в миллисекундах
+    """
+    return {
+        'journal_mode': config['DATABASE_JOURNAL_MODE'],
+        'synchronous': config['DATABASE_SYNCHRONOUS'],
+        'cache_size': config['DATABASE_CACHE_SIZE'],
+        'mmap_size': config['DATABASE_MMAP_SIZE'],
+        'busy_timeout': config['DATABASE_BUSY_TIMEOUT'],
+    }
+
+class QueryStatsMixin:
+    """
+    Считает SQL-запросы текущего HTTP-запроса и время их выполнения для /metrics.
+    Вне запроса (миграции, тестовые данные) ничего не считает
+    """
+    def execute_sql(self, sql, params=None):
+        if not has_request_context():
+            return super().execute_sql(sql, params)
+        start = time.perf_counter()
+        try:
+            return super().execute_sql(sql, params)
+        finally:
+            g.sql_queries = g.get('sql_queries', 0) + 1
+            g.sql_seconds = g.get('sql_seconds', 0.0) + time.perf_counter() - start
+
+class InstrumentedSqliteDatabase(QueryStatsMixin, SqliteDatabase):
+    pass
+
+class InstrumentedPooledSqliteDatabase(QueryStatsMixin, PooledSqliteDatabase):
+    pass
+
+def configure_database(config=None):
+    """
+    Создаёт базу данных по конфигурации (обычной или с пулом соединений) и подключает её к моделям.
+    Закрывает соединения предыдущей базы, поэтому её можно вызывать повторно, например в тестах
+    """
+    config = config or app.config
+    if DB.obj is not None:
+        if isinstance(DB.obj, PooledSqliteDatabase):
+            DB.obj.close_all()
+        elif not DB.obj.is_closed():
+            DB.obj.close()
+    
+    options = {
+        'pragmas': database_pragmas(config),
+        'returning_clause': sqlite3.sqlite_version_info >= (3, 35, 0),
+    }
+    if config['DATABASE_POOL']:
+        # соединение из пула может достаться другому потоку, но одновременно им пользуется только один.
+        # Если все соединения заняты, запрос ждёт освободившееся не дольше busy_timeout
+        database = InstrumentedPooledSqliteDatabase(
+            config['DATABASE_PATH'],
+            max_connections=config['DATABASE_MAX_CONNECTIONS'],
+            stale_timeout=config['DATABASE_STALE_TIMEOUT'],
+            timeout=config['DATABASE_BUSY_TIMEOUT'] / 1000,
+            check_same_thread=False,
+            **options
+        )
+    else:
+        database = InstrumentedSqliteDatabase(config['DATABASE_PATH'], **options)
+    
+    DB.initialize(database)
+    return database
+
+configure_database()
+
+@app.before_request
+def open_db_connection():
+    """
+    Открывает соединение с базой на время запроса (в режиме пула - берёт его из пула)
+    """
+    DB.connect(reuse_if_open=True)
+
+@app.teardown_request
+def close_db_connection(exception):
+    """
+    Закрывает соединение после запроса (в режиме пула - возвращает его в пул).
+    Для потоковых ответов вызывается до того, как отдана первая часть, поэтому
+    генератор ответа читает базу через собственное соединение (см. stream_with_connection)
+    """
+    if not DB.is_closed():
+        DB.close()
+
+# Транзакции записи открываются как BEGIN IMMEDIATE: блокировка на запись берётся сразу
+# и ожидает busy_timeout, а не падает с "database is locked" при повышении
+# блокировки с чтения до записи внутри транзакции
+WRITE_LOCK = 'IMMEDIATE'
 
 
 
@@ -16,7 +156,7 @@ class BaseModel(Model):
 
 class Master(BaseModel):
     first_name = CharField(max_length=50, null=False)
-    last_name = CharField(max_length=50, null=False)
+    last_name = CharField(max_length=50, null=False, index=True)
     middle_name = CharField(max_length=50, null=True)
     phone = CharField(max_length=20, unique=True)
 
@@ -24,13 +164,21 @@ class Service(BaseModel):
     title = CharField(max_length=100, unique=True)
     description = TextField(null=True)
     price = DecimalField(max_digits=7, decimal_places=2)
+    duration = IntegerField(default=60)
 
 class Appointment(BaseModel):
-    client_name = CharField(max_length=100, null=False)
-    client_phone = CharField(max_length=20, null=False)
-    date = DateTimeField(default=datetime.now)
-    master = ForeignKeyField(Master, backref='appointments')
-    status = CharField(max_length=20, default='pending')
+    client_name = CharField(max_length=100, null=False, index=True)
+    client_phone = CharField(max_length=20, null=False, index=True)
+    date = DateTimeField(default=datetime.now, index=True)
+    master = ForeignKeyField(Master, backref='appointments', index=False)
+    status = CharField(max_length=20, default='pending', index=True)
+
+    class Meta:
+        # (master, date) заменяет отдельный индекс по master: расписание мастера
+        # читается одним диапазоном индекса, уже упорядоченным по дате
+        indexes = (
+            (('master', 'date'), False),
+        )
 
 class MasterService(BaseModel):
     master = ForeignKeyField(Master)
@@ -40,14 +188,203 @@ class AppointmentService(BaseModel):
     appointment = ForeignKeyField(Appointment)
     service = ForeignKeyField(Service)
 
+class IdempotencyKey(BaseModel):
+    key = CharField(max_length=255)
+    endpoint = CharField(max_length=100)
+    request_hash = CharField(max_length=64)
+    # None - запрос с этим ключом ещё выполняется
+    status_code = IntegerField(null=True)
+    content_type = CharField(max_length=100, null=True)
+    body = BlobField(null=True)
+    created_at = DateTimeField(default=datetime.now, index=True)
+
+    class Meta:
+        indexes = (
+            (('key', 'endpoint'), True),
+        )
+
+class MasterDayStats(BaseModel):
+    """
+    Сводка по мастеру за день: записи (кроме отменённых), отменённые записи, выручка и минуты
+    услуг по неотменённым записям. Поддерживается триггерами (см. MASTER_DAY_STATS_TRIGGERS),
+    поэтому отчёты читают по строке на день, а не всю историю записей
+    """
+    master = ForeignKeyField(Master, index=False)
+    day = DateField()
+    appointments = IntegerField(default=0)
+    cancelled = IntegerField(default=0)
+    revenue = DecimalField(max_digits=12, decimal_places=2, default=0)
+    service_minutes = IntegerField(default=0)
+
+    class Meta:
+        primary_key = CompositeKey('master', 'day')
+        indexes = (
+            (('day',), False),
+        )
+
+class ScheduleVersion(BaseModel):
+    """
+    Счётчик изменений расписаний мастеров (одна строка с id = 1). Триггеры из schedule_version_triggers
+    увеличивают его при любом изменении записей, их услуг и длительности услуг - в том числе
+    из другого процесса или в обход приложения, - и по нему ScheduleRegistry узнаёт, что расписания устарели
+    """
+    version = IntegerField(default=0)
+
+MODELS = [Master, Service, Appointment, MasterService, AppointmentService, IdempotencyKey, MasterDayStats, ScheduleVersion]
+
+# Изменение сводки: строки (master_id, day, appointments, cancelled, revenue, service_minutes)
+# из SELECT прибавляются к существующим. WHERE обязателен: без него SQLite не разбирает ON CONFLICT после SELECT
+STATS_UPSERT = """
+INSERT INTO masterdaystats (master_id, day, appointments, cancelled, revenue, service_minutes)
+{select}
+ON CONFLICT (master_id, day) DO UPDATE SET
+    appointments = appointments + excluded.appointments,
+    cancelled = cancelled + excluded.cancelled,
+    revenue = revenue + excluded.revenue,
+    service_minutes = service_minutes + excluded.service_minutes;
+"""
+
+# Вклад записи {row} (NEW или OLD) в сводку со знаком {sign}: услуги учитываются по текущим ценам
+STATS_APPOINTMENT_DELTA = """
+SELECT {row}.master_id, date({row}.date),
+       {sign} * ({row}.status != '{cancelled}'), {sign} * ({row}.status = '{cancelled}'),
+       {sign} * (CASE WHEN {row}.status != '{cancelled}' THEN COALESCE(SUM(s.price), 0) ELSE 0 END),
+       {sign} * (CASE WHEN {row}.status != '{cancelled}' THEN COALESCE(SUM(s.duration), 0) ELSE 0 END)
+FROM (SELECT 1)
+LEFT JOIN appointmentservice AS x ON x.appointment_id = {row}.id
+LEFT JOIN service AS s ON s.id = x.service_id
+WHERE true
+"""
 
+# Вклад услуги строки appointmentservice {row} со знаком {sign}, если запись не отменена.
+# Запись ищется в appointment, поэтому её услуги удаляются раньше неё (см. delete_appointment)
+STATS_SERVICE_DELTA = """
+SELECT a.master_id, date(a.date), 0, 0, {sign} * s.price, {sign} * s.duration
+FROM appointment AS a JOIN service AS s ON s.id = {row}.service_id
+WHERE a.id = {row}.appointment_id AND a.status != '{cancelled}'
+"""
 
+# Изменение цены или длительности услуги для всех неотменённых записей с этой услугой
+STATS_PRICE_DELTA = """
+SELECT a.master_id, date(a.date), 0, 0, COUNT(*) * (NEW.price - OLD.price), COUNT(*) * (NEW.duration - OLD.duration)
+FROM appointmentservice AS x JOIN appointment AS a ON a.id = x.appointment_id
+WHERE x.service_id = NEW.id AND a.status != '{cancelled}'
+GROUP BY a.master_id, date(a.date)
+"""
+
+# День, в котором после удаления или переноса записи не осталось записей, удаляется из сводки
+STATS_CLEANUP = """
+DELETE FROM masterdaystats
+WHERE master_id = OLD.master_id AND day = date(OLD.date) AND appointments = 0 AND cancelled = 0;
+"""
+
+def master_day_stats_triggers():
+    """
+    Возвращает SQL триггеров, которые поддерживают MasterDayStats при любых изменениях записей,
+    их услуг, цен и длительностей услуг (в том числе при массовой вставке и UPDATE ... RETURNING)
+    """
+    def upsert(template, row=None, sign=None):
+        return STATS_UPSERT.format(select=template.format(row=row, sign=sign, cancelled=CANCELLED_STATUS))
+    
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS stats_appointment_insert AFTER INSERT ON appointment BEGIN
+            {upsert(STATS_APPOINTMENT_DELTA, 'NEW', 1)} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS stats_appointment_delete AFTER DELETE ON appointment BEGIN
+            {upsert(STATS_APPOINTMENT_DELTA, 'OLD', -1)} {STATS_CLEANUP} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS stats_appointment_update AFTER UPDATE OF master_id, date, status ON appointment BEGIN
+            {upsert(STATS_APPOINTMENT_DELTA, 'OLD', -1)} {upsert(STATS_APPOINTMENT_DELTA, 'NEW', 1)} {STATS_CLEANUP} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS stats_service_insert AFTER INSERT ON appointmentservice BEGIN
+            {upsert(STATS_SERVICE_DELTA, 'NEW', 1)} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS stats_service_delete AFTER DELETE ON appointmentservice BEGIN
+            {upsert(STATS_SERVICE_DELTA, 'OLD', -1)} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS stats_service_update AFTER UPDATE ON appointmentservice BEGIN
+            {upsert(STATS_SERVICE_DELTA, 'OLD', -1)} {upsert(STATS_SERVICE_DELTA, 'NEW', 1)} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS stats_price_update AFTER UPDATE OF price, duration ON service BEGIN
+            {upsert(STATS_PRICE_DELTA)} END""",
+        """CREATE TRIGGER IF NOT EXISTS stats_master_delete AFTER DELETE ON master BEGIN
+            DELETE FROM masterdaystats WHERE master_id = OLD.id; END""",
+    ]
 
+SCHEDULE_VERSION_BUMP = "UPDATE scheduleversion SET version = version + 1 WHERE id = 1;"
 
-def master_to_dict(master):
+def schedule_version_triggers():
     """
-    Преобразует объект Master в словарь
+    Возвращает SQL триггеров, которые увеличивают ScheduleVersion при изменениях, влияющих на расписания:
+    записи (мастер, время, статус), их услуги и длительности услуг
     """
+    events = [
+        ('appointment_insert', 'INSERT ON appointment'),
+        ('appointment_update', 'UPDATE OF master_id, date, status ON appointment'),
+        ('appointment_delete', 'DELETE ON appointment'),
+        ('service_link_insert', 'INSERT ON appointmentservice'),
+        ('service_link_update', 'UPDATE ON appointmentservice'),
+        ('service_link_delete', 'DELETE ON appointmentservice'),
+        ('service_duration_update', 'UPDATE OF duration ON service'),
+    ]
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS schedule_{name} AFTER {event} BEGIN {SCHEDULE_VERSION_BUMP} END"
+        for name, event in events
+    ]
+
+# Сводка по всей истории записей
+STATS_REBUILD = """
+SELECT a.master_id, date(a.date),
+       SUM(a.status != '{cancelled}'), SUM(a.status = '{cancelled}'),
+       SUM(CASE WHEN a.status != '{cancelled}' THEN COALESCE(t.price, 0) ELSE 0 END),
+       SUM(CASE WHEN a.status != '{cancelled}' THEN COALESCE(t.minutes, 0) ELSE 0 END)
+FROM appointment AS a
+LEFT JOIN (
+    SELECT x.appointment_id, SUM(s.price) AS price, SUM(s.duration) AS minutes
+    FROM appointmentservice AS x JOIN service AS s ON s.id = x.service_id
+    GROUP BY x.appointment_id
+) AS t ON t.appointment_id = a.id
+WHERE true
+GROUP BY a.master_id, date(a.date)
+"""
+
+def rebuild_master_day_stats():
+    """
+    Пересчитывает MasterDayStats по всей истории записей (при миграции или для проверки сводки)
+    """
+    with DB.atomic(WRITE_LOCK):
+        MasterDayStats.delete().execute()
+        DB.execute_sql(STATS_UPSERT.format(select=STATS_REBUILD.format(cancelled=CANCELLED_STATUS)))
+
+def migrate_database():
+    """
+    Приводит существующую базу к текущим моделям: создаёт недостающие таблицы и индексы
+    (CREATE ... IF NOT EXISTS), добавляет длительность услуг, удаляет индекс по master, который заменён составным
+    индексом (master, date), удаляет услуги уже удалённых записей, создаёт триггеры сводки MasterDayStats
+    (и заполняет её, если таблица новая) и счётчика ScheduleVersion и обновляет статистику планировщика запросов
+    """
+    with DB.connection_context():
+        new_stats = not DB.table_exists(MasterDayStats._meta.table_name)
+        DB.create_tables(MODELS, safe=True)
+        if 'duration' not in {column.name for column in DB.get_columns('service')}:
+            migrate(SqliteMigrator(DB.obj).add_column('service', 'duration', Service.duration))
+        DB.execute_sql('DROP INDEX IF EXISTS appointment_master_id')
+        AppointmentService.delete().where(AppointmentService.appointment.not_in(Appointment.select(Appointment.id))).execute()
+        for trigger in master_day_stats_triggers():
+            DB.execute_sql(trigger)
+        if new_stats:
+            rebuild_master_day_stats()
+        ScheduleVersion.insert(id=1, version=0).on_conflict_ignore().execute()
+        for trigger in schedule_version_triggers():
+            DB.execute_sql(trigger)
+        DB.execute_sql('ANALYZE')
+
+
+
+
+
+MASTER_FIELDS = ('id', 'first_name', 'last_name', 'middle_name', 'phone')
+
+def master_to_dict(master, fields=None):
+    """
+    Преобразует объект Master в словарь. fields - только эти поля (см. requested_fields)
+    """
+    if fields is not None:
+        return {name: getattr(master, name) for name in fields}
     return {
         'id': master.id,
         'first_name': master.first_name,
@@ -73,6 +410,138 @@ def appointment_to_dict(appointment):
         'status': appointment.status
     }
 
+def add_services(result, services):
+    """
+    Добавляет в словарь записи список услуг и их общую стоимость
+    """
+    result['services'] = services
+    result['total_price'] = sum((service['price'] for service in services), Decimal(0))
+
+# Колонки, которые выбираются для каждого поля ответа записи
+APPOINTMENT_FIELD_COLUMNS = {
+    'id': (Appointment.id,),
+    'client_name': (Appointment.client_name,),
+    'client_phone': (Appointment.client_phone,),
+    'date': (Appointment.date,),
+    'master': (Master.id.alias('master_id'), Master.first_name.alias('master_first_name'), Master.last_name.alias('master_last_name')),
+    'status': (Appointment.status,),
+}
+APPOINTMENT_FIELDS = tuple(APPOINTMENT_FIELD_COLUMNS)
+APPOINTMENT_COLUMNS = tuple(column for columns in APPOINTMENT_FIELD_COLUMNS.values() for column in columns)
+
+def select_appointment_rows(*conditions, fields=None, sort_by=None):
+    """
+    Строит запрос записей вместе с мастером, выбирающий только колонки из APPOINTMENT_COLUMNS.
+    Строки возвращаются как namedtuple, без создания объектов моделей и без
+    дополнительных запросов за мастером на каждую строку.
+    С fields выбираются только колонки этих полей, а также id и поле сортировки sort_by,
+    которые нужны для курсора; мастер присоединяется, только если он нужен
+    """
+    if fields is None:
+        query = Appointment.select(*APPOINTMENT_COLUMNS).join(Master)
+    else:
+        names = set(fields) | {'id'}
+        if sort_by in APPOINTMENT_FIELD_COLUMNS:
+            names.add(sort_by)
+        columns = [column for name in APPOINTMENT_FIELDS if name in names for column in APPOINTMENT_FIELD_COLUMNS[name]]
+        query = Appointment.select(*columns)
+        if 'master' in names or sort_by == 'master':
+            if 'master' not in names:
+                query = query.select_extend(Master.last_name.alias('master_last_name'))
+            query = query.join(Master)
+    if conditions:
+        query = query.where(*conditions)
+    return query.namedtuples()
+
+# Значения полей ответа записи для строки из select_appointment_rows
+APPOINTMENT_FIELD_VALUES = {
+    'id': lambda row: row.id,
+    'client_name': lambda row: row.client_name,
+    'client_phone': lambda row: row.client_phone,
+    'date': lambda row: row.date.strftime('%Y-%m-%d %H:%M:%S'),
+    'master': lambda row: {'id': row.master_id, 'first_name': row.master_first_name, 'last_name': row.master_last_name},
+    'status': lambda row: row.status,
+}
+
+def appointment_row_to_dict(row, services=None, fields=None):
+    """
+    Преобразует строку из select_appointment_rows в словарь того же вида, что и appointment_to_dict.
+    fields - только эти поля (строка должна быть выбрана с теми же fields)
+    """
+    if fields is not None:
+        result = {name: APPOINTMENT_FIELD_VALUES[name](row) for name in fields}
+        if services is not None:
+            add_services(result, services)
+        return result
+    
+    result = {
+        'id': row.id,
+        'client_name': row.client_name,
+        'client_phone': row.client_phone,
+        'date': row.date.strftime('%Y-%m-%d %H:%M:%S'),
+        'master': {
+            'id': row.master_id,
+            'first_name': row.master_first_name,
+            'last_name': row.master_last_name
+        },
+        'status': row.status
+    }
+    if services is not None:
+        add_services(result, services)
+    return result
+
+# SQLite до 3.32 допускает не больше 999 параметров в запросе,
+# поэтому id записей передаются в IN порциями такого размера
+PREFETCH_CHUNK_SIZE = 999
+
+def prefetch_appointment_services(appointment_ids):
+    """
+    Загружает услуги сразу для всех записей страницы одним запросом с IN
+    (для списков длиннее PREFETCH_CHUNK_SIZE - одним запросом на порцию).
+    Возвращает словарь {id записи: список услуг}; у записей без услуг - пустой список
+    """
+    services = {appointment_id: [] for appointment_id in appointment_ids}
+    for batch in chunked(list(services), PREFETCH_CHUNK_SIZE):
+        query = (AppointmentService
+                 .select(AppointmentService.appointment_id, Service.id, Service.title, Service.price, Service.duration)
+                 .join(Service)
+                 .where(AppointmentService.appointment.in_(batch))
+                 .order_by(AppointmentService.appointment_id, Service.id)
+                 .tuples())
+        for appointment_id, service_id, title, price, duration in query:
+            services[appointment_id].append({'id': service_id, 'title': title, 'price': price, 'duration': duration})
+    return services
+
+def appointment_rows_to_dicts(rows, include_services=False, fields=None):
+    """
+    Преобразует строки из select_appointment_rows в словари. С include_services
+    услуги всех строк загружаются одним запросом (см. prefetch_appointment_services)
+    """
+    rows = list(rows)
+    if not include_services:
+        return [appointment_row_to_dict(row, fields=fields) for row in rows]
+    services = prefetch_appointment_services([row.id for row in rows])
+    return [appointment_row_to_dict(row, services[row.id], fields) for row in rows]
+
+def requested_fields(args, allowed):
+    """
+    Разбирает параметр fields (имена полей через запятую). Возвращает пару
+    (кортеж полей в порядке allowed или None, если параметр не передан; список ошибок)
+    """
+    names = {name.strip() for name in args.get('fields', '').split(',') if name.strip()}
+    if not names:
+        return None, []
+    unknown = names.difference(allowed)
+    if unknown:
+        return None, [f"Неизвестные поля в 'fields': {', '.join(sorted(unknown))}. Доступны: {', '.join(allowed)}"]
+    return tuple(name for name in allowed if name in names), []
+
+def include_services(args):
+    """
+    Нужно ли добавить в ответ услуги записей: параметр include=services
+    """
+    return 'services' in args.get('include', '').split(',')
+
 def validate_master_data(data):
     """
     Проверяет корректность данных для создания/обновления мастера
@@ -105,7 +574,8 @@ def validate_master_data(data):
 
 def validate_appointment_data(data):
     """
-    Проверяет корректность данных для создания/обновления записи
+    Проверяет корректность данных для создания/обновления записи.
+    Существование мастера проверяется при записи, в той же транзакции
     """
     errors = []
     
@@ -125,11 +595,6 @@ def validate_appointment_data(data):
     
     if not data.get('master_id'):
         errors.append("Поле 'master_id' обязательно")
-    else:
-        try:
-            Master.get(Master.id == data['master_id'])
-        except Master.DoesNotExist:
-            errors.append("Мастер с указанным ID не найден")
     
     if data.get('date'):
         try:
@@ -142,41 +607,995 @@ def validate_appointment_data(data):
     
     return errors
 
+def appointment_fields(data):
+    """
+    Собирает значения полей записи из проверенных данных запроса (без мастера).
+    Необязательные поля попадают в словарь, только если они переданы
+    """
+    fields = {
+        'client_name': data['client_name'],
+        'client_phone': data['client_phone']
+    }
+    if data.get('status'):
+        fields['status'] = data['status']
+    if data.get('date'):
+        fields['date'] = datetime.strptime(data['date'], '%Y-%m-%d %H:%M:%S')
+    return fields
+
+def json_default(value):
+    """
+    Сериализует значения, которых нет в JSON: Decimal (цены из DecimalField) становится числом
+    """
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f'Объект типа {type(value).__name__} не сериализуется в JSON')
+
+def stdlib_dumps(data):
+    """
+    Сериализует данные стандартным модулем json в UTF-8 без экранирования кириллицы
+    """
+    return json.dumps(data, ensure_ascii=False, default=json_default).encode('utf-8')
+
+def orjson_dumps(data):
+    """
+    Сериализует данные библиотекой orjson (реализована на Rust, результат уже в UTF-8)
+    """
+    return orjson.dumps(data, default=json_default)
+
+# Доступные сериализаторы. Свой сериализатор можно добавить сюда и выбрать настройкой JSON_ENCODER
+JSON_ENCODERS = {'json': stdlib_dumps}
+if orjson is not None:
+    JSON_ENCODERS['orjson'] = orjson_dumps
+
+def json_encoder(name):
+    """
+    Возвращает функцию сериализации по имени; 'auto' - самую быструю из установленных
+    """
+    if name == 'auto':
+        return JSON_ENCODERS.get('orjson', stdlib_dumps)
+    return JSON_ENCODERS[name]
+
+json_dumps = json_encoder(app.config['JSON_ENCODER'])
+
 def json_response(data, status_code=200):
     """
     Возвращает JSON ответ с корректной кодировкой
     """
-    return json.dumps(data, ensure_ascii=False), status_code, {'Content-Type': 'application/json; charset=utf-8'}
+    return json_dumps(data), status_code, {'Content-Type': 'application/json; charset=utf-8'}
+
+def gzip_stream(chunks, level):
+    """
+    Сжимает потоковый ответ по частям, не собирая его целиком в памяти
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+@app.after_request
+def compress_response(response):
+    """
+    Сжимает ответ gzip, если клиент указал его в Accept-Encoding, а ответ не меньше GZIP_MIN_SIZE байт.
+    Потоковые ответы сжимаются по частям
+    """
+    response.vary.add('Accept-Encoding')
+    if (request.accept_encodings['gzip'] <= 0 or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers or response.direct_passthrough):
+        return response
+    
+    level = app.config['GZIP_LEVEL']
+    if response.is_streamed:
+        response.response = gzip_stream(response.response, level)
+        response.headers.pop('Content-Length', None)
+    else:
+        body = response.get_data()
+        if len(body) < app.config['GZIP_MIN_SIZE']:
+            return response
+        response.set_data(gzip.compress(body, level))
+    
+    response.headers['Content-Encoding'] = 'gzip'
+    # сжатое представление отличается от несжатого, поэтому ETag становится слабым
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+# Границы корзин гистограмм: длительность запроса в секундах и количество SQL-запросов на HTTP-запрос
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+class Histogram:
+    """
+    Гистограмма Prometheus: количество наблюдений по корзинам, их сумма и общее количество
+    """
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value) -> None:
+        # последняя ячейка - корзина +Inf
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name: str, labels: str) -> list:
+        """
+        Строки гистограммы в текстовом формате Prometheus (корзины накопительные).
+        """
+        lines = []
+        cumulative = 0
+        for bound, count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+class Metrics:
+    """
+    Метрики процесса по маршрутам: количество ответов по кодам, гистограммы длительности
+    и числа SQL-запросов, суммарное время SQL. Каждый воркер считает свои метрики,
+    Prometheus собирает их с каждого процесса отдельно
+    """
+    def __init__(self, latency_buckets=LATENCY_BUCKETS, query_buckets=QUERY_COUNT_BUCKETS):
+        self.latency_buckets = latency_buckets
+        self.query_buckets = query_buckets
+        self._lock = threading.Lock()
+        self._responses = {}
+        self._latency = {}
+        self._queries = {}
+        self._sql_seconds = {}
+
+    def observe(self, method: str, route: str, status: int, seconds: float, queries: int, sql_seconds: float) -> None:
+        """
+        Учитывает завершённый запрос.
+        """
+        key = (method, route)
+        with self._lock:
+            self._responses[key + (status,)] = self._responses.get(key + (status,), 0) + 1
+            if key not in self._latency:
+                self._latency[key] = Histogram(self.latency_buckets)
+                self._queries[key] = Histogram(self.query_buckets)
+                self._sql_seconds[key] = 0.0
+            self._latency[key].observe(seconds)
+            self._queries[key].observe(queries)
+            self._sql_seconds[key] += sql_seconds
+
+    def render(self) -> str:
+        """
+        Возвращает метрики в текстовом формате Prometheus.
+        """
+        with self._lock:
+            lines = [
+                '# HELP barbershop_http_responses_total Количество ответов по маршрутам и кодам.',
+                '# TYPE barbershop_http_responses_total counter',
+            ]
+            for (method, route, status), count in sorted(self._responses.items()):
+                lines.append(f'barbershop_http_responses_total{{method="{method}",route="{route}",status="{status}"}} {count}')
+            
+            lines += [
+                '# HELP barbershop_http_request_duration_seconds Длительность обработки запроса.',
+                '# TYPE barbershop_http_request_duration_seconds histogram',
+            ]
+            for (method, route), histogram in sorted(self._latency.items()):
+                lines += histogram.lines('barbershop_http_request_duration_seconds', f'method="{method}",route="{route}"')
+            
+            lines += [
+                '# HELP barbershop_sql_queries_per_request Количество SQL-запросов на один HTTP-запрос.',
+                '# TYPE barbershop_sql_queries_per_request histogram',
+            ]
+            for (method, route), histogram in sorted(self._queries.items()):
+                lines += histogram.lines('barbershop_sql_queries_per_request', f'method="{method}",route="{route}"')
+            
+            lines += [
+                '# HELP barbershop_sql_duration_seconds_total Суммарное время выполнения SQL-запросов.',
+                '# TYPE barbershop_sql_duration_seconds_total counter',
+            ]
+            for (method, route), seconds in sorted(self._sql_seconds.items()):
+                lines.append(f'barbershop_sql_duration_seconds_total{{method="{method}",route="{route}"}} {seconds}')
+        return '\n'.join(lines) + '\n'
+
+METRICS = Metrics()
+
+@app.before_request
+def start_request_timer():
+    """
+    Запоминает время начала запроса для гистограммы длительности
+    """
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def remember_response_status(response):
+    """
+    Запоминает код ответа: teardown_request, где учитывается запрос, ответа не получает
+    """
+    g.response_status = response.status_code
+    return response
+
+@app.teardown_request
+def record_request_metrics(exception):
+    """
+    Учитывает запрос в метриках. Для потоковых ответов вызывается до отдачи первой части,
+    поэтому длительность и SQL-запросы не включают чтение самого потока
+    """
+    if not app.config['METRICS_ENABLED'] or 'request_started' not in g:
+        return
+    # шаблон маршрута, а не путь: /masters/<int:master_id> вместо /masters/1, /masters/2, ...
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    status = g.get('response_status', 500 if exception is not None else 200)
+    METRICS.observe(request.method, route, status, time.perf_counter() - g.request_started,
+                    g.get('sql_queries', 0), g.get('sql_seconds', 0.0))
+
+APPOINTMENT_SORT_FIELDS = {
+    'date': Appointment.date,
+    'client_name': Appointment.client_name,
+    'status': Appointment.status,
+    'master': Master.last_name,
+}
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 500
+
+def appointment_sort_value(row, sort_by):
+    """
+    Возвращает значение поля сортировки для строки записи (первая часть курсора)
+    """
+    if sort_by == 'master':
+        return row.master_last_name
+    return getattr(row, sort_by)
+
+def encode_cursor(row, sort_by, descending):
+    """
+    Кодирует сортировку и пару (значение поля сортировки, id) последней записи страницы в строку курсора
+    """
+    value = appointment_sort_value(row, sort_by)
+    if isinstance(value, datetime):
+        value = value.isoformat(sep=' ')
+    direction = 'desc' if descending else 'asc'
+    raw = json.dumps([sort_by, direction, value, row.id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor, sort_by, descending):
+    """
+    Декодирует строку курсора в пару (значение поля сортировки, id).
+    Возвращает None, если курсор не передан. Бросает ValueError с текстом ошибки,
+    если курсор некорректен или создан для другой сортировки: значение из него
+    не задаёт позицию в другом порядке записей
+    """
+    if not cursor:
+        return None
+    try:
+        cursor_sort_by, direction, value, appointment_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('Некорректный курсор')
+    if not isinstance(appointment_id, int) or not isinstance(value, str):
+        raise ValueError('Некорректный курсор')
+    if cursor_sort_by != sort_by or direction != ('desc' if descending else 'asc'):
+        raise ValueError('Курсор создан для другой сортировки: передайте те же sort_by и direction')
+    if sort_by == 'date':
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            raise ValueError('Некорректный курсор')
+    return value, appointment_id
+
+def parse_filter_date(value):
+    """
+    Разбирает дату фильтра в формате YYYY-MM-DD HH:MM:SS или YYYY-MM-DD.
+    Возвращает пару (datetime, только ли дата) или бросает ValueError
+    """
+    try:
+        return datetime.strptime(value, '%Y-%m-%d %H:%M:%S'), False
+    except ValueError:
+        return datetime.strptime(value, '%Y-%m-%d'), True
+
+def appointment_filters(args):
+    """
+    Собирает условия WHERE для списка записей из параметров запроса:
+    from, to (дата без времени в 'to' включает весь день), status, master_id, client_phone.
+    Возвращает пару (список условий, список ошибок)
+    """
+    conditions = []
+    errors = []
+    
+    if args.get('from'):
+        try:
+            conditions.append(Appointment.date >= parse_filter_date(args['from'])[0])
+        except ValueError:
+            errors.append("Неверный формат параметра 'from'. Используйте: YYYY-MM-DD или YYYY-MM-DD HH:MM:SS")
+    
+    if args.get('to'):
+        try:
+            date_to, date_only = parse_filter_date(args['to'])
+            if date_only:
+                conditions.append(Appointment.date < date_to + timedelta(days=1))
+            else:
+                conditions.append(Appointment.date <= date_to)
+        except ValueError:
+            errors.append("Неверный формат параметра 'to'. Используйте: YYYY-MM-DD или YYYY-MM-DD HH:MM:SS")
+    
+    if args.get('status'):
+        conditions.append(Appointment.status == args['status'])
+    
+    if args.get('master_id'):
+        try:
+            conditions.append(Appointment.master == int(args['master_id']))
+        except ValueError:
+            errors.append("Параметр 'master_id' должен быть целым числом")
+    
+    if args.get('client_phone'):
+        conditions.append(Appointment.client_phone == args['client_phone'])
+    
+    return conditions, errors
+
+def appointments_page_query(sort_by, descending, cursor=None, conditions=(), fields=None):
+    """
+    Строит запрос записей, упорядоченный по (поле сортировки, id), начиная после курсора.
+    conditions - дополнительные условия фильтрации из appointment_filters, fields - выбираемые поля
+    """
+    sort_field = APPOINTMENT_SORT_FIELDS[sort_by]
+    query = select_appointment_rows(*conditions, fields=fields, sort_by=sort_by)
+    
+    if cursor is not None:
+        value, last_id = cursor
+        # сравнение кортежей (поле, id) SQLite выполняет как один диапазон по индексу
+        if descending:
+            query = query.where(Tuple(sort_field, Appointment.id) < Tuple(value, last_id))
+        else:
+            query = query.where(Tuple(sort_field, Appointment.id) > Tuple(value, last_id))
+    
+    if descending:
+        return query.order_by(sort_field.desc(), Appointment.id.desc())
+    return query.order_by(sort_field.asc(), Appointment.id.asc())
+
+def fetch_appointments_page(sort_by, descending, limit, cursor=None, conditions=(), fields=None):
+    """
+    Возвращает страницу записей и курсор следующей страницы (None, если страница последняя)
+    """
+    appointments = list(appointments_page_query(sort_by, descending, cursor, conditions, fields).limit(limit + 1))
+    if len(appointments) <= limit:
+        return appointments, None
+    appointments = appointments[:limit]
+    return appointments, encode_cursor(appointments[-1], sort_by, descending)
+
+def stream_appointments(sort_by, descending, cursor=None, conditions=(), with_services=False, fields=None):
+    """
+    Генератор JSON-ответа со всеми записями. Записи читаются страницами по
+    STREAM_CHUNK_SIZE, поэтому в памяти одновременно находится только одна страница.
+    С with_services услуги загружаются одним запросом на страницу. Отдаётся через
+    stream_with_connection: страницы читаются уже после закрытия соединения запроса
+    """
+    yield b'{"appointments": ['
+    first = True
+    while True:
+        appointments, next_cursor = fetch_appointments_page(sort_by, descending, STREAM_CHUNK_SIZE, cursor, conditions, fields)
+        if appointments:
+            # страница сериализуется одним списком, от которого отрезаются скобки
+            chunk = json_dumps(appointment_rows_to_dicts(appointments, with_services, fields))[1:-1]
+            yield chunk if first else b', ' + chunk
+            first = False
+        if next_cursor is None:
+            break
+        cursor = decode_cursor(next_cursor, sort_by, descending)
+    yield b']}'
+
+def stream_with_connection(chunks):
+    """
+    Отдаёт части потокового ответа, держа для него собственное соединение с базой (в режиме
+    пула - взятое из пула) от первой до последней части. Соединение запроса к этому моменту
+    уже закрыто в close_db_connection, а курсор потока не должен читать соединение,
+    которое вернулось в пул и досталось другому потоку. chunks - ещё не запущенный генератор:
+    его запросы должны выполняться только при чтении частей
+    """
+    with DB.connection_context():
+        yield from chunks
+
+# Форматы выгрузки записей и их Content-Type
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+EXPORT_CHUNK_SIZE = 1000
+
+# Колонки CSV для каждого поля записи: мастер раскладывается на три колонки
+EXPORT_CSV_COLUMNS = {
+    'id': ('id',),
+    'client_name': ('client_name',),
+    'client_phone': ('client_phone',),
+    'date': ('date',),
+    'master': ('master_id', 'master_first_name', 'master_last_name'),
+    'status': ('status',),
+}
+
+def export_ndjson(rows, fields=None):
+    """
+    Генератор выгрузки в NDJSON: по одной записи в строке, части по EXPORT_CHUNK_SIZE записей
+    """
+    for batch in chunked(rows, EXPORT_CHUNK_SIZE):
+        yield b''.join(json_dumps(appointment_row_to_dict(row, fields=fields)) + b'\n' for row in batch)
+
+def export_csv(rows, fields=None):
+    """
+    Генератор выгрузки в CSV с заголовком, части по EXPORT_CHUNK_SIZE записей
+    """
+    columns = [column for name in (fields or APPOINTMENT_FIELDS) for column in EXPORT_CSV_COLUMNS[name]]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in chunked(rows, EXPORT_CHUNK_SIZE):
+        writer.writerows(
+            [row.date.strftime('%Y-%m-%d %H:%M:%S') if column == 'date' else getattr(row, column) for column in columns]
+            for row in batch
+        )
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+EXPORT_WRITERS = {'ndjson': export_ndjson, 'csv': export_csv}
+
+def export_chunks(query, export_format, fields=None):
+    """
+    Генератор выгрузки записей query в формате export_format. Запрос выполняется при чтении
+    первой части; iterator() не сохраняет прочитанные строки в запросе, в отличие от обычного обхода
+    """
+    yield from EXPORT_WRITERS[export_format](query.iterator(), fields)
+
+BULK_CHUNK_SIZE = 100
+MAX_BULK_SIZE = 10000
+
+def existing_values(field, values):
+    """
+    Возвращает множество значений из values, которые уже есть в колонке field.
+    Значения проверяются порциями по BULK_CHUNK_SIZE, чтобы не превысить лимит параметров SQLite
+    """
+    found = set()
+    for batch in chunked(list(values), BULK_CHUNK_SIZE):
+        found.update(value for (value,) in field.model.select(field).where(field.in_(batch)).tuples())
+    return found
+
+def bulk_payload_errors(data):
+    """
+    Проверяет, что тело bulk-запроса - непустой массив допустимого размера
+    """
+    if not isinstance(data, list) or not data:
+        return ["Ожидается непустой массив объектов"]
+    if len(data) > MAX_BULK_SIZE:
+        return [f"Нельзя передать больше {MAX_BULK_SIZE} объектов за один запрос"]
+    return []
+
+def bulk_insert(model, rows):
+    """
+    Вставляет строки через insert_many порциями по BULK_CHUNK_SIZE в одной транзакции
+    """
+    with DB.atomic(WRITE_LOCK):
+        for batch in chunked(rows, BULK_CHUNK_SIZE):
+            model.insert_many(batch).execute()
+
+class ResponseCache:
+    """
+    Кэш готовых ответов в памяти процесса по пространству имён (например, 'masters') и URL.
+    ETag строится из тела ответа, поэтому после записи он меняется только у тех URL, ответ
+    которых действительно изменился, и одинаков во всех процессах, отдающих одни и те же данные.
+    Запись в данные пространства должна вызывать invalidate, после чего его ответы строятся заново.
+
+    Кэш и invalidate действуют только внутри одного процесса. Если приложение запущено
+    в нескольких процессах (например, несколько воркеров gunicorn), запись в одном из них
+    не сбрасывает кэш остальных: они отдают прежний ответ и 304 на прежний ETag, пока ответ
+    не устареет через RESPONSE_CACHE_TTL секунд. С RESPONSE_CACHE_TTL = 0 ответы
+    не переиспользуются (каждый запрос читает базу), а ETag и 304 продолжают работать
+    """
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._entries = {}
+
+    @staticmethod
+    def etag(body: bytes) -> str:
+        """
+        Строит ETag из тела ответа.
+        """
+        return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+    def version(self, namespace: str) -> int:
+        """
+        Возвращает текущую версию пространства имён.
+        """
+        with self._lock:
+            return self._versions.get(namespace, 0)
+
+    def get(self, namespace: str, key: str, version: int):
+        """
+        Возвращает сохранённый ответ (тело, статус, заголовки, ETag) или None, если его нет,
+        он построен до invalidate или старше RESPONSE_CACHE_TTL секунд.
+        """
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+        if entry is None or entry[0] != version:
+            return None
+        stored_at, response = entry[1], entry[2]
+        if time.monotonic() - stored_at >= app.config['RESPONSE_CACHE_TTL']:
+            return None
+        return response
+
+    def put(self, namespace: str, key: str, version: int, response) -> None:
+        """
+        Сохраняет ответ, построенный при версии version. Ответ, построенный до
+        invalidate, не сохраняется. При переполнении удаляется самый старый ответ.
+        """
+        with self._lock:
+            if self._versions.get(namespace, 0) != version:
+                return
+            self._entries.pop((namespace, key), None)
+            if len(self._entries) >= self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[(namespace, key)] = (version, time.monotonic(), response)
+
+    def invalidate(self, namespace: str) -> None:
+        """
+        Повышает версию пространства имён и удаляет его ответы.
+        """
+        with self._lock:
+            self._versions[namespace] = self._versions.get(namespace, 0) + 1
+            for cache_key in [cache_key for cache_key in self._entries if cache_key[0] == namespace]:
+                del self._entries[cache_key]
+
+RESPONSE_CACHE = ResponseCache()
+
+def cached_response(namespace):
+    """
+    Декоратор для маршрутов, которые редко меняются. Успешные ответы кэшируются по URL
+    и получают ETag из тела ответа; запрос с совпадающим If-None-Match получает 304,
+    а пока ответ есть в кэше - без обращения к базе
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            version = RESPONSE_CACHE.version(namespace)
+            key = request.full_path
+            cached = RESPONSE_CACHE.get(namespace, key, version)
+            if cached is None:
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                body = response.get_data()
+                cached = (body, response.status_code, dict(response.headers), RESPONSE_CACHE.etag(body))
+                RESPONSE_CACHE.put(namespace, key, version, cached)
+            
+            body, status_code, headers, etag = cached
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                response = Response(body, status_code, headers)
+            response.set_etag(etag)
+            return response
+        return wrapper
+    return decorator
+
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+class IdempotencyStore:
+    """
+    Результаты запросов с заголовком Idempotency-Key, сохранённые в таблице IdempotencyKey.
+    Ключ занимается вставкой строки до выполнения запроса, поэтому из двух одновременных
+    повторов выполняется только один, а второй получает 409. Результаты хранятся
+    IDEMPOTENCY_TTL секунд; устаревшие строки удаляются не чаще раза в IDEMPOTENCY_SWEEP_INTERVAL
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    def expired(self, row, now: datetime) -> bool:
+        """
+        Устарел ли результат, или запрос с этим ключом завис (например, воркер упал во время выполнения).
+        """
+        if row.status_code is None:
+            return row.created_at < now - timedelta(seconds=app.config['IDEMPOTENCY_PENDING_TIMEOUT'])
+        return row.created_at < now - timedelta(seconds=app.config['IDEMPOTENCY_TTL'])
+
+    def claim(self, key: str, endpoint: str, request_hash: str):
+        """
+        Занимает ключ для выполнения запроса. Возвращает None, если ключ занят этим вызовом,
+        иначе строку с сохранённым результатом или с ещё выполняющимся запросом.
+        """
+        now = datetime.now()
+        for _ in range(2):
+            try:
+                IdempotencyKey.insert(key=key, endpoint=endpoint, request_hash=request_hash, created_at=now).execute()
+                return None
+            except IntegrityError:
+                row = IdempotencyKey.get_or_none((IdempotencyKey.key == key) & (IdempotencyKey.endpoint == endpoint))
+                if row is not None and not self.expired(row, now):
+                    return row
+                if row is not None:
+                    IdempotencyKey.delete().where(IdempotencyKey.id == row.id).execute()
+        return IdempotencyKey.get((IdempotencyKey.key == key) & (IdempotencyKey.endpoint == endpoint))
+
+    def complete(self, key: str, endpoint: str, response) -> None:
+        """
+        Сохраняет ответ для повторов с тем же ключом.
+        """
+        (IdempotencyKey
+         .update(status_code=response.status_code, content_type=response.content_type, body=response.get_data())
+         .where((IdempotencyKey.key == key) & (IdempotencyKey.endpoint == endpoint))
+         .execute())
+
+    def release(self, key: str, endpoint: str) -> None:
+        """
+        Освобождает ключ после ошибки сервера, чтобы повтор выполнил запрос заново.
+        """
+        (IdempotencyKey
+         .delete()
+         .where((IdempotencyKey.key == key) & (IdempotencyKey.endpoint == endpoint) & IdempotencyKey.status_code.is_null())
+         .execute())
+
+    def sweep(self) -> None:
+        """
+        Удаляет результаты старше IDEMPOTENCY_TTL, если с прошлой очистки прошло достаточно времени.
+        """
+        with self._lock:
+            if time.monotonic() - self._last_sweep < app.config['IDEMPOTENCY_SWEEP_INTERVAL']:
+                return
+            self._last_sweep = time.monotonic()
+        deadline = datetime.now() - timedelta(seconds=app.config['IDEMPOTENCY_TTL'])
+        IdempotencyKey.delete().where(IdempotencyKey.created_at < deadline).execute()
+
+IDEMPOTENCY = IdempotencyStore()
+
+def idempotent(view):
+    """
+    Декоратор для маршрутов создания. Запрос с заголовком Idempotency-Key выполняется один раз:
+    повтор с тем же ключом и телом получает сохранённый ответ (с заголовком Idempotent-Replayed)
+    без повторной проверки и записи в базу. Ответы 5xx не сохраняются
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if key is None:
+            return view(*args, **kwargs)
+        if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return json_response({'error': f'Заголовок Idempotency-Key должен содержать от 1 до {IDEMPOTENCY_KEY_MAX_LENGTH} символов'}, 400)
+        
+        endpoint = f'{request.method} {request.path}'
+        request_hash = hashlib.sha256(request.get_data()).hexdigest()
+        IDEMPOTENCY.sweep()
+        row = IDEMPOTENCY.claim(key, endpoint, request_hash)
+        if row is not None:
+            if row.request_hash != request_hash:
+                return json_response({'error': 'Ключ Idempotency-Key уже использован для другого запроса'}, 422)
+            if row.status_code is None:
+                return json_response({'error': 'Запрос с этим Idempotency-Key ещё выполняется'}, 409)
+            response = Response(bytes(row.body), row.status_code, {'Content-Type': row.content_type})
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+        
+        try:
+            response = app.make_response(view(*args, **kwargs))
+        except Exception:
+            IDEMPOTENCY.release(key, endpoint)
+            raise
+        if response.status_code >= 500:
+            IDEMPOTENCY.release(key, endpoint)
+        else:
+            IDEMPOTENCY.complete(key, endpoint, response)
+        return response
+    return wrapper
+
+CANCELLED_STATUS = 'cancelled'
+
+class BookingConflict(Exception):
+    """
+    Время записи пересекается с другой записью того же мастера.
+    """
+
+class MasterSchedule:
+    """
+    Занятые интервалы одного мастера, отсортированные по началу. Интервалы могут пересекаться
+    (старые записи и записи, созданные без проверки), поэтому назад от позиции бинарного поиска
+    просматриваются все интервалы, которые начинаются не раньше start - max_length: более ранний
+    интервал не может дотянуться до start. При записях обычной длительности это один-два интервала,
+    и проверка остаётся O(log n)
+    """
+    def __init__(self, intervals):
+        intervals = sorted(intervals)
+        self._starts = [start for start, end, appointment_id in intervals]
+        self._intervals = intervals
+        self._by_id = {appointment_id: (start, end) for start, end, appointment_id in intervals}
+        # самая большая длительность интервала; при удалении не уменьшается, что только расширяет просмотр
+        self._max_length = max((end - start for start, end, appointment_id in intervals), default=timedelta(0))
+
+    def interval(self, appointment_id):
+        """
+        Возвращает интервал (начало, конец) записи или None.
+        """
+        return self._by_id.get(appointment_id)
+
+    def appointment_ids(self):
+        """
+        Возвращает id всех записей расписания.
+        """
+        return list(self._by_id)
+
+    def conflict(self, start, end, ignore_id=None):
+        """
+        Возвращает id записи, пересекающейся с интервалом [start, end), или None.
+        Запись ignore_id (например, переносимая) не учитывается.
+        """
+        position = bisect.bisect_left(self._starts, start)
+        index = position - 1
+        while index >= 0 and self._starts[index] > start - self._max_length:
+            interval_end, appointment_id = self._intervals[index][1:]
+            if appointment_id != ignore_id and interval_end > start:
+                return appointment_id
+            index -= 1
+        # интервалы отсортированы по началу: достаточно первого, начинающегося не раньше start
+        for index in range(position, len(self._intervals)):
+            interval_start, interval_end, appointment_id = self._intervals[index]
+            if appointment_id == ignore_id:
+                continue
+            return appointment_id if interval_start < end else None
+        return None
+
+    def add(self, start, end, appointment_id):
+        """
+        Добавляет интервал записи.
+        """
+        position = bisect.bisect_left(self._starts, start)
+        self._starts.insert(position, start)
+        self._intervals.insert(position, (start, end, appointment_id))
+        self._by_id[appointment_id] = (start, end)
+        self._max_length = max(self._max_length, end - start)
+
+    def remove(self, appointment_id):
+        """
+        Удаляет интервал записи, если он есть.
+        """
+        interval = self._by_id.pop(appointment_id, None)
+        if interval is None:
+            return
+        position = bisect.bisect_left(self._starts, interval[0])
+        while self._intervals[position][2] != appointment_id:
+            position += 1
+        del self._starts[position]
+        del self._intervals[position]
+
+    def free_windows(self, date_from, date_to, duration):
+        """
+        Возвращает свободные промежутки внутри [date_from, date_to) длиной не меньше duration.
+        Просматриваются только интервалы, которые могут задеть запрошенный диапазон.
+        """
+        windows = []
+        free_from = date_from
+        position = bisect.bisect_right(self._starts, date_from - self._max_length)
+        for start, end, appointment_id in self._intervals[position:]:
+            if start >= date_to:
+                break
+            if end <= free_from:
+                continue
+            if start - free_from >= duration:
+                windows.append((free_from, start))
+            free_from = max(free_from, end)
+        if date_to - free_from >= duration:
+            windows.append((free_from, date_to))
+        return windows
+
+class ScheduleRegistry:
+    """
+    Расписания мастеров в памяти процесса. Расписание строится одним запросом при первом
+    обращении и дальше поддерживается обработчиками записи. Проверка и изменение расписания
+    вместе с транзакцией выполняются под lock, чтобы два запроса не заняли одно время.
+    Записи других процессов и изменения в обход приложения видны по ScheduleVersion:
+    revalidate сбрасывает все расписания, если версия в базе отличается от версии, при которой
+    они построены. Обработчики записи проверяют её в начале своей транзакции (см. transaction)
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._schedules = {}
+        self._owners = {}
+        # версия ScheduleVersion, которой соответствуют расписания; None - неизвестна
+        self._version = None
+        # мастера, расписания которых загружены в текущей транзакции transaction
+        self._loaded = None
+
+    def loaded(self, master_id) -> bool:
+        """
+        Проверяет, загружено ли расписание мастера.
+        """
+        with self.lock:
+            return master_id in self._schedules
+
+    @staticmethod
+    def database_version():
+        """
+        Возвращает текущее значение ScheduleVersion или None, если база ещё не мигрирована.
+        """
+        return ScheduleVersion.select(ScheduleVersion.version).where(ScheduleVersion.id == 1).scalar()
+
+    def revalidate(self):
+        """
+        Сбрасывает все расписания, если с момента их построения расписания в базе изменились.
+        """
+        with self.lock:
+            version = self.database_version()
+            if version is None or version != self._version:
+                self.invalidate()
+                self._version = version
+
+    @contextmanager
+    def transaction(self):
+        """
+        Транзакция записи (BEGIN IMMEDIATE) под lock. В начале расписания сверяются с базой
+        (revalidate), в конце, ещё до commit, запоминается версия вместе с изменениями этой транзакции:
+        пока транзакция держит блокировку записи, другие процессы базу не меняют. Если транзакция
+        откатилась, расписания, загруженные внутри неё, сбрасываются, а версия остаётся прежней.
+        Изменения расписаний (place, remove) выполняются после транзакции, пока lock ещё удерживается
+        """
+        with self.lock:
+            self._loaded = set()
+            version = self._version
+            try:
+                with DB.atomic(WRITE_LOCK):
+                    self.revalidate()
+                    version = self._version
+                    yield
+                    self._version = self.database_version()
+            except BaseException:
+                for master_id in self._loaded:
+                    self.invalidate(master_id)
+                self._version = version
+                raise
+            finally:
+                self._loaded = None
+
+    def schedule(self, master_id) -> MasterSchedule:
+        """
+        Возвращает расписание мастера, при необходимости загружая его из базы. Если запись
+        из базы ещё числится в расписании другого мастера (её перенесли), прежний интервал убирается.
+        """
+        with self.lock:
+            if master_id not in self._schedules:
+                schedule = MasterSchedule(load_master_intervals(master_id))
+                self._schedules[master_id] = schedule
+                if self._loaded is not None:
+                    self._loaded.add(master_id)
+                for appointment_id in schedule.appointment_ids():
+                    owner = self._owners.get(appointment_id)
+                    if owner is not None and owner != master_id:
+                        self._schedules[owner].remove(appointment_id)
+                    self._owners[appointment_id] = master_id
+            return self._schedules[master_id]
+
+    def duration(self, appointment_id):
+        """
+        Возвращает длительность записи по её интервалу в расписании или None.
+        """
+        with self.lock:
+            master_id = self._owners.get(appointment_id)
+            if master_id is None:
+                return None
+            start, end = self._schedules[master_id].interval(appointment_id)
+            return end - start
+
+    def place(self, appointment_id, master_id, start, end):
+        """
+        Ставит запись в расписание мастера, убирая её прежний интервал.
+        """
+        with self.lock:
+            self.remove(appointment_id)
+            self.schedule(master_id).add(start, end, appointment_id)
+            self._owners[appointment_id] = master_id
+
+    def remove(self, appointment_id):
+        """
+        Убирает запись из расписания.
+        """
+        with self.lock:
+            master_id = self._owners.pop(appointment_id, None)
+            if master_id is not None:
+                self._schedules[master_id].remove(appointment_id)
+
+    def invalidate(self, master_id=None):
+        """
+        Сбрасывает расписание мастера (или все расписания); оно будет загружено заново.
+        """
+        with self.lock:
+            if master_id is None:
+                self._version = None
+            master_ids = [master_id] if master_id is not None else list(self._schedules)
+            for key in master_ids:
+                schedule = self._schedules.pop(key, None)
+                if schedule is not None:
+                    for appointment_id in schedule.appointment_ids():
+                        self._owners.pop(appointment_id, None)
+
+SCHEDULES = ScheduleRegistry()
+
+def default_duration():
+    """
+    Длительность записи без услуг
+    """
+    return timedelta(minutes=app.config['APPOINTMENT_DEFAULT_DURATION'])
+
+def load_master_intervals(master_id):
+    """
+    Загружает интервалы неотменённых записей мастера. Длительность записи - сумма длительностей
+    её услуг или APPOINTMENT_DEFAULT_DURATION, если услуг нет
+    """
+    minutes = fn.COALESCE(fn.SUM(Service.duration), app.config['APPOINTMENT_DEFAULT_DURATION'])
+    query = (Appointment
+             .select(Appointment.id, Appointment.date, minutes.alias('minutes'))
+             .join(AppointmentService, JOIN.LEFT_OUTER, on=(AppointmentService.appointment == Appointment.id))
+             .join(Service, JOIN.LEFT_OUTER, on=(AppointmentService.service == Service.id))
+             .where((Appointment.master == master_id) & (Appointment.status != CANCELLED_STATUS))
+             .group_by(Appointment.id)
+             .tuples())
+    return [(date, date + timedelta(minutes=minutes), appointment_id) for appointment_id, date, minutes in query]
+
+def appointment_duration(appointment_id):
+    """
+    Возвращает длительность существующей записи: из расписания, если оно загружено, иначе из базы
+    """
+    duration = SCHEDULES.duration(appointment_id)
+    if duration is not None:
+        return duration
+    minutes = (Service
+               .select(fn.SUM(Service.duration))
+               .join(AppointmentService)
+               .where(AppointmentService.appointment == appointment_id)
+               .scalar())
+    return timedelta(minutes=minutes) if minutes else default_duration()
 
 
 
 
 @app.route('/masters', methods=['GET'])
+@cached_response('masters')
 def get_masters():
     """
-    Получить список всех мастеров
+    Получить список всех мастеров (с параметром fields - только указанные поля)
     """
     try:
-        masters = Master.select()
-        masters_list = [master_to_dict(master) for master in masters]
+        fields, errors = requested_fields(request.args, MASTER_FIELDS)
+        if errors:
+            return json_response({'errors': errors}, 400)
+        
+        columns = [getattr(Master, name) for name in fields] if fields is not None else []
+        masters = Master.select(*columns).namedtuples()
+        masters_list = [master_to_dict(master, fields) for master in masters]
         return json_response({'masters': masters_list})
     except Exception as e:
         return json_response({'error': f'Внутренняя ошибка сервера: {str(e)}'}, 500)
 
 @app.route('/masters/<int:master_id>', methods=['GET'])
+@cached_response('masters')
 def get_master(master_id):
     """
-    Получить информацию о мастере по ID
+    Получить информацию о мастере по ID (с параметром fields - только указанные поля)
     """
     try:
-        master = Master.get(Master.id == master_id)
-        return json_response({'master': master_to_dict(master)})
+        fields, errors = requested_fields(request.args, MASTER_FIELDS)
+        if errors:
+            return json_response({'errors': errors}, 400)
+        
+        columns = [getattr(Master, name) for name in fields] if fields is not None else []
+        master = Master.select(*columns).where(Master.id == master_id).get()
+        return json_response({'master': master_to_dict(master, fields)})
     except Master.DoesNotExist:
         return json_response({'error': 'Мастер не найден'}, 404)
     except Exception as e:
         return json_response({'error': f'Внутренняя ошибка сервера: {str(e)}'}, 500)
 
 @app.route('/masters', methods=['POST'])
+@idempotent
 def create_master():
     """
     Добавить нового мастера
@@ -200,11 +1619,113 @@ def create_master():
             middle_name=data.get('middle_name'),
             phone=data['phone']
         )
+        RESPONSE_CACHE.invalidate('masters')
         
         return json_response({'master': master_to_dict(master)}, 201)
     except Exception as e:
         return json_response({'error': f'Внутренняя ошибка сервера: {str(e)}'}, 500)
 
+@app.route('/masters/bulk', methods=['POST'])
+def create_masters_bulk():
+    """
+    Добавить массив мастеров одной транзакцией.
+    Если хотя бы один мастер некорректен, ничего не добавляется и возвращаются ошибки по индексам
+    """
+    try:
+        data = request.get_json(silent=True)
+        errors = bulk_payload_errors(data)
+        
+        if errors:
+            return json_response({'errors': errors}, 400)
+        
+        row_errors = [validate_master_data(item) if isinstance(item, dict) else ["Ожидается объект"] for item in data]
+        
+        with DB.atomic(WRITE_LOCK):
+            # телефоны проверяются в той же транзакции, что и вставка: телефон, добавленный
+            # между проверкой и вставкой, дал бы ошибку уникальности вместо ответа 400
+            phones = [item['phone'] for item, errors in zip(data, row_errors) if not errors]
+            taken = existing_values(Master.phone, set(phones))
+            
+            seen = set()
+            for item, errors in zip(data, row_errors):
+                if errors:
+                    continue
+                if item['phone'] in taken:
+                    errors.append('Мастер с таким телефоном уже существует')
+                elif item['phone'] in seen:
+                    errors.append('Телефон повторяется в запросе')
+                seen.add(item['phone'])
+            
+            failed = [{'index': index, 'errors': errors} for index, errors in enumerate(row_errors) if errors]
+            if failed:
+                return json_response({'errors': failed}, 400)
+            
+            rows = [{
+                'first_name': item['first_name'],
+                'last_name': item['last_name'],
+                'middle_name': item.get('middle_name'),
+                'phone': item['phone']
+            } for item in data]
+            bulk_insert(Master, rows)
+        RESPONSE_CACHE.invalidate('masters')
+        
+        return json_response({'created': len(rows)}, 201)
+    except Exception as e:
+        return json_response({'error': f'Внутренняя ошибка сервера: {str(e)}'}, 500)
+
+@app.route('/masters/<int:master_id>/free-slots', methods=['GET'])
+def get_free_slots(master_id):
+    """
+    Получить свободное время мастера: промежутки внутри from - to (по умолчанию неделя
+    от текущего момента), в которые помещается запись длительностью duration минут
+    """
+    try:
+        if not Master.select().where(Master.id == master_id).exists():
+            return json_response({'error': 'Мастер не найден'}, 404)
+        
+        errors = []
+        date_from = datetime.now().replace(second=0, microsecond=0)
+        if request.args.get('from'):
+            try:
+                date_from = parse_filter_date(request.args['from'])[0]
+            except ValueError:
+                errors.append("Неверный формат параметра 'from'. Используйте: YYYY-MM-DD или YYYY-MM-DD HH:MM:SS")
+        
+        date_to = date_from + timedelta(days=7)
+        if request.args.get('to'):
+            try:
+                date_to, date_only = parse_filter_date(request.args['to'])
+                if date_only:
+                    date_to += timedelta(days=1)
+            except ValueError:
+                errors.append("Неверный формат параметра 'to'. Используйте: YYYY-MM-DD или YYYY-MM-DD HH:MM:SS")
+        
+        try:
+            duration = int(request.args.get('duration', app.config['APPOINTMENT_DEFAULT_DURATION']))
+            if duration < 1:
+                raise ValueError(duration)
+        except ValueError:
+            errors.append("Параметр 'duration' должен быть положительным целым числом минут")
+        
+        if not errors and date_to <= date_from:
+            errors.append("Параметр 'to' должен быть позже 'from'")
+        if errors:
+            return json_response({'errors': errors}, 400)
+        
+        with SCHEDULES.lock:
+            SCHEDULES.revalidate()
+            windows = SCHEDULES.schedule(master_id).free_windows(date_from, date_to, timedelta(minutes=duration))
+        return json_response({
+            'master_id': master_id,
+            'duration': duration,
+            'free_slots': [
+                {'from': start.strftime('%Y-%m-%d %H:%M:%S'), 'to': end.strftime('%Y-%m-%d %H:%M:%S')}
+                for start, end in windows
+            ]
+        })
+    except Exception as e:
+        return json_response({'error': f'Внутренняя ошибка сервера: {str(e)}'}, 500)
+
 @app.route('/masters/<int:master_id>', methods=['PUT'])
 def update_master(master_id):
     """
@@ -230,6 +1751,7 @@ def update_master(master_id):
         master.middle_name = data.get('middle_name')
         master.phone = data['phone']
         master.save()
+        RESPONSE_CACHE.invalidate('masters')
         
         return json_response({'master': master_to_dict(master)})
     except Master.DoesNotExist:
@@ -250,6 +1772,8 @@ def delete_master(master_id):
             return json_response({'error': 'Нельзя удалить мастера, у которого есть записи'}, 400)
         
         master.delete_instance()
+        RESPONSE_CACHE.invalidate('masters')
+        SCHEDULES.invalidate(master_id)
         return '', 204
     except Master.DoesNotExist:
         return json_response({'error': 'Мастер не найден'}, 404)
@@ -259,44 +1783,96 @@ def delete_master(master_id):
 @app.route('/appointments', methods=['GET'])
 def get_appointments():
     """
-    Получить все записи на услуги с опциональной сортировкой
+    Получить все записи на услуги с опциональной сортировкой и фильтрами
+    (from, to, status, master_id, client_phone).
+    С параметрами limit/cursor возвращает одну страницу (keyset-пагинация),
+    с параметром stream=1 отдаёт весь список по частям.
+    С параметром include=services добавляет услуги и общую стоимость каждой записи,
+    с параметром fields возвращает только указанные поля.
     """
     try:
-        query = Appointment.select().join(Master)
+        with_services = include_services(request.args)
+        fields, errors = requested_fields(request.args, APPOINTMENT_FIELDS)
+        conditions, filter_errors = appointment_filters(request.args)
+        errors += filter_errors
+        if errors:
+            return json_response({'errors': errors}, 400)
         
         sort_by = request.args.get('sort_by', 'date')
-        direction = request.args.get('direction', 'asc')
-        
-        sort_field = None
-        if sort_by == 'date':
-            sort_field = Appointment.date
-        elif sort_by == 'client_name':
-            sort_field = Appointment.client_name
-        elif sort_by == 'status':
-            sort_field = Appointment.status
-        elif sort_by == 'master':
-            sort_field = Master.last_name
-        else:
-            sort_field = Appointment.date
+        if sort_by not in APPOINTMENT_SORT_FIELDS:
+            sort_by = 'date'
+        descending = request.args.get('direction', 'asc').lower() == 'desc'
         
-        if direction.lower() == 'desc':
-            query = query.order_by(sort_field.desc())
-        else:
-            query = query.order_by(sort_field.asc())
+        try:
+            cursor = decode_cursor(request.args.get('cursor'), sort_by, descending)
+        except ValueError as e:
+            return json_response({'error': str(e)}, 400)
         
-        appointments_list = [appointment_to_dict(appointment) for appointment in query]
-        return json_response({'appointments': appointments_list})
+        if request.args.get('stream') in ('1', 'true'):
+            chunks = stream_appointments(sort_by, descending, cursor, conditions, with_services, fields)
+            return Response(stream_with_context(stream_with_connection(chunks)), 200,
+                            {'Content-Type': 'application/json; charset=utf-8'})
+        
+        if request.args.get('limit') is None and cursor is None:
+            query = appointments_page_query(sort_by, descending, conditions=conditions, fields=fields)
+            appointments_list = appointment_rows_to_dicts(query, with_services, fields)
+            return json_response({'appointments': appointments_list})
+        
+        try:
+            limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+        except ValueError:
+            return json_response({'error': "Параметр 'limit' должен быть целым числом"}, 400)
+        if limit < 1 or limit > MAX_PAGE_SIZE:
+            return json_response({'error': f"Параметр 'limit' должен быть от 1 до {MAX_PAGE_SIZE}"}, 400)
+        
+        appointments, next_cursor = fetch_appointments_page(sort_by, descending, limit, cursor, conditions, fields)
+        appointments_list = appointment_rows_to_dicts(appointments, with_services, fields)
+        return json_response({'appointments': appointments_list, 'next_cursor': next_cursor})
+    except Exception as e:
+        return json_response({'error': f'Внутренняя ошибка сервера: {str(e)}'}, 500)
+
+@app.route('/appointments/export', methods=['GET'])
+def export_appointments():
+    """
+    Выгрузить все записи в формате format=ndjson (по умолчанию) или csv, упорядоченные по id.
+    Поддерживает те же фильтры и параметр fields, что и список записей.
+    Строки читаются курсором базы (iterator) и отдаются по мере чтения,
+    поэтому память не зависит от количества записей
+    """
+    try:
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return json_response({'error': f"Параметр 'format' должен быть одним из: {', '.join(EXPORT_FORMATS)}"}, 400)
+        
+        fields, errors = requested_fields(request.args, APPOINTMENT_FIELDS)
+        conditions, filter_errors = appointment_filters(request.args)
+        errors += filter_errors
+        if errors:
+            return json_response({'errors': errors}, 400)
+        
+        query = select_appointment_rows(*conditions, fields=fields).order_by(Appointment.id)
+        chunks = export_chunks(query, export_format, fields)
+        headers = {
+            'Content-Type': EXPORT_FORMATS[export_format],
+            'Content-Disposition': f'attachment; filename=appointments.{export_format}',
+        }
+        return Response(stream_with_context(stream_with_connection(chunks)), 200, headers)
     except Exception as e:
         return json_response({'error': f'Внутренняя ошибка сервера: {str(e)}'}, 500)
 
 @app.route('/appointments/<int:appointment_id>', methods=['GET'])
 def get_appointment(appointment_id):
     """
-    Получить запись по ID
+    Получить запись по ID (с параметром include=services - вместе с услугами,
+    с параметром fields - только указанные поля)
     """
     try:
-        appointment = Appointment.select().join(Master).where(Appointment.id == appointment_id).get()
-        return json_response({'appointment': appointment_to_dict(appointment)})
+        fields, errors = requested_fields(request.args, APPOINTMENT_FIELDS)
+        if errors:
+            return json_response({'errors': errors}, 400)
+        
+        row = select_appointment_rows(Appointment.id == appointment_id, fields=fields).get()
+        return json_response({'appointment': appointment_rows_to_dicts([row], include_services(request.args), fields)[0]})
     except Appointment.DoesNotExist:
         return json_response({'error': 'Запись не найдена'}, 404)
     except Exception as e:
@@ -305,13 +1881,18 @@ def get_appointment(appointment_id):
 @app.route('/appointments/master/<int:master_id>', methods=['GET'])
 def get_appointments_by_master(master_id):
     """
-    Получить все записи для заданного мастера
+    Получить все записи для заданного мастера (с параметром include=services - вместе с услугами,
+    с параметром fields - только указанные поля)
     """
     try:
+        fields, errors = requested_fields(request.args, APPOINTMENT_FIELDS)
+        if errors:
+            return json_response({'errors': errors}, 400)
+        
         Master.get(Master.id == master_id)
         
-        appointments = Appointment.select().join(Master).where(Appointment.master == master_id)
-        appointments_list = [appointment_to_dict(appointment) for appointment in appointments]
+        appointments = select_appointment_rows(Appointment.master == master_id, fields=fields)
+        appointments_list = appointment_rows_to_dicts(appointments, include_services(request.args), fields)
         return json_response({'appointments': appointments_list})
     except Master.DoesNotExist:
         return json_response({'error': 'Мастер не найден'}, 404)
@@ -319,6 +1900,7 @@ def get_appointments_by_master(master_id):
         return json_response({'error': f'Внутренняя ошибка сервера: {str(e)}'}, 500)
 
 @app.route('/appointments', methods=['POST'])
+@idempotent
 def create_appointment():
     """
     Создать новую запись
@@ -330,25 +1912,99 @@ def create_appointment():
         if errors:
             return json_response({'errors': errors}, 400)
         
-        master = Master.get(Master.id == data['master_id'])
+        fields = appointment_fields(data)
+        start = fields.setdefault('date', datetime.now())
+        end = start + default_duration()
+        active = fields.get('status') != CANCELLED_STATUS
         
-        appointment_data = {
-            'client_name': data['client_name'],
-            'client_phone': data['client_phone'],
-            'master': master,
-            'status': data.get('status', 'pending')
-        }
+        with SCHEDULES.lock:
+            with SCHEDULES.transaction():
+                master = Master.get_or_none(Master.id == data['master_id'])
+                if master is None:
+                    return json_response({'errors': ["Мастер с указанным ID не найден"]}, 400)
+                
+                if active and SCHEDULES.schedule(master.id).conflict(start, end) is not None:
+                    return json_response({'error': 'Мастер занят в это время'}, 409)
+                
+                appointment = Appointment.create(master=master, **fields)
+            
+            if active:
+                SCHEDULES.place(appointment.id, master.id, start, end)
         
-        if data.get('date'):
-            appointment_data['date'] = datetime.strptime(data['date'], '%Y-%m-%d %H:%M:%S')
+        # мастер уже загружен, поэтому сериализация не делает дополнительных запросов
+        return json_response({'appointment': appointment_to_dict(appointment)}, 201)
+    except Exception as e:
+        return json_response({'error': f'Внутренняя ошибка сервера: {str(e)}'}, 500)
+
+@app.route('/appointments/bulk', methods=['POST'])
+def create_appointments_bulk():
+    """
+    Создать массив записей одной транзакцией.
+    Если хотя бы одна запись некорректна (400) или время мастера занято (409),
+    ничего не создаётся и возвращаются ошибки по индексам.
+    Поле date обязательно: записи без времени получили бы одно и то же текущее время
+    и пересекались бы друг с другом
+    """
+    try:
+        data = request.get_json(silent=True)
+        errors = bulk_payload_errors(data)
         
-        appointment = Appointment.create(**appointment_data)
+        if errors:
+            return json_response({'errors': errors}, 400)
         
-        appointment_with_master = Appointment.select().join(Master).where(Appointment.id == appointment.id).get()
+        row_errors = [validate_appointment_data(item) if isinstance(item, dict) else ["Ожидается объект"] for item in data]
+        master_ids = [None] * len(data)
+        for index, (item, errors) in enumerate(zip(data, row_errors)):
+            if errors:
+                continue
+            if not item.get('date'):
+                errors.append("Поле 'date' обязательно для массового создания записей")
+            try:
+                master_ids[index] = int(item['master_id'])
+            except (TypeError, ValueError):
+                errors.append("Поле 'master_id' должно быть целым числом")
         
-        return json_response({'appointment': appointment_to_dict(appointment_with_master)}, 201)
-    except Master.DoesNotExist:
-        return json_response({'error': 'Мастер не найден'}, 400)
+        failed = [{'index': index, 'errors': errors} for index, errors in enumerate(row_errors) if errors]
+        if failed:
+            return json_response({'errors': failed}, 400)
+        
+        rows = []
+        for item, master_id in zip(data, master_ids):
+            row = {'master': master_id, 'status': 'pending'}
+            row.update(appointment_fields(item))
+            rows.append(row)
+        
+        with SCHEDULES.lock:
+            with SCHEDULES.transaction():
+                # мастера проверяются в той же транзакции, что и вставка: удалённый между
+                # проверкой и вставкой мастер дал бы ошибку внешнего ключа вместо ответа 400
+                known_masters = existing_values(Master.id, set(master_ids))
+                failed = [{'index': index, 'errors': ["Мастер с указанным ID не найден"]}
+                          for index, master_id in enumerate(master_ids) if master_id not in known_masters]
+                if failed:
+                    return json_response({'errors': failed}, 400)
+                
+                # время проверяется и по расписаниям, и между записями самого массива
+                batch_schedules = {}
+                for index, row in enumerate(rows):
+                    if row['status'] == CANCELLED_STATUS:
+                        continue
+                    start, end = row['date'], row['date'] + default_duration()
+                    batch_schedule = batch_schedules.setdefault(row['master'], MasterSchedule([]))
+                    if (SCHEDULES.schedule(row['master']).conflict(start, end) is not None
+                            or batch_schedule.conflict(start, end) is not None):
+                        failed.append({'index': index, 'errors': ['Мастер занят в это время']})
+                    else:
+                        batch_schedule.add(start, end, index)
+                # занятое время - конфликт, как и у одиночного POST /appointments
+                if failed:
+                    return json_response({'errors': failed}, 409)
+                
+                bulk_insert(Appointment, rows)
+            for master_id in batch_schedules:
+                SCHEDULES.invalidate(master_id)
+        
+        return json_response({'created': len(rows)}, 201)
     except Exception as e:
         return json_response({'error': f'Внутренняя ошибка сервера: {str(e)}'}, 500)
 
@@ -358,32 +2014,47 @@ def update_appointment(appointment_id):
     Обновить запись
     """
     try:
-        appointment = Appointment.get(Appointment.id == appointment_id)
         data = request.json
         errors = validate_appointment_data(data)
         
         if errors:
             return json_response({'errors': errors}, 400)
         
-        master = Master.get(Master.id == data['master_id'])
+        with SCHEDULES.lock:
+            try:
+                with SCHEDULES.transaction():
+                    master = Master.get_or_none(Master.id == data['master_id'])
+                    if master is None:
+                        return json_response({'errors': ["Мастер с указанным ID не найден"]}, 400)
+                    # расписание загружается до UPDATE, пока в базе запись ещё у прежнего мастера
+                    schedule = SCHEDULES.schedule(master.id)
+                    
+                    query = Appointment.update(master=master, **appointment_fields(data)).where(Appointment.id == appointment_id)
+                    if DB.returning_clause:
+                        updated = list(query.returning(Appointment).execute())
+                    else:
+                        updated = list(Appointment.select().where(Appointment.id == appointment_id)) if query.execute() else []
+                    
+                    # новое время проверяется после UPDATE: исключение откатывает транзакцию
+                    if updated and updated[0].status != CANCELLED_STATUS:
+                        start = updated[0].date
+                        end = start + appointment_duration(appointment_id)
+                        if schedule.conflict(start, end, ignore_id=appointment_id) is not None:
+                            raise BookingConflict(appointment_id)
+            except BookingConflict:
+                return json_response({'error': 'Мастер занят в это время'}, 409)
+            
+            if not updated:
+                return json_response({'error': 'Запись не найдена'}, 404)
+            
+            appointment = updated[0]
+            if appointment.status != CANCELLED_STATUS:
+                SCHEDULES.place(appointment_id, master.id, start, end)
+            else:
+                SCHEDULES.remove(appointment_id)
         
-        appointment.client_name = data['client_name']
-        appointment.client_phone = data['client_phone']
         appointment.master = master
-        appointment.status = data.get('status', appointment.status)
-        
-        if data.get('date'):
-            appointment.date = datetime.strptime(data['date'], '%Y-%m-%d %H:%M:%S')
-        
-        appointment.save()
-        
-        appointment_with_master = Appointment.select().join(Master).where(Appointment.id == appointment_id).get()
-        
-        return json_response({'appointment': appointment_to_dict(appointment_with_master)})
-    except Appointment.DoesNotExist:
-        return json_response({'error': 'Запись не найдена'}, 404)
-    except Master.DoesNotExist:
-        return json_response({'error': 'Мастер не найден'}, 400)
+        return json_response({'appointment': appointment_to_dict(appointment)})
     except Exception as e:
         return json_response({'error': f'Внутренняя ошибка сервера: {str(e)}'}, 500)
 
@@ -393,14 +2064,140 @@ def delete_appointment(appointment_id):
     Удалить запись
     """
     try:
-        appointment = Appointment.get(Appointment.id == appointment_id)
-        appointment.delete_instance()
+        with SCHEDULES.lock:
+            with SCHEDULES.transaction():
+                appointment = Appointment.get(Appointment.id == appointment_id)
+                # услуги удаляются в той же транзакции и до записи: иначе их получила бы новая запись
+                # с тем же id (SQLite выдаёт освободившийся наибольший id повторно)
+                AppointmentService.delete().where(AppointmentService.appointment == appointment_id).execute()
+                appointment.delete_instance()
+            SCHEDULES.remove(appointment_id)
         return '', 204
     except Appointment.DoesNotExist:
         return json_response({'error': 'Запись не найдена'}, 404)
     except Exception as e:
         return json_response({'error': f'Внутренняя ошибка сервера: {str(e)}'}, 500)
 
+STATS_COLUMNS = (
+    fn.SUM(MasterDayStats.appointments).alias('appointments'),
+    fn.SUM(MasterDayStats.cancelled).alias('cancelled'),
+    fn.SUM(MasterDayStats.revenue).alias('revenue'),
+    fn.SUM(MasterDayStats.service_minutes).alias('service_minutes'),
+)
+
+def stats_filters(args):
+    """
+    Собирает условия по дням сводки из параметров from и to (YYYY-MM-DD, обе границы включительно).
+    Возвращает пару (список условий, список ошибок)
+    """
+    conditions = []
+    errors = []
+    for name, operator in (('from', '__ge__'), ('to', '__le__')):
+        if args.get(name):
+            try:
+                day = datetime.strptime(args[name], '%Y-%m-%d').date()
+                conditions.append(getattr(MasterDayStats.day, operator)(day))
+            except ValueError:
+                errors.append(f"Неверный формат параметра '{name}'. Используйте: YYYY-MM-DD")
+    return conditions, errors
+
+def stats_to_dict(row):
+    """
+    Преобразует строку сводки в словарь; пустые суммы становятся нулями
+    """
+    return {
+        'appointments': row.appointments or 0,
+        'cancelled': row.cancelled or 0,
+        'revenue': Decimal(row.revenue or 0),
+        'service_minutes': row.service_minutes or 0,
+    }
+
+@app.route('/stats/days', methods=['GET'])
+def get_stats_by_day():
+    """
+    Получить записи, отмены, выручку и минуты услуг по дням (from, to, master_id) из сводки MasterDayStats
+    """
+    try:
+        conditions, errors = stats_filters(request.args)
+        if request.args.get('master_id'):
+            try:
+                conditions.append(MasterDayStats.master == int(request.args['master_id']))
+            except ValueError:
+                errors.append("Параметр 'master_id' должен быть целым числом")
+        if errors:
+            return json_response({'errors': errors}, 400)
+        
+        query = MasterDayStats.select(MasterDayStats.day, *STATS_COLUMNS)
+        if conditions:
+            query = query.where(*conditions)
+        rows = query.group_by(MasterDayStats.day).order_by(MasterDayStats.day).namedtuples()
+        days = [dict(day=row.day.isoformat(), **stats_to_dict(row)) for row in rows]
+        return json_response({'days': days})
+    except Exception as e:
+        return json_response({'error': f'Внутренняя ошибка сервера: {str(e)}'}, 500)
+
+@app.route('/stats/masters', methods=['GET'])
+def get_stats_by_master():
+    """
+    Получить итоги каждого мастера за период (from, to) из сводки MasterDayStats
+    """
+    try:
+        conditions, errors = stats_filters(request.args)
+        if errors:
+            return json_response({'errors': errors}, 400)
+        
+        query = (MasterDayStats
+                 .select(Master.id, Master.first_name, Master.last_name, *STATS_COLUMNS)
+                 .join(Master))
+        if conditions:
+            query = query.where(*conditions)
+        rows = query.group_by(Master.id).order_by(Master.id).namedtuples()
+        masters = [
+            dict(master={'id': row.id, 'first_name': row.first_name, 'last_name': row.last_name}, **stats_to_dict(row))
+            for row in rows
+        ]
+        return json_response({'masters': masters})
+    except Exception as e:
+        return json_response({'error': f'Внутренняя ошибка сервера: {str(e)}'}, 500)
+
+@app.route('/stats/masters/<int:master_id>', methods=['GET'])
+def get_master_stats(master_id):
+    """
+    Получить сводку мастера по дням и итог за период (from, to)
+    """
+    try:
+        if not Master.select().where(Master.id == master_id).exists():
+            return json_response({'error': 'Мастер не найден'}, 404)
+        
+        conditions, errors = stats_filters(request.args)
+        if errors:
+            return json_response({'errors': errors}, 400)
+        
+        rows = (MasterDayStats
+                .select()
+                .where(MasterDayStats.master == master_id, *conditions)
+                .order_by(MasterDayStats.day)
+                .namedtuples())
+        days = [dict(day=row.day.isoformat(), **stats_to_dict(row)) for row in rows]
+        total = {
+            'appointments': sum(day['appointments'] for day in days),
+            'cancelled': sum(day['cancelled'] for day in days),
+            'revenue': sum((day['revenue'] for day in days), Decimal(0)),
+            'service_minutes': sum(day['service_minutes'] for day in days),
+        }
+        return json_response({'master_id': master_id, 'days': days, 'total': total})
+    except Exception as e:
+        return json_response({'error': f'Внутренняя ошибка сервера: {str(e)}'}, 500)
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Метрики процесса в текстовом формате Prometheus
+    """
+    if not app.config['METRICS_ENABLED']:
+        return json_response({'error': 'Метрики отключены'}, 404)
+    return METRICS.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 @app.errorhandler(404)
 def not_found(error):
     return json_response({'error': 'Ресурс не найден'}, 404)
@@ -432,10 +2229,10 @@ def create_test_data():
     Master.insert_many(masters).execute()
     
     services = [
-        {'title': 'Мужская стрижка', 'description': 'Мужская стрижка: стиль по запросу или профессиональная. 50/100 грамм виски/коньяка по запросу(бренды см. в салоне)', 'price': 1000},
-        {'title': 'Бритьё лица', 'description': 'Профессиональное бритьё усов, бороды и тд.', 'price': 700},
-        {'title': 'Окрашивание', 'description': 'Окрашивание волос с предворительным осветлением, если нужно.', 'price': 2500},
-        {'title': 'Укладка', 'description': 'Профессиональная укладка волос', 'price': 800}
+        {'title': 'Мужская стрижка', 'description': 'Мужская стрижка: стиль по запросу или профессиональная. 50/100 грамм виски/коньяка по запросу(бренды см. в салоне)', 'price': 1000, 'duration': 60},
+        {'title': 'Бритьё лица', 'description': 'Профессиональное бритьё усов, бороды и тд.', 'price': 700, 'duration': 30},
+        {'title': 'Окрашивание', 'description': 'Окрашивание волос с предворительным осветлением, если нужно.', 'price': 2500, 'duration': 120},
+        {'title': 'Укладка', 'description': 'Профессиональная укладка волос', 'price': 800, 'duration': 45}
     ]
     Service.insert_many(services).execute()
     
@@ -487,8 +2284,8 @@ def create_test_data():
 
 
 if __name__ == '__main__':
+    migrate_database()
     DB.connect()
-    DB.create_tables([Master, Service, Appointment, MasterService, AppointmentService], safe=True)
     create_test_data()
     DB.close()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,826 @@
+"""
+Тесты REST API барбершопа. Запускаются на временной базе данных:
+python hw18/app_tests.py  или  pytest hw18/app_tests.py
+"""
+
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from peewee import fn
+
+import app as barbershop
+from app import DB, Appointment
+
+
+ORIGINAL_DATABASE_PATH = barbershop.app.config['DATABASE_PATH']
+TEMP_DIR = None
+
+
+def setup_database(db_path, extra_appointments=50):
+    """
+    Создаёт базу с тестовыми данными и дополнительными записями и подключает к ней приложение.
+    :param db_path: Путь к файлу базы.
+    :param extra_appointments: Количество дополнительных записей.
+    """
+    barbershop.app.config['DATABASE_PATH'] = db_path
+    barbershop.configure_database()
+    barbershop.migrate_database()
+    barbershop.RESPONSE_CACHE.invalidate('masters')
+    barbershop.SCHEDULES.invalidate()
+    barbershop.create_test_data()
+    for i in range(extra_appointments):
+        Appointment.create(
+            client_name=f'Клиент {i % 7}',
+            client_phone=f'+7900000{i:04d}',
+            master=1 + i % 3,
+            date=datetime(2024, 1, 1, 9) + timedelta(hours=i),
+            status='pending'
+        )
+
+
+def restore_database():
+    """
+    Закрывает соединение с тестовой базой и возвращает приложению базу из конфигурации.
+    """
+    DB.close()
+    barbershop.app.config['DATABASE_PATH'] = ORIGINAL_DATABASE_PATH
+    barbershop.configure_database()
+
+
+def setup_module(module=None):
+    """
+    Создаёт временную базу для тестов модуля. pytest вызывает её перед первым тестом,
+    поэтому тесты никогда не работают с barbershop.db из репозитория.
+    """
+    global TEMP_DIR
+    TEMP_DIR = tempfile.TemporaryDirectory()
+    setup_database(os.path.join(TEMP_DIR.name, 'barbershop.db'))
+
+
+def teardown_module(module=None):
+    """
+    Отключает приложение от временной базы и удаляет её каталог.
+    """
+    global TEMP_DIR
+    restore_database()
+    TEMP_DIR.cleanup()
+    TEMP_DIR = None
+
+
+@contextmanager
+def count_queries():
+    """
+    Считает SQL-запросы, выполненные внутри блока with.
+    :return: Список выполненных запросов.
+    """
+    executed = []
+    database = DB.obj
+    original = database.execute_sql
+
+    def counting_execute_sql(sql, params=None, *args, **kwargs):
+        executed.append(sql)
+        return original(sql, params, *args, **kwargs)
+
+    database.execute_sql = counting_execute_sql
+    try:
+        yield executed
+    finally:
+        del database.execute_sql
+
+
+def assert_query_count(client, url, expected):
+    """
+    Проверяет, что GET-запрос к url выполняет ровно expected SQL-запросов.
+    """
+    with count_queries() as executed:
+        response = client.get(url)
+    assert response.status_code == 200, (url, response.status_code)
+    assert len(executed) == expected, (url, len(executed), executed)
+
+
+def test_listing_query_counts():
+    """
+    Количество SQL-запросов на эндпоинтах чтения не зависит от числа записей.
+    """
+    client = barbershop.app.test_client()
+    assert_query_count(client, '/masters', 1)
+    assert_query_count(client, '/masters/1', 1)
+    assert_query_count(client, '/appointments', 1)
+    assert_query_count(client, '/appointments?sort_by=master&direction=desc', 1)
+    assert_query_count(client, '/appointments?limit=10', 1)
+    assert_query_count(client, '/appointments/1', 1)
+    assert_query_count(client, '/appointments/master/1', 2)
+
+
+def test_appointment_services():
+    """
+    С include=services услуги всех записей загружаются одним дополнительным запросом на страницу.
+    """
+    client = barbershop.app.test_client()
+    assert_query_count(client, '/appointments?include=services', 2)
+    assert_query_count(client, '/appointments?limit=10&include=services', 2)
+    assert_query_count(client, '/appointments/1?include=services', 2)
+    assert_query_count(client, '/appointments/master/1?include=services', 3)
+
+    appointment = client.get('/appointments/1?include=services').json['appointment']
+    assert [service['title'] for service in appointment['services']] == ['Мужская стрижка', 'Бритьё лица']
+    assert appointment['total_price'] == 1700
+
+    listing = client.get('/appointments?include=services').json['appointments']
+    by_id = {item['id']: item for item in listing}
+    assert by_id[1] == appointment
+    without_services = [item for item in listing if not item['services']]
+    assert without_services and all(item['total_price'] == 0 for item in without_services)
+
+    streamed = client.get('/appointments?include=services&stream=1').json['appointments']
+    assert streamed == listing
+    assert 'services' not in client.get('/appointments/1').json['appointment']
+
+
+def test_sparse_fieldsets():
+    """
+    Параметр fields сужает и список колонок в SELECT, и поля ответа.
+    """
+    client = barbershop.app.test_client()
+    full = client.get('/appointments').json['appointments']
+
+    with count_queries() as executed:
+        sparse = client.get('/appointments?fields=id,date,status').json['appointments']
+    assert sparse == [{'id': item['id'], 'date': item['date'], 'status': item['status']} for item in full]
+    assert 'JOIN' not in executed[0] and 'client_name' not in executed[0], executed
+
+    # поле сортировки и id выбираются для курсора, даже если их нет в fields
+    url = '/appointments?fields=status&sort_by=master&direction=desc'
+    expected = [{'status': item['status']} for item in client.get(url).json['appointments']]
+    received, cursor = [], None
+    while True:
+        page = client.get(f'{url}&limit=9' + (f'&cursor={cursor}' if cursor else '')).json
+        received.extend(page['appointments'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert received == expected
+
+    appointment = client.get('/appointments/1?fields=master&include=services').json['appointment']
+    assert set(appointment) == {'master', 'services', 'total_price'}
+    assert client.get('/appointments/master/1?fields=client_name').json['appointments'][0] == {'client_name': 'Курт Кобейн'}
+    assert client.get('/appointments?fields=id,password').status_code == 400
+
+    barbershop.RESPONSE_CACHE.invalidate('masters')
+    with count_queries() as executed:
+        masters = client.get('/masters?fields=last_name,id').json['masters']
+    assert set(masters[0]) == {'id', 'last_name'}
+    assert 'phone' not in executed[0], executed
+    assert client.get('/masters/1?fields=phone').json == {'master': {'phone': '+7(999)-999-99-99'}}
+    assert client.get('/masters?fields=salary').status_code == 400
+
+
+def test_export():
+    """
+    Выгрузка в NDJSON и CSV содержит те же записи, что и список, и читает их одним запросом.
+    """
+    client = barbershop.app.test_client()
+    listing = client.get('/appointments?status=pending').json['appointments']
+    expected = sorted(listing, key=lambda item: item['id'])
+
+    with count_queries() as executed:
+        response = client.get('/appointments/export?status=pending')
+        lines = response.get_data(as_text=True).splitlines()
+    assert response.headers['Content-Type'].startswith('application/x-ndjson')
+    assert [json.loads(line) for line in lines] == expected
+    assert len(executed) == 1, executed
+
+    response = client.get('/appointments/export?format=csv&status=pending&fields=id,master,date')
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert list(rows[0]) == ['id', 'date', 'master_id', 'master_first_name', 'master_last_name']
+    assert [(int(row['id']), int(row['master_id']), row['date']) for row in rows] == \
+        [(item['id'], item['master']['id'], item['date']) for item in expected]
+
+    empty = client.get('/appointments/export?format=csv&status=nobody&fields=id,status')
+    assert empty.get_data(as_text=True).splitlines() == ['id,status']
+    assert client.get('/appointments/export?format=xml').status_code == 400
+
+
+@contextmanager
+def database_pool(enabled):
+    """
+    Подключает приложение к тестовой базе с пулом соединений или без него,
+    после блока with возвращает прежнюю настройку.
+    """
+    previous = barbershop.app.config['DATABASE_POOL']
+    barbershop.app.config['DATABASE_POOL'] = enabled
+    barbershop.configure_database()
+    try:
+        yield
+    finally:
+        barbershop.app.config['DATABASE_POOL'] = previous
+        barbershop.configure_database()
+
+
+def test_export_connection():
+    """
+    Выгрузка и потоковый список читают базу через своё соединение до последней части
+    и возвращают его после, с пулом соединений и без него.
+    """
+    client = barbershop.app.test_client()
+    expected = Appointment.select().count()
+    for pool in (True, False):
+        with database_pool(pool):
+            # без autoconnect запрос вне открытого соединения завершается ошибкой, а не открывает
+            # соединение, которое никто не закроет
+            DB.obj.autoconnect = False
+            response = client.get('/appointments/export?format=csv&fields=id')
+            assert len(response.get_data(as_text=True).splitlines()) == expected + 1, pool
+            if pool:
+                assert not DB.obj._in_use
+            assert DB.is_closed()
+
+            # несколько страниц: каждая следующая читается уже после закрытия соединения запроса
+            chunk_size, barbershop.STREAM_CHUNK_SIZE = barbershop.STREAM_CHUNK_SIZE, 7
+            try:
+                for _ in range(3):
+                    response = client.get('/appointments?stream=1&fields=id')
+                    assert len(response.json['appointments']) == expected, pool
+            finally:
+                barbershop.STREAM_CHUNK_SIZE = chunk_size
+            if pool:
+                assert not DB.obj._in_use
+            assert DB.is_closed()
+
+
+def test_write_query_counts():
+    """
+    Создание и обновление записи выполняют проверку мастера и одну запись в базу, а также
+    читают ScheduleVersion в начале и в конце транзакции (расписания мастеров уже загружены).
+    """
+    client = barbershop.app.test_client()
+    payload = {'client_name': 'Оззи Осборн', 'client_phone': '+79005553535', 'master_id': 2}
+    barbershop.SCHEDULES.revalidate()
+    barbershop.SCHEDULES.schedule(2)
+    barbershop.SCHEDULES.schedule(3)
+
+    with count_queries() as executed:
+        response = client.post('/appointments', json=payload)
+    assert response.status_code == 201, response.data
+    assert len(executed) == 4, executed
+    assert response.json['appointment']['master']['id'] == 2
+
+    appointment_id = response.json['appointment']['id']
+    with count_queries() as executed:
+        response = client.put(f'/appointments/{appointment_id}', json=dict(payload, master_id=3))
+    assert response.status_code == 200, response.data
+    assert len(executed) == 4, executed
+    assert response.json['appointment']['master']['id'] == 3
+
+    assert client.put('/appointments/100000', json=payload).status_code == 404
+    assert client.post('/appointments', json=dict(payload, master_id=100000)).status_code == 400
+
+
+def test_idempotency_key():
+    """
+    Повтор POST с тем же Idempotency-Key возвращает сохранённый ответ и не создаёт вторую запись.
+    """
+    client = barbershop.app.test_client()
+    payload = {'client_name': 'Повтор', 'client_phone': '+79990000001', 'master_id': 2, 'date': '2031-01-01 10:00:00'}
+    headers = {'Idempotency-Key': 'retry-1'}
+    count = Appointment.select().count()
+
+    first = client.post('/appointments', json=payload, headers=headers)
+    assert first.status_code == 201
+    with count_queries() as executed:
+        replay = client.post('/appointments', json=payload, headers=headers)
+    assert replay.status_code == 201
+    assert replay.headers['Idempotent-Replayed'] == 'true'
+    assert replay.json == first.json
+    assert not any('INSERT INTO "appointment"' in sql for sql in executed), executed
+    assert Appointment.select().count() == count + 1
+
+    changed = dict(payload, client_name='Другой')
+    assert client.post('/appointments', json=changed, headers=headers).status_code == 422
+
+    # ключ действует в пределах одного маршрута
+    master = {'first_name': 'Ключ', 'last_name': 'Повтор', 'phone': '+79990000002'}
+    assert client.post('/masters', json=master, headers=headers).status_code == 201
+    assert client.post('/masters', json=master, headers=headers).json == client.post('/masters', json=master, headers=headers).json
+
+    request_hash = barbershop.IdempotencyKey.get(barbershop.IdempotencyKey.key == 'retry-1').request_hash
+    barbershop.IdempotencyKey.create(key='in-flight', endpoint='POST /appointments', request_hash=request_hash)
+    assert client.post('/appointments', json=payload, headers={'Idempotency-Key': 'in-flight'}).status_code == 409
+
+    # просроченный результат не возвращается и удаляется очисткой
+    expired = datetime.now() - timedelta(seconds=barbershop.app.config['IDEMPOTENCY_TTL'] + 1)
+    barbershop.IdempotencyKey.update(created_at=expired).where(barbershop.IdempotencyKey.key == 'retry-1').execute()
+    again = client.post('/appointments', json=dict(payload, date='2031-01-02 10:00:00'), headers=headers)
+    assert again.status_code == 201 and 'Idempotent-Replayed' not in again.headers
+    barbershop.IdempotencyKey.update(created_at=expired).execute()
+    barbershop.IDEMPOTENCY._last_sweep = 0.0
+    client.post('/masters', json=dict(master, phone='+79990000003'), headers={'Idempotency-Key': 'retry-2'})
+    assert barbershop.IdempotencyKey.select().count() == 1
+
+
+def stats_snapshot():
+    """
+    Возвращает строки сводки MasterDayStats в виде отсортированного списка кортежей.
+    """
+    query = barbershop.MasterDayStats.select().order_by(barbershop.MasterDayStats.master, barbershop.MasterDayStats.day)
+    return [(row.master_id, row.day, row.appointments, row.cancelled, float(row.revenue), row.service_minutes)
+            for row in query]
+
+
+def test_master_day_stats():
+    """
+    Триггеры поддерживают сводку по мастерам и дням такой же, как пересчёт по всей истории.
+    """
+    client = barbershop.app.test_client()
+    payload = {'client_name': 'Сводка', 'client_phone': '+79990000010', 'master_id': 2, 'date': '2032-01-01 10:00:00'}
+    created = client.post('/appointments', json=payload).json['appointment']['id']
+    barbershop.AppointmentService.create(appointment=created, service=1)
+    extra = barbershop.AppointmentService.create(appointment=created, service=3)
+
+    day = client.get('/stats/masters/2?from=2032-01-01&to=2032-01-01').json
+    assert day['days'] == [{'day': '2032-01-01', 'appointments': 1, 'cancelled': 0, 'revenue': 3500, 'service_minutes': 180}]
+
+    client.put(f'/appointments/{created}', json=dict(payload, master_id=3, date='2032-01-02 10:00:00'))
+    assert client.get('/stats/masters/2?from=2032-01-01&to=2032-01-01').json['days'] == []
+    client.put('/appointments/2', json={'client_name': 'Тилль Линдеманн', 'client_phone': '+7(900)222-22-23',
+                                        'master_id': 2, 'status': 'cancelled'})
+    client.delete('/appointments/3')
+    client.post('/appointments/bulk', json=[dict(payload, date='2032-02-01 10:00:00'), dict(payload, date='2032-02-01 12:00:00')])
+    barbershop.Service.update(price=barbershop.Service.price + 100).where(barbershop.Service.id == 1).execute()
+    extra.delete_instance()
+
+    # удалённая запись с услугами и новая запись без услуг с тем же id в тот же день
+    reused = dict(payload, date='2032-03-01 10:00:00')
+    deleted = client.post('/appointments', json=reused).json['appointment']['id']
+    barbershop.AppointmentService.create(appointment=deleted, service=1)
+    barbershop.AppointmentService.create(appointment=deleted, service=3)
+    client.delete(f'/appointments/{deleted}')
+    assert client.post('/appointments', json=dict(reused, date='2032-03-01 12:00:00')).json['appointment']['id'] == deleted
+    assert client.get('/stats/days?from=2032-03-01&to=2032-03-01').json['days'] == [
+        {'day': '2032-03-01', 'appointments': 1, 'cancelled': 0, 'revenue': 0, 'service_minutes': 0}
+    ]
+
+    maintained = stats_snapshot()
+    barbershop.rebuild_master_day_stats()
+    assert maintained == stats_snapshot()
+
+    days = client.get('/stats/days?from=2032-01-01&to=2032-12-31').json['days']
+    assert [(item['day'], item['appointments']) for item in days] == [('2032-01-02', 1), ('2032-02-01', 2), ('2032-03-01', 1)]
+    masters = {item['master']['id']: item for item in client.get('/stats/masters').json['masters']}
+    assert masters[2]['cancelled'] == 1
+    assert client.get('/stats/days?from=01.01.2032').status_code == 400
+    assert client.get('/stats/masters/100000').status_code == 404
+
+
+def test_delete_and_recreate():
+    """
+    Удаление записи удаляет её услуги: новая запись с освободившимся id создаётся без них.
+    """
+    client = barbershop.app.test_client()
+    payload = {'client_name': 'Удаление', 'client_phone': '+79990000020', 'master_id': 1, 'date': '2033-01-01 10:00:00'}
+    deleted = client.post('/appointments', json=payload).json['appointment']['id']
+    barbershop.AppointmentService.create(appointment=deleted, service=1)
+    assert client.delete(f'/appointments/{deleted}').status_code == 204
+    assert not barbershop.AppointmentService.select().where(barbershop.AppointmentService.appointment == deleted).exists()
+
+    recreated = client.post('/appointments', json=payload).json['appointment']['id']
+    assert recreated == deleted
+    appointment = client.get(f'/appointments/{recreated}?include=services').json['appointment']
+    assert appointment['services'] == [] and appointment['total_price'] == 0
+    assert client.delete('/appointments/100000').status_code == 404
+
+
+def test_bulk_create():
+    """
+    Bulk-эндпоинты вставляют массив целиком или возвращают ошибки по индексам, ничего не вставив.
+    """
+    client = barbershop.app.test_client()
+    masters = [
+        {'first_name': 'Мастер', 'last_name': f'Номер {i}', 'phone': f'+7911{i:07d}'}
+        for i in range(250)
+    ]
+    response = client.post('/masters/bulk', json=masters)
+    assert response.status_code == 201, response.data
+    assert response.json == {'created': 250}
+
+    response = client.post('/masters/bulk', json=[masters[0], {'first_name': 'Без фамилии', 'phone': '1'}])
+    assert response.status_code == 400
+    assert [item['index'] for item in response.json['errors']] == [0, 1]
+
+    appointments_before = Appointment.select().count()
+    appointments = [
+        {'client_name': f'Клиент {i}', 'client_phone': '+79000000000', 'master_id': 1 + i % 3,
+         'date': (datetime(2025, 2, 1, 10) + timedelta(hours=i)).strftime('%Y-%m-%d %H:%M:%S')}
+        for i in range(300)
+    ]
+    response = client.post('/appointments/bulk', json=appointments + [dict(appointments[0], master_id=100000)])
+    assert response.status_code == 400
+    assert response.json['errors'] == [{'index': 300, 'errors': ['Мастер с указанным ID не найден']}]
+    assert Appointment.select().count() == appointments_before
+
+    # без date все записи получили бы одно текущее время и пересеклись бы между собой
+    dateless = [{key: value for key, value in item.items() if key != 'date'} for item in appointments[:2]]
+    response = client.post('/appointments/bulk', json=dateless)
+    assert response.status_code == 400
+    assert [item['index'] for item in response.json['errors']] == [0, 1]
+    assert 'date' in response.json['errors'][0]['errors'][0]
+
+    response = client.post('/appointments/bulk', json=appointments[:3] + [appointments[0]])
+    assert response.status_code == 409
+    assert response.json['errors'] == [{'index': 3, 'errors': ['Мастер занят в это время']}]
+
+    response = client.post('/appointments/bulk', json=appointments)
+    assert response.status_code == 201, response.data
+    assert Appointment.select().count() == appointments_before + 300
+
+    response = client.post('/appointments/bulk', json=[appointments[5]])
+    assert response.status_code == 409
+    assert response.json['errors'] == [{'index': 0, 'errors': ['Мастер занят в это время']}]
+
+
+def test_bulk_masters_concurrent_phone():
+    """
+    Два одновременных bulk-запроса с одним телефоном: один создаёт мастера, второй получает 400, а не 500.
+    """
+    for attempt in range(5):
+        master = {'first_name': 'Гонка', 'last_name': f'Телефонов {attempt}', 'phone': f'+7300{attempt:09d}'}
+        barrier = threading.Barrier(2)
+        statuses = []
+
+        def post():
+            client = barbershop.app.test_client()
+            barrier.wait()
+            statuses.append(client.post('/masters/bulk', json=[master]).status_code)
+
+        threads = [threading.Thread(target=post) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(statuses) == [201, 400], statuses
+
+
+def test_appointment_filters():
+    """
+    Фильтры списка записей комбинируются между собой и с сортировкой.
+    """
+    client = barbershop.app.test_client()
+    day = client.get('/appointments?from=2024-01-01&to=2024-01-01').json['appointments']
+    assert day and all(item['date'].startswith('2024-01-01') for item in day)
+
+    response = client.get('/appointments?from=2024-01-01 12:00:00&to=2024-01-02&master_id=2&direction=desc')
+    appointments = response.json['appointments']
+    assert appointments
+    assert all(item['master']['id'] == 2 and '2024-01-01 12:00:00' <= item['date'] < '2024-01-03' for item in appointments)
+    assert [item['date'] for item in appointments] == sorted((item['date'] for item in appointments), reverse=True)
+
+    response = client.get('/appointments?client_phone=%2B79000000003&status=pending')
+    assert [item['client_phone'] for item in response.json['appointments']] == ['+79000000003']
+
+    assert client.get('/appointments?from=01.01.2024').status_code == 400
+    assert client.get('/appointments?master_id=abc').status_code == 400
+
+
+def test_free_slots_and_double_booking():
+    """
+    Свободное время мастера считается по расписанию, пересекающиеся записи отклоняются.
+    """
+    client = barbershop.app.test_client()
+    payload = {'client_name': 'Ронни Джеймс Дио', 'client_phone': '+79001112233', 'master_id': 1}
+
+    response = client.post('/appointments', json=dict(payload, date='2030-03-01 10:00:00'))
+    assert response.status_code == 201, response.data
+    first_id = response.json['appointment']['id']
+    assert client.post('/appointments', json=dict(payload, date='2030-03-01 10:30:00')).status_code == 409
+    response = client.post('/appointments', json=dict(payload, date='2030-03-01 12:00:00'))
+    assert response.status_code == 201
+    second_id = response.json['appointment']['id']
+
+    response = client.get('/masters/1/free-slots?from=2030-03-01 09:00:00&to=2030-03-01 14:00:00&duration=60')
+    assert response.status_code == 200
+    assert response.json['free_slots'] == [
+        {'from': '2030-03-01 09:00:00', 'to': '2030-03-01 10:00:00'},
+        {'from': '2030-03-01 11:00:00', 'to': '2030-03-01 12:00:00'},
+        {'from': '2030-03-01 13:00:00', 'to': '2030-03-01 14:00:00'},
+    ]
+    response = client.get('/masters/1/free-slots?from=2030-03-01 09:00:00&to=2030-03-01 14:00:00&duration=61')
+    assert response.json['free_slots'] == []
+
+    assert client.put(f'/appointments/{second_id}', json=dict(payload, date='2030-03-01 10:59:00')).status_code == 409
+    assert client.put(f'/appointments/{second_id}', json=dict(payload, date='2030-03-01 11:00:00')).status_code == 200
+    assert client.put(f'/appointments/{first_id}', json=dict(payload, status='cancelled')).status_code == 200
+    response = client.get('/masters/1/free-slots?from=2030-03-01 09:00:00&to=2030-03-01 14:00:00&duration=60')
+    assert response.json['free_slots'] == [
+        {'from': '2030-03-01 09:00:00', 'to': '2030-03-01 11:00:00'},
+        {'from': '2030-03-01 12:00:00', 'to': '2030-03-01 14:00:00'},
+    ]
+
+    assert client.delete(f'/appointments/{second_id}').status_code == 204
+    response = client.get('/masters/1/free-slots?from=2030-03-01&to=2030-03-01')
+    assert response.json['free_slots'] == [{'from': '2030-03-01 00:00:00', 'to': '2030-03-02 00:00:00'}]
+
+    assert client.get('/masters/100000/free-slots').status_code == 404
+    assert client.get('/masters/1/free-slots?duration=0').status_code == 400
+
+
+def test_move_to_uncached_master():
+    """
+    Перенос записи к мастеру, расписание которого ещё не загружено, освобождает время прежнего мастера.
+    """
+    client = barbershop.app.test_client()
+    payload = {'client_name': 'Тони Айомми', 'client_phone': '+79001112244', 'master_id': 1, 'date': '2030-04-01 10:00:00'}
+    response = client.post('/appointments', json=payload)
+    assert response.status_code == 201, response.data
+    appointment_id = response.json['appointment']['id']
+
+    barbershop.SCHEDULES.invalidate(2)
+    assert client.put(f'/appointments/{appointment_id}', json=dict(payload, master_id=2)).status_code == 200
+    assert client.post('/appointments', json=dict(payload, client_phone='+79001112255')).status_code == 201
+    assert client.post('/appointments', json=dict(payload, master_id=2)).status_code == 409
+
+    # расписание, загруженное в транзакции с конфликтом, сбрасывается
+    barbershop.SCHEDULES.invalidate(3)
+    response = client.post('/appointments', json=dict(payload, master_id=3, date='2030-04-01 12:00:00'))
+    assert response.status_code == 201
+    barbershop.SCHEDULES.invalidate(3)
+    response = client.put(f'/appointments/{appointment_id}', json=dict(payload, master_id=3, date='2030-04-01 12:30:00'))
+    assert response.status_code == 409
+    assert not barbershop.SCHEDULES.loaded(3)
+    assert client.post('/appointments', json=dict(payload, master_id=2, date='2030-04-01 10:00:00')).status_code == 409
+
+
+def test_schedule_external_writes():
+    """
+    Записи другого процесса (отдельного соединения с базой) видны проверке занятости и свободному времени.
+    """
+    client = barbershop.app.test_client()
+    slots_url = '/masters/1/free-slots?from=2034-01-01 09:00:00&to=2034-01-01 14:00:00&duration=60'
+    assert client.get(slots_url).json['free_slots'] == [{'from': '2034-01-01 09:00:00', 'to': '2034-01-01 14:00:00'}]
+
+    conn = sqlite3.connect(barbershop.app.config['DATABASE_PATH'])
+    try:
+        with conn:
+            appointment_id = conn.execute(
+                "INSERT INTO appointment (client_name, client_phone, date, master_id, status) "
+                "VALUES ('Другой процесс', '+79990000030', '2034-01-01 10:00:00', 1, 'pending')"
+            ).lastrowid
+        payload = {'client_name': 'Этот процесс', 'client_phone': '+79990000031', 'master_id': 1, 'date': '2034-01-01 10:30:00'}
+        assert client.post('/appointments', json=payload).status_code == 409
+        assert client.get(slots_url).json['free_slots'] == [
+            {'from': '2034-01-01 09:00:00', 'to': '2034-01-01 10:00:00'},
+            {'from': '2034-01-01 11:00:00', 'to': '2034-01-01 14:00:00'},
+        ]
+
+        # услуга, добавленная в обход приложения, удлиняет запись
+        with conn:
+            conn.execute("INSERT INTO appointmentservice (appointment_id, service_id) VALUES (?, 3)", (appointment_id,))
+        end = datetime(2034, 1, 1, 10) + timedelta(minutes=barbershop.Service.get_by_id(3).duration)
+        assert end > datetime(2034, 1, 1, 11)
+        assert client.get(slots_url).json['free_slots'][1]['from'] == end.strftime('%Y-%m-%d %H:%M:%S')
+    finally:
+        conn.close()
+
+
+def test_overlapping_intervals():
+    """
+    Длинный интервал, перекрывающий соседние, учитывается при проверке и поиске свободного времени.
+    """
+    day = datetime(2030, 5, 1)
+    schedule = barbershop.MasterSchedule([
+        (day.replace(hour=9), day.replace(hour=13), 1),
+        (day.replace(hour=10), day.replace(hour=11), 2),
+    ])
+    assert schedule.conflict(day.replace(hour=12), day.replace(hour=12, minute=30)) == 1
+    assert schedule.conflict(day.replace(hour=13), day.replace(hour=14)) is None
+    assert schedule.free_windows(day.replace(hour=12), day.replace(hour=15), timedelta(hours=1)) == [
+        (day.replace(hour=13), day.replace(hour=15))
+    ]
+
+
+def test_masters_etag():
+    """
+    Повторный запрос с If-None-Match получает 304 без SQL-запросов; изменение мастеров меняет ETag.
+    """
+    client = barbershop.app.test_client()
+    response = client.get('/masters')
+    etag = response.headers['ETag']
+    assert response.status_code == 200 and etag
+
+    with count_queries() as executed:
+        response = client.get('/masters', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert not executed, executed
+
+    with count_queries() as executed:
+        response = client.get('/masters')
+    assert response.status_code == 200
+    assert not executed, executed
+
+    master_etag = client.get('/masters/1').headers['ETag']
+    response = client.post('/masters', json={'first_name': 'Слэш', 'last_name': 'Хадсон', 'phone': '+79009990000'})
+    assert response.status_code == 201
+    master_id = response.json['master']['id']
+
+    response = client.get('/masters', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert any(master['id'] == master_id for master in response.json['masters'])
+
+    # ETag строится из тела ответа: ответ другого мастера не изменился, и его ETag остаётся действительным
+    response = client.get('/masters/1', headers={'If-None-Match': master_etag})
+    assert response.status_code == 304
+
+    # без переиспользования ответов каждый запрос читает базу, а 304 продолжает работать
+    ttl = barbershop.app.config['RESPONSE_CACHE_TTL']
+    barbershop.app.config['RESPONSE_CACHE_TTL'] = 0
+    try:
+        with count_queries() as executed:
+            response = client.get('/masters/1', headers={'If-None-Match': master_etag})
+        assert response.status_code == 304
+        assert len(executed) == 1, executed
+    finally:
+        barbershop.app.config['RESPONSE_CACHE_TTL'] = ttl
+
+    assert client.get('/masters/100000').status_code == 404
+    assert client.delete(f'/masters/{master_id}').status_code == 204
+    assert client.get(f'/masters/{master_id}').status_code == 404
+
+
+def test_gzip_and_encoders():
+    """
+    Большие ответы сжимаются gzip по Accept-Encoding, все сериализаторы дают одинаковый JSON.
+    """
+    client = barbershop.app.test_client()
+    plain = client.get('/appointments')
+    assert 'Content-Encoding' not in plain.headers
+
+    for url in ('/appointments', '/appointments?stream=1'):
+        compressed = client.get(url, headers={'Accept-Encoding': 'gzip, deflate'})
+        assert compressed.headers['Content-Encoding'] == 'gzip', url
+        assert json.loads(gzip.decompress(compressed.data)) == plain.json, url
+
+    small = client.get('/masters/1', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in small.headers
+    assert 'Accept-Encoding' in small.headers['Vary']
+
+    for name, dumps in barbershop.JSON_ENCODERS.items():
+        assert json.loads(dumps(plain.json)) == plain.json, name
+
+
+def test_metrics():
+    """
+    /metrics отдаёт по шаблонам маршрутов количество ответов, гистограммы длительности и числа SQL-запросов.
+    """
+    barbershop.METRICS = barbershop.Metrics()
+    barbershop.RESPONSE_CACHE.invalidate('masters')
+    client = barbershop.app.test_client()
+    client.get('/masters/1')
+    client.get('/masters/2')
+    client.get('/masters/999')
+    client.get('/no-such-route')
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['Content-Type'].startswith('text/plain')
+    text = response.get_data(as_text=True)
+    route = 'method="GET",route="/masters/<int:master_id>"'
+    assert f'barbershop_http_responses_total{{{route},status="200"}} 2' in text
+    assert f'barbershop_http_responses_total{{{route},status="404"}} 1' in text
+    assert 'barbershop_http_responses_total{method="GET",route="unmatched",status="404"} 1' in text
+    assert f'barbershop_http_request_duration_seconds_bucket{{{route},le="+Inf"}} 3' in text
+    assert f'barbershop_http_request_duration_seconds_count{{{route}}} 3' in text
+    # каждый запрос мастера - один SELECT
+    assert f'barbershop_sql_queries_per_request_bucket{{{route},le="0"}} 0' in text
+    assert f'barbershop_sql_queries_per_request_bucket{{{route},le="1"}} 3' in text
+    assert f'barbershop_sql_duration_seconds_total{{{route}}}' in text
+
+
+def test_keyset_pagination():
+    """
+    Постраничный обход по курсору возвращает те же записи, что и полный список.
+    """
+    client = barbershop.app.test_client()
+    for sort_by in ('date', 'client_name', 'status', 'master'):
+        for direction in ('asc', 'desc'):
+            url = f'/appointments?sort_by={sort_by}&direction={direction}'
+            expected = [item['id'] for item in client.get(url).json['appointments']]
+            received = []
+            cursor = None
+            while True:
+                page_url = f'{url}&limit=7' + (f'&cursor={cursor}' if cursor else '')
+                page = client.get(page_url).json
+                received.extend(item['id'] for item in page['appointments'])
+                cursor = page['next_cursor']
+                if cursor is None:
+                    break
+            assert sorted(received) == sorted(expected), url
+            assert len(received) == len(expected), url
+
+
+def test_cursor_sort_mismatch():
+    """
+    Курсор действует только для той сортировки, в которой он получен.
+    """
+    client = barbershop.app.test_client()
+    cursor = client.get('/appointments?sort_by=client_name&limit=5').json['next_cursor']
+    assert cursor
+    assert client.get(f'/appointments?sort_by=client_name&limit=5&cursor={cursor}').status_code == 200
+    for url in ('/appointments?sort_by=status', '/appointments?sort_by=date',
+                '/appointments?sort_by=client_name&direction=desc'):
+        response = client.get(f'{url}&limit=5&cursor={cursor}')
+        assert response.status_code == 400, url
+        assert 'сортировки' in response.json['error'], url
+    assert client.get('/appointments?limit=5&cursor=not-a-cursor').status_code == 400
+
+
+def query_plan(query):
+    """
+    Возвращает описания шагов плана EXPLAIN QUERY PLAN.
+    """
+    sql, params = query.sql()
+    return [row[3] for row in DB.execute_sql('EXPLAIN QUERY PLAN ' + sql, params).fetchall()]
+
+
+def full_table_scans(query):
+    """
+    Возвращает шаги плана, которые читают таблицу целиком без индекса.
+    """
+    return [step for step in query_plan(query) if step.startswith('SCAN') and 'USING' not in step]
+
+
+def appointment_steps(query):
+    """
+    Возвращает шаги плана, которые читают таблицу записей (в запросах peewee у неё псевдоним t1).
+    """
+    return [step for step in query_plan(query) if step.split()[1:2] == ['t1']]
+
+
+def test_listing_query_plans():
+    """
+    Ни один запрос списков записей не читает таблицы целиком. Запросы с фильтром и со страницы
+    после курсора читают записи диапазоном индекса (SEARCH), а не обходом всего индекса (SCAN ... USING INDEX).
+    """
+    first_pages = []
+    searched = [barbershop.select_appointment_rows(Appointment.master == 1)]
+    for sort_by in barbershop.APPOINTMENT_SORT_FIELDS:
+        value = datetime(2024, 1, 1) if sort_by == 'date' else 'М'
+        for descending in (False, True):
+            first_pages.append(barbershop.appointments_page_query(sort_by, descending))
+            searched.append(barbershop.appointments_page_query(sort_by, descending, (value, 10)))
+    for args in ({'from': '2024-01-01', 'to': '2024-01-01'}, {'master_id': '1', 'from': '2024-01-02'},
+                 {'client_phone': '+79000000001'}, {'status': 'pending', 'to': '2024-01-02 12:00:00'}):
+        conditions, errors = barbershop.appointment_filters(args)
+        assert not errors, errors
+        searched.append(barbershop.appointments_page_query('date', False, conditions=conditions))
+    for query in first_pages + searched:
+        scans = full_table_scans(query.limit(barbershop.DEFAULT_PAGE_SIZE))
+        assert not scans, (query.sql(), scans)
+    for query in searched:
+        steps = appointment_steps(query.limit(barbershop.DEFAULT_PAGE_SIZE))
+        assert steps and all(step.startswith('SEARCH') for step in steps), (query.sql(), steps)
+
+
+def test_migrate_existing_database():
+    """
+    Миграция добавляет индексы в базу, созданную до их объявления в моделях.
+    """
+    previous_path = barbershop.app.config['DATABASE_PATH']
+    with tempfile.TemporaryDirectory() as directory:
+        # миграция работает с копией: barbershop.db из репозитория не меняется
+        db_path = os.path.join(directory, 'barbershop.db')
+        shutil.copy(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'barbershop.db'), db_path)
+        barbershop.app.config['DATABASE_PATH'] = db_path
+        try:
+            barbershop.configure_database()
+            barbershop.migrate_database()
+            with DB.connection_context():
+                indexes = {index.name for index in DB.get_indexes('appointment')}
+            assert {'appointment_date', 'appointment_client_phone', 'appointment_status', 'appointment_master_id_date'} <= indexes
+            assert 'appointment_master_id' not in indexes
+            with DB.connection_context():
+                appointments = barbershop.MasterDayStats.select(fn.SUM(barbershop.MasterDayStats.appointments + barbershop.MasterDayStats.cancelled)).scalar()
+                assert appointments == Appointment.select().count()
+        finally:
+            DB.close()
+            barbershop.app.config['DATABASE_PATH'] = previous_path
+            barbershop.configure_database()
+
+
+if __name__ == '__main__':
+    setup_module()
+    try:
+        for name, test in list(globals().items()):
+            if name.startswith('test_') and callable(test):
+                test()
+                print(f'{name}: OK')
+    finally:
+        teardown_module()
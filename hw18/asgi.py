@@ -0,0 +1,152 @@
+"""
+ASGI-режим API барбершопа. Маршруты и формат ответов те же, что у Flask-приложения из app.py:
+соединения и ожидание клиентов обслуживает цикл событий ASGI-сервера, а обработка запросов
+и работа с базой выполняются в ограниченном пуле потоков (ASGI_THREADS).
+
+Запуск: python hw18/asgi.py [порт]  или  uvicorn asgi:application (из каталога hw18)
+"""
+
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from app import app
+
+
+class AsgiBridge:
+    """
+    ASGI-приложение, которое выполняет WSGI-приложение в пуле потоков.
+    Каждый запрос целиком обрабатывается одним потоком пула, поэтому контекст Flask
+    и соединение с базой остаются в нём и для потоковых ответов.
+    """
+    def __init__(self, wsgi_app, max_threads: int):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix='barbershop')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.handle_http(scope, receive, send)
+        else:
+            raise ValueError(f"Неподдерживаемый тип соединения: {scope['type']}")
+
+    async def lifespan(self, receive, send) -> None:
+        """
+        Обрабатывает запуск и остановку сервера. При остановке дожидается пула потоков.
+        """
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def handle_http(self, scope, receive, send) -> None:
+        """
+        Читает тело запроса в цикле событий и передаёт запрос в пул потоков.
+        """
+        body = BytesIO()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.write(message.get('body', b''))
+            if not message.get('more_body', False):
+                break
+        body.seek(0)
+
+        loop = asyncio.get_running_loop()
+
+        def send_from_thread(message):
+            # поток ждёт, пока сервер примет часть ответа, поэтому медленный клиент
+            # не заставляет накапливать весь потоковый ответ в памяти
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        await loop.run_in_executor(self.executor, self.run_wsgi, build_environ(scope, body), send_from_thread)
+
+    def run_wsgi(self, environ: dict, send) -> None:
+        """
+        Вызывает WSGI-приложение и отправляет ответ по частям. Выполняется в потоке пула.
+        """
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+            return lambda data: None
+
+        def send_start():
+            send({'type': 'http.response.start', 'status': response['status'], 'headers': response['headers']})
+
+        iterable = self.wsgi_app(environ, start_response)
+        try:
+            started = False
+            for chunk in iterable:
+                if not chunk:
+                    continue
+                if not started:
+                    send_start()
+                    started = True
+                send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not started:
+                send_start()
+            send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+
+
+def build_environ(scope: dict, body: BytesIO) -> dict:
+    """
+    Строит WSGI environ (PEP 3333) из ASGI scope HTTP-запроса.
+    :param scope: ASGI scope.
+    :param body: Тело запроса.
+    :return: Словарь environ.
+    """
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+            key = name
+        else:
+            key = f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+application = AsgiBridge(app, app.config['ASGI_THREADS'])
+
+
+if __name__ == '__main__':
+    import uvicorn
+    from app import migrate_database, create_test_data, DB
+
+    migrate_database()
+    with DB.connection_context():
+        create_test_data()
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    uvicorn.run(application, host='127.0.0.1', port=port, timeout_keep_alive=app.config['ASGI_KEEP_ALIVE_TIMEOUT'])
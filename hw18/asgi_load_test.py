@@ -0,0 +1,146 @@
+"""
+Сравнение WSGI-режима (app.run, многопоточный сервер Werkzeug) и ASGI-режима (asgi.py, uvicorn)
+под нагрузкой: сервер держит idle_clients «медленных» соединений, которые не дослали запрос,
+а clients активных клиентов в течение duration секунд запрашивают route.
+
+Запуск: python hw18/asgi_load_test.py [--idle 2000] [--clients 32] [--duration 10] [--route /masters]
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+
+from benchmark import free_port, start_server, stop_server, percentile
+
+
+def open_idle_connections(port: int, count: int) -> list:
+    """
+    Открывает count соединений, которые отправили только начало запроса и ждут.
+    """
+    connections = []
+    for _ in range(count):
+        try:
+            sock = socket.create_connection(('127.0.0.1', port), timeout=5)
+            sock.sendall(b'GET /masters HTTP/1.1\r\nHost: localhost\r\n')
+            connections.append(sock)
+        except OSError:
+            break
+    return connections
+
+
+def count_open(connections: list) -> int:
+    """
+    Считает соединения, которые сервер ещё не закрыл.
+    """
+    alive = 0
+    for sock in connections:
+        sock.setblocking(False)
+        try:
+            if sock.recv(1, socket.MSG_PEEK):
+                alive += 1
+        except BlockingIOError:
+            alive += 1
+        except OSError:
+            pass
+    return alive
+
+
+def server_memory_mb(pid: int):
+    """
+    Возвращает резидентную память процесса сервера в МиБ (только Linux, иначе None).
+    """
+    try:
+        with open(f'/proc/{pid}/status', encoding='utf-8') as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+
+
+def run_clients(port: int, route: str, clients: int, duration: float) -> dict:
+    """
+    Запускает clients потоков, которые duration секунд отправляют GET route.
+    :return: Количество запросов, ошибок, запросов в секунду и перцентили задержки.
+    """
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local_latencies = []
+        local_errors = 0
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            try:
+                connection.request('GET', route)
+                response = connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    local_errors += 1
+                else:
+                    local_latencies.append(time.perf_counter() - start)
+            except (OSError, http.client.HTTPException):
+                local_errors += 1
+                connection.close()
+        with lock:
+            latencies.extend(local_latencies)
+            errors.append(local_errors)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'requests_per_second': round(len(latencies) / duration, 1),
+        'p50_ms': percentile(latencies, 0.50),
+        'p99_ms': percentile(latencies, 0.99),
+    }
+
+
+def run_mode(mode: str, idle: int, clients: int, duration: float, route: str) -> dict:
+    """
+    Выполняет замер для одного режима на отдельной временной базе.
+    """
+    temp_dir = tempfile.TemporaryDirectory()
+    db_path = os.path.join(temp_dir.name, 'barbershop.db')
+    port = free_port()
+    process = start_server(mode, port, db_path)
+    connections = []
+    try:
+        connections = open_idle_connections(port, idle)
+        result = {'mode': mode, 'idle_opened': len(connections)}
+        result.update(run_clients(port, route, clients, duration))
+        result['idle_still_open'] = count_open(connections)
+        result['server_rss_mb'] = server_memory_mb(process.pid)
+        return result
+    finally:
+        for sock in connections:
+            sock.close()
+        stop_server(process)
+        temp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Сравнение WSGI- и ASGI-режимов API барбершопа')
+    parser.add_argument('--idle', type=int, default=2000, help='количество простаивающих соединений')
+    parser.add_argument('--clients', type=int, default=32, help='количество активных клиентов')
+    parser.add_argument('--duration', type=float, default=10, help='длительность замера, секунд')
+    parser.add_argument('--route', default='/masters', help='маршрут для активных клиентов')
+    parser.add_argument('--modes', default='wsgi,asgi', help='режимы через запятую')
+    args = parser.parse_args()
+
+    results = [run_mode(mode, args.idle, args.clients, args.duration, args.route) for mode in args.modes.split(',')]
+    print(json.dumps(results, ensure_ascii=False, indent=2))
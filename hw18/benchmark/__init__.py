@@ -0,0 +1,10 @@
+"""
+Нагрузочные замеры REST API барбершопа на синтетических данных.
+
+Запуск из каталога hw18:
+python -m benchmark --scale 100000 --clients 16 --requests 500 --output report.json
+"""
+
+from benchmark.seed import seed_database
+from benchmark.server import free_port, start_server, stop_server
+from benchmark.runner import run_benchmark, percentile
@@ -0,0 +1,55 @@
+"""
+python -m benchmark [--scale 10000] [--clients 8] [--requests 200] [--routes "GET,/masters"] [--db path] [--output report.json]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+
+from benchmark.runner import run_benchmark
+from benchmark.seed import seed_database, database_sizes
+from benchmark.server import free_port, start_server, stop_server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Нагрузочный замер всех маршрутов API барбершопа')
+    parser.add_argument('--scale', type=int, default=10000, help='количество синтетических записей')
+    parser.add_argument('--masters', type=int, default=None, help='количество синтетических мастеров')
+    parser.add_argument('--clients', type=int, default=8, help='количество параллельных клиентов')
+    parser.add_argument('--requests', type=int, default=200, help='количество запросов на маршрут')
+    parser.add_argument('--routes', default='', help='подстроки названий маршрутов через запятую')
+    parser.add_argument('--mode', default='wsgi', choices=['wsgi', 'asgi'], help='режим сервера')
+    parser.add_argument('--db', default=None, help='файл базы; если он есть, заполнение пропускается и он сохраняется')
+    parser.add_argument('--seed', type=int, default=0, help='начальное значение генератора случайных чисел')
+    parser.add_argument('--output', default=None, help='файл для отчёта (по умолчанию stdout)')
+    args = parser.parse_args()
+
+    temp_dir = None if args.db else tempfile.TemporaryDirectory()
+    db_path = args.db or os.path.join(temp_dir.name, 'benchmark.db')
+    if os.path.exists(db_path):
+        sizes = database_sizes(db_path)
+    else:
+        sizes = seed_database(db_path, args.scale, args.masters)
+
+    port = free_port()
+    process = start_server(args.mode, port, db_path)
+    try:
+        report = run_benchmark(port, sizes, args.clients, args.requests,
+                               [route for route in args.routes.split(',') if route], args.seed)
+        report['mode'] = args.mode
+    finally:
+        stop_server(process)
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
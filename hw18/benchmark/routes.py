@@ -0,0 +1,202 @@
+"""
+Сценарии запросов к каждому маршруту API. Сценарий получает состояние замера,
+клиента и генератор случайных чисел потока и возвращает измеряемый запрос
+(метод, путь, тело). Подготовительные запросы сценария (например, создание
+записи перед её удалением) выполняются через client.prepare и не измеряются.
+"""
+
+import itertools
+from datetime import timedelta
+
+from benchmark.seed import SEED_START
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+BULK_SIZE = 100
+
+
+class Workload:
+    """
+    Общие для всех клиентов размеры базы и счётчик уникальных значений:
+    телефонов новых мастеров и часов для новых записей.
+    """
+    def __init__(self, sizes: dict):
+        self.sizes = sizes
+        self.counter = itertools.count()
+
+    def unique(self) -> int:
+        return next(self.counter)
+
+    def new_date(self) -> str:
+        """
+        Час после всех существующих записей, который ещё не занят ни одним клиентом замера.
+        """
+        return (self.sizes['writes_start'] + timedelta(hours=self.unique())).strftime(DATE_FORMAT)
+
+    def master_id(self, rng) -> int:
+        return rng.randint(1, self.sizes['masters'])
+
+    def appointment_id(self, rng) -> int:
+        return rng.randint(1, self.sizes['appointments'])
+
+    def day(self, rng) -> str:
+        days = max(1, (self.sizes['last_date'] - SEED_START).days)
+        return (SEED_START + timedelta(days=rng.randrange(days))).strftime('%Y-%m-%d')
+
+    def master_data(self) -> dict:
+        number = self.unique()
+        return {'first_name': 'Нагрузка', 'last_name': f'Мастер {number}', 'phone': f'+7100{number:09d}'}
+
+    def appointment_data(self, rng) -> dict:
+        number = self.unique()
+        return {
+            'client_name': f'Нагрузка {number}',
+            'client_phone': f'+7200{number:09d}',
+            'master_id': self.master_id(rng),
+            'date': self.new_date(),
+        }
+
+
+def new_master(workload, client) -> int:
+    return client.prepare('POST', '/masters', workload.master_data())['master']['id']
+
+
+def new_appointment(workload, client, rng) -> dict:
+    return client.prepare('POST', '/appointments', workload.appointment_data(rng))['appointment']
+
+
+def get_masters(workload, client, rng):
+    return 'GET', '/masters', None
+
+
+def get_master(workload, client, rng):
+    return 'GET', f'/masters/{workload.master_id(rng)}', None
+
+
+def get_stats_days(workload, client, rng):
+    day = workload.day(rng)
+    return 'GET', f'/stats/days?from={day}', None
+
+
+def get_masters_stats(workload, client, rng):
+    day = workload.day(rng)
+    return 'GET', f'/stats/masters?from={day}', None
+
+
+def get_master_stats(workload, client, rng):
+    return 'GET', f'/stats/masters/{workload.master_id(rng)}', None
+
+
+def get_metrics(workload, client, rng):
+    return 'GET', '/metrics', None
+
+
+def create_master(workload, client, rng):
+    return 'POST', '/masters', workload.master_data()
+
+
+def create_masters_bulk(workload, client, rng):
+    return 'POST', '/masters/bulk', [workload.master_data() for _ in range(BULK_SIZE)]
+
+
+def get_free_slots(workload, client, rng):
+    day = workload.day(rng)
+    return 'GET', f'/masters/{workload.master_id(rng)}/free-slots?from={day}&to={day}', None
+
+
+def update_master(workload, client, rng):
+    return 'PUT', f'/masters/{new_master(workload, client)}', workload.master_data()
+
+
+def delete_master(workload, client, rng):
+    return 'DELETE', f'/masters/{new_master(workload, client)}', None
+
+
+def get_appointments(workload, client, rng):
+    return 'GET', '/appointments', None
+
+
+def get_appointments_stream(workload, client, rng):
+    return 'GET', '/appointments?stream=1', None
+
+
+def get_appointments_page(workload, client, rng):
+    sort_by = rng.choice(['date', 'client_name', 'status', 'master'])
+    return 'GET', f'/appointments?sort_by={sort_by}&limit=100', None
+
+
+def get_appointments_with_services(workload, client, rng):
+    return 'GET', '/appointments?limit=100&include=services', None
+
+
+def get_appointments_sparse(workload, client, rng):
+    return 'GET', '/appointments?limit=100&fields=id,date,status', None
+
+
+def get_appointments_day(workload, client, rng):
+    day = workload.day(rng)
+    return 'GET', f'/appointments?from={day}&to={day}', None
+
+
+def export_appointments_day(workload, client, rng):
+    day = workload.day(rng)
+    return 'GET', f"/appointments/export?format={rng.choice(['ndjson', 'csv'])}&from={day}&to={day}", None
+
+
+def get_appointment(workload, client, rng):
+    return 'GET', f'/appointments/{workload.appointment_id(rng)}', None
+
+
+def get_master_appointments(workload, client, rng):
+    return 'GET', f'/appointments/master/{workload.master_id(rng)}', None
+
+
+def create_appointment(workload, client, rng):
+    return 'POST', '/appointments', workload.appointment_data(rng)
+
+
+def create_appointments_bulk(workload, client, rng):
+    return 'POST', '/appointments/bulk', [workload.appointment_data(rng) for _ in range(BULK_SIZE)]
+
+
+def update_appointment(workload, client, rng):
+    appointment = new_appointment(workload, client, rng)
+    return 'PUT', f"/appointments/{appointment['id']}", {
+        'client_name': appointment['client_name'],
+        'client_phone': appointment['client_phone'],
+        'master_id': appointment['master']['id'],
+        'date': workload.new_date(),
+        'status': 'confirmed',
+    }
+
+
+def delete_appointment(workload, client, rng):
+    return 'DELETE', f"/appointments/{new_appointment(workload, client, rng)['id']}", None
+
+
+# сначала чтение, затем запись, чтобы созданные замером строки не влияли на замеры чтения
+ROUTES = [
+    ('GET /masters', get_masters),
+    ('GET /masters/<id>', get_master),
+    ('GET /masters/<id>/free-slots', get_free_slots),
+    ('GET /appointments', get_appointments),
+    ('GET /appointments?stream=1', get_appointments_stream),
+    ('GET /appointments?limit', get_appointments_page),
+    ('GET /appointments?limit&include=services', get_appointments_with_services),
+    ('GET /appointments?limit&fields=id,date,status', get_appointments_sparse),
+    ('GET /appointments?from&to', get_appointments_day),
+    ('GET /appointments/export?from&to', export_appointments_day),
+    ('GET /appointments/<id>', get_appointment),
+    ('GET /appointments/master/<id>', get_master_appointments),
+    ('GET /stats/days?from', get_stats_days),
+    ('GET /stats/masters?from', get_masters_stats),
+    ('GET /stats/masters/<id>', get_master_stats),
+    ('GET /metrics', get_metrics),
+    ('POST /masters', create_master),
+    ('POST /masters/bulk', create_masters_bulk),
+    ('PUT /masters/<id>', update_master),
+    ('DELETE /masters/<id>', delete_master),
+    ('POST /appointments', create_appointment),
+    ('POST /appointments/bulk', create_appointments_bulk),
+    ('PUT /appointments/<id>', update_appointment),
+    ('DELETE /appointments/<id>', delete_appointment),
+]
@@ -0,0 +1,145 @@
+"""
+Запуск сценариев из routes.py против работающего сервера и подсчёт перцентилей.
+"""
+
+import http.client
+import itertools
+import json
+import random
+import threading
+import time
+
+from benchmark.routes import ROUTES, Workload
+
+
+class Client:
+    """
+    HTTP-клиент одного потока нагрузки. Переподключается, если сервер закрыл соединение.
+    """
+    def __init__(self, port: int):
+        self.port = port
+        self.connection = None
+
+    def request(self, method: str, path: str, body=None):
+        """
+        Выполняет запрос и возвращает код ответа и тело.
+        """
+        headers = {}
+        if body is not None:
+            body = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+            try:
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                return response.status, response.read()
+            except (OSError, http.client.HTTPException):
+                self.close()
+                if attempt:
+                    raise
+
+    def prepare(self, method: str, path: str, body=None) -> dict:
+        """
+        Выполняет неизмеряемый подготовительный запрос и возвращает разобранный JSON.
+        """
+        status, data = self.request(method, path, body)
+        if status >= 400:
+            raise RuntimeError(f'{method} {path}: {status} {data[:200]!r}')
+        return json.loads(data)
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def percentile(latencies: list, share: float):
+    """
+    Перцентиль по отсортированному списку задержек в секундах, в миллисекундах.
+    """
+    if not latencies:
+        return None
+    return round(latencies[min(len(latencies) - 1, int(len(latencies) * share))] * 1000, 2)
+
+
+def run_route(port: int, workload: Workload, scenario, clients: int, requests: int, seed: int) -> dict:
+    """
+    Выполняет requests запросов сценария в clients параллельных потоках.
+    :return: Количество запросов, ошибок, пропускная способность и перцентили задержки.
+    """
+    tickets = itertools.count()
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(number):
+        client = Client(port)
+        rng = random.Random(seed + number)
+        local_latencies = []
+        local_errors = 0
+        busy = 0.0
+        try:
+            while next(tickets) < requests:
+                try:
+                    method, path, body = scenario(workload, client, rng)
+                    start = time.perf_counter()
+                    status, _ = client.request(method, path, body)
+                    elapsed = time.perf_counter() - start
+                except (OSError, http.client.HTTPException, RuntimeError):
+                    local_errors += 1
+                    continue
+                busy += elapsed
+                if status >= 400:
+                    local_errors += 1
+                else:
+                    local_latencies.append(elapsed)
+        finally:
+            client.close()
+        with lock:
+            latencies.extend(local_latencies)
+            errors.append((local_errors, busy))
+
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    # подготовительные запросы не измеряются, поэтому пропускная способность считается
+    # по времени, которое клиенты провели в измеряемых запросах
+    busy = sum(thread_busy for _, thread_busy in errors) / clients
+    return {
+        'requests': len(latencies),
+        'errors': sum(count for count, _ in errors),
+        'requests_per_second': round(len(latencies) / busy, 1) if busy else None,
+        'p50_ms': percentile(latencies, 0.50),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+    }
+
+
+def run_benchmark(port: int, sizes: dict, clients: int, requests: int, routes: list = None, seed: int = 0) -> dict:
+    """
+    Прогоняет сценарии всех маршрутов (или только тех, в названии которых есть
+    одна из подстрок routes) против сервера на port.
+    :param sizes: Размеры базы (benchmark.seed.database_sizes).
+    :return: Параметры замера и результаты по маршрутам.
+    """
+    workload = Workload(sizes)
+    results = []
+    for name, scenario in ROUTES:
+        if routes and not any(pattern in name for pattern in routes):
+            continue
+        result = {'route': name}
+        result.update(run_route(port, workload, scenario, clients, requests, seed))
+        results.append(result)
+    return {
+        'masters': sizes['masters'],
+        'appointments': sizes['appointments'],
+        'clients': clients,
+        'requests_per_route': requests,
+        'routes': results,
+    }
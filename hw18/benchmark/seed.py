@@ -0,0 +1,105 @@
+"""
+Заполнение временной базы синтетическими данными заданного размера.
+"""
+
+import sqlite3
+from datetime import datetime, timedelta
+
+from peewee import chunked, fn
+
+import app as barbershop
+from app import DB, Master, Service, Appointment, MasterService, AppointmentService
+
+# SQLite до 3.32 допускает не больше 999 параметров в запросе
+MAX_VARIABLES = 32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999
+
+SEED_START = datetime(2020, 1, 1, 9)
+SEED_STEP = timedelta(minutes=40)
+# записи, которые создаёт сам замер, идут после синтетических, чтобы не пересекаться с ними
+WRITES_START = datetime(2200, 1, 1)
+STATUSES = ['pending', 'confirmed', 'confirmed', 'cancelled']
+
+
+def batch_size(columns: int) -> int:
+    """
+    Количество строк в одном INSERT, при котором не превышается лимит параметров SQLite.
+    """
+    return max(1, MAX_VARIABLES // columns)
+
+
+def seed_database(db_path: str, appointments: int, masters: int = None) -> dict:
+    """
+    Создаёт базу по моделям app.py, добавляет данные create_test_data и синтетические
+    записи. Записи идут с шагом SEED_STEP по кругу между мастерами, поэтому у одного
+    мастера они не пересекаются.
+    :param db_path: Путь к файлу базы.
+    :param appointments: Количество синтетических записей.
+    :param masters: Количество синтетических мастеров (по умолчанию одна тысячная от записей, не меньше 3).
+    :return: Размеры базы (см. database_sizes).
+    """
+    barbershop.app.config['DATABASE_PATH'] = db_path
+    barbershop.configure_database()
+    barbershop.migrate_database()
+    barbershop.RESPONSE_CACHE.invalidate('masters')
+    barbershop.SCHEDULES.invalidate()
+    masters = masters or max(3, appointments // 1000)
+
+    with DB.connection_context():
+        barbershop.create_test_data()
+        service_ids = [service_id for (service_id,) in Service.select(Service.id).tuples()]
+
+        with DB.atomic():
+            first_master = (Master.select(Master.id).order_by(Master.id.desc()).scalar() or 0) + 1
+            master_rows = ((f'Мастер {i}', f'Синтетический {i}', None, f'+7000{i:07d}') for i in range(masters))
+            fields = [Master.first_name, Master.last_name, Master.middle_name, Master.phone]
+            for batch in chunked(master_rows, batch_size(len(fields))):
+                Master.insert_many(batch, fields=fields).execute()
+            master_ids = list(range(first_master, first_master + masters))
+
+            link_rows = ((master_id, service_id) for master_id in master_ids for service_id in service_ids)
+            fields = [MasterService.master, MasterService.service]
+            for batch in chunked(link_rows, batch_size(len(fields))):
+                MasterService.insert_many(batch, fields=fields).execute()
+
+        first_appointment = (Appointment.select(Appointment.id).order_by(Appointment.id.desc()).scalar() or 0) + 1
+        with DB.atomic():
+            appointment_rows = (
+                (f'Клиент {i % 50000}', f'+7900{i % 1000000:07d}', SEED_START + SEED_STEP * i,
+                 master_ids[i % masters], STATUSES[i % len(STATUSES)])
+                for i in range(appointments)
+            )
+            fields = [Appointment.client_name, Appointment.client_phone, Appointment.date, Appointment.master, Appointment.status]
+            for batch in chunked(appointment_rows, batch_size(len(fields))):
+                Appointment.insert_many(batch, fields=fields).execute()
+
+            service_rows = (
+                (first_appointment + i, service_ids[i % len(service_ids)])
+                for i in range(appointments)
+            )
+            fields = [AppointmentService.appointment, AppointmentService.service]
+            for batch in chunked(service_rows, batch_size(len(fields))):
+                AppointmentService.insert_many(batch, fields=fields).execute()
+
+        DB.execute_sql('ANALYZE')
+
+    return database_sizes(db_path)
+
+
+def database_sizes(db_path: str) -> dict:
+    """
+    Возвращает наибольшие id мастеров и записей, количество услуг, дату последней
+    синтетической записи и первую дату, свободную для записей замера.
+    """
+    barbershop.app.config['DATABASE_PATH'] = db_path
+    barbershop.configure_database()
+    latest = Appointment.select(fn.MAX(Appointment.date))
+    with DB.connection_context():
+        last_date = latest.where(Appointment.date < WRITES_START).scalar()
+        last_write = latest.where(Appointment.date >= WRITES_START).scalar()
+        return {
+            'masters': Master.select(fn.MAX(Master.id)).scalar() or 0,
+            'services': Service.select().count(),
+            'appointments': Appointment.select(fn.MAX(Appointment.id)).scalar() or 0,
+            'last_date': last_date or SEED_START,
+            'writes_start': last_write + timedelta(days=1) if last_write else WRITES_START,
+        }
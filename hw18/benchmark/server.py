@@ -0,0 +1,66 @@
+"""
+Запуск API барбершопа в отдельном процессе для замеров.
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# wsgi - многопоточный сервер Werkzeug, как при запуске app.py; asgi - uvicorn из asgi.py
+SERVERS = {
+    'wsgi': "import sys; from app import *; migrate_database(); DB.connect(); create_test_data(); DB.close(); "
+            "app.run(port=int(sys.argv[1]), threaded=True)",
+    'asgi': "import runpy, sys; runpy.run_path('asgi.py', run_name='__main__')",
+}
+
+
+def free_port() -> int:
+    """
+    Возвращает свободный локальный порт.
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode: str, port: int, db_path: str, env: dict = None) -> subprocess.Popen:
+    """
+    Запускает сервер в отдельном процессе и ждёт, пока он начнёт принимать соединения.
+    :param mode: 'wsgi' или 'asgi'.
+    :param port: Порт сервера.
+    :param db_path: Путь к базе.
+    :param env: Дополнительные переменные окружения (например, настройки BARBERSHOP_*).
+    :return: Процесс сервера.
+    """
+    process_env = dict(os.environ, BARBERSHOP_DATABASE_PATH=db_path, **(env or {}))
+    process = subprocess.Popen(
+        [sys.executable, '-c', SERVERS[mode], str(port)],
+        cwd=HERE, env=process_env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            break
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f'Сервер {mode} не запустился')
+
+
+def stop_server(process: subprocess.Popen) -> None:
+    """
+    Останавливает процесс сервера.
+    """
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
@@ -0,0 +1,147 @@
+"""
+Замер скорости записи через POST/PUT /appointments на временной базе данных,
+созданной migrate_database (со сводкой MasterDayStats, счётчиком расписаний и их триггерами).
+Для сравнения тот же сценарий выполняется через прежний путь записи (baseline):
+python hw18/write_benchmark.py [количество запросов]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from flask import request
+
+import app as barbershop
+from app import DB, Master, Appointment, json_response, appointment_to_dict, validate_appointment_data
+
+BASELINE_PREFIX = '/baseline'
+
+
+def baseline_validate(data):
+    """
+    Прежняя проверка данных записи: существование мастера проверяется отдельным запросом.
+    """
+    errors = validate_appointment_data(data)
+    if not errors:
+        try:
+            Master.get(Master.id == data['master_id'])
+        except Master.DoesNotExist:
+            errors.append("Мастер с указанным ID не найден")
+    return errors
+
+
+def baseline_create_appointment():
+    """
+    Прежний POST /appointments: мастер читается при проверке и ещё раз перед вставкой,
+    после вставки запись перечитывается вместе с мастером (четыре запроса, каждый в своей транзакции).
+    """
+    data = request.json
+    errors = baseline_validate(data)
+    if errors:
+        return json_response({'errors': errors}, 400)
+    master = Master.get(Master.id == data['master_id'])
+    appointment_data = {
+        'client_name': data['client_name'],
+        'client_phone': data['client_phone'],
+        'master': master,
+        'status': data.get('status', 'pending'),
+    }
+    if data.get('date'):
+        appointment_data['date'] = datetime.strptime(data['date'], '%Y-%m-%d %H:%M:%S')
+    appointment = Appointment.create(**appointment_data)
+    appointment_with_master = Appointment.select().join(Master).where(Appointment.id == appointment.id).get()
+    return json_response({'appointment': appointment_to_dict(appointment_with_master)}, 201)
+
+
+def baseline_update_appointment(appointment_id):
+    """
+    Прежний PUT /appointments/<id>: чтение записи, двойное чтение мастера, UPDATE и повторное чтение записи.
+    """
+    appointment = Appointment.get(Appointment.id == appointment_id)
+    data = request.json
+    errors = baseline_validate(data)
+    if errors:
+        return json_response({'errors': errors}, 400)
+    master = Master.get(Master.id == data['master_id'])
+    appointment.client_name = data['client_name']
+    appointment.client_phone = data['client_phone']
+    appointment.master = master
+    appointment.status = data.get('status', appointment.status)
+    if data.get('date'):
+        appointment.date = datetime.strptime(data['date'], '%Y-%m-%d %H:%M:%S')
+    appointment.save()
+    appointment_with_master = Appointment.select().join(Master).where(Appointment.id == appointment_id).get()
+    return json_response({'appointment': appointment_to_dict(appointment_with_master)})
+
+
+barbershop.app.add_url_rule(f'{BASELINE_PREFIX}/appointments', 'baseline_create_appointment',
+                            baseline_create_appointment, methods=['POST'])
+barbershop.app.add_url_rule(f'{BASELINE_PREFIX}/appointments/<int:appointment_id>', 'baseline_update_appointment',
+                            baseline_update_appointment, methods=['PUT'])
+
+
+@contextmanager
+def temporary_database():
+    """
+    Подключает приложение к новой временной базе, созданной migrate_database, с тестовыми данными.
+    """
+    previous_path = barbershop.app.config['DATABASE_PATH']
+    with tempfile.TemporaryDirectory() as temp_dir:
+        barbershop.app.config['DATABASE_PATH'] = os.path.join(temp_dir, 'barbershop.db')
+        barbershop.configure_database()
+        try:
+            barbershop.migrate_database()
+            barbershop.SCHEDULES.invalidate()
+            barbershop.create_test_data()
+            yield
+        finally:
+            barbershop.app.config['DATABASE_PATH'] = previous_path
+            barbershop.configure_database()
+
+
+def run_benchmark(count: int, prefix: str = '') -> dict:
+    """
+    Выполняет count запросов POST /appointments и count запросов PUT /appointments/<id>.
+    :param count: Количество запросов каждого вида.
+    :param prefix: Префикс маршрутов: '' - текущий путь записи, BASELINE_PREFIX - прежний.
+    :return: Словарь с количеством записей в секунду для POST и PUT.
+    """
+    results = {}
+    with temporary_database():
+        client = barbershop.app.test_client()
+        start = time.perf_counter()
+        ids = []
+        for i in range(count):
+            response = client.post(f'{prefix}/appointments', json={
+                'client_name': f'Клиент {i}',
+                'client_phone': f'+7900{i:07d}',
+                'master_id': 1 + i % 3,
+                'date': (datetime(2025, 1, 1) + timedelta(hours=i)).strftime('%Y-%m-%d %H:%M:%S'),
+            })
+            assert response.status_code == 201, response.data
+            ids.append(response.json['appointment']['id'])
+        results['post_per_second'] = round(count / (time.perf_counter() - start), 1)
+
+        start = time.perf_counter()
+        for i, appointment_id in enumerate(ids):
+            response = client.put(f'{prefix}/appointments/{appointment_id}', json={
+                'client_name': f'Клиент {i}',
+                'client_phone': f'+7901{i:07d}',
+                'master_id': 1 + (i + 1) % 3,
+                'status': 'confirmed',
+            })
+            assert response.status_code == 200, response.data
+        results['put_per_second'] = round(count / (time.perf_counter() - start), 1)
+    return results
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    baseline = run_benchmark(count, BASELINE_PREFIX)
+    current = run_benchmark(count)
+    print(f"{'':24}{'baseline':>12}{'текущий':>12}")
+    print(f"{'POST /appointments':24}{baseline['post_per_second']:>12}{current['post_per_second']:>12} записей/с")
+    print(f"{'PUT /appointments/<id>':24}{baseline['put_per_second']:>12}{current['put_per_second']:>12} записей/с")